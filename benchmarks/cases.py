@@ -0,0 +1,203 @@
+"""Benchmark cases for the rho and trig kernels and the SLSC pipeline
+
+Every case is a function registered with @benchmark, naming the sweep parameters it depends on. Given one
+set of parameters it builds its inputs and returns the callable to time along with the work done per call,
+from which the runner reports throughput.
+"""
+import ctypes as ct
+
+import numpy as np
+
+from pyrho.rho import lagNRho, RofM, RofM2D, demodIQ, interptable, interpgather, tabledelays
+from pyrho.trig import geteletaus, getpwtaus, getaperture, c_norm_grid
+from pyrho.trig.pytrig import __trig__
+from pyrho.cbuf import fptr, iptr, estrides
+from pyrho.processors import SLSCProc, PWTX, FullRX
+
+# nominal acquisition, each sweep varies one parameter away from it
+C = 1540
+FC = 5E6
+FS = 4*FC
+NOMINAL = dict(nele=128, nang=15, npts=10**5, kwl=5)
+
+# parameter sweeps: production sizes, and a small set for a quick check on a laptop
+SWEEPS = {
+    'full': dict(nele=[64, 128, 256], nang=[1, 15, 75], npts=[10**4, 10**5, 10**6], kwl=[1, 5, 20]),
+    'quick': dict(nele=[64, 128], nang=[1, 15], npts=[10**4], kwl=[1, 5]),
+}
+NOMINALS = {
+    'full': NOMINAL,
+    'quick': dict(nele=64, nang=3, npts=10**4, kwl=5),
+}
+
+BENCHMARKS = {}
+
+def benchmark(*uses):
+    """register a case under its function name, minus the bench_ prefix, with the parameters it depends on"""
+    def register(func):
+        BENCHMARKS[func.__name__[len('bench_'):]] = (func, uses)
+        return func
+    return register
+
+def sweep(size:str='quick'):
+    """the nominal parameters followed by every one-at-a-time variation of them"""
+    nominal = NOMINALS[size]
+    yield dict(nominal)
+    for name, values in SWEEPS[size].items():
+        for value in values:
+            if value == nominal[name]: continue
+            yield dict(nominal, **{name: value})
+
+def geometry(nele:int, nang:int, npts:int):
+    """linear array at half-wavelength pitch, a plane-wave sweep over +-18 degrees, and a rectilinear x-z grid
+    of about npts points sampled at half the pitch across the aperture and spanning 5 to 45 mm deep"""
+    pitch = C/FC/2
+    eles = np.zeros((nele, 3), dtype=np.float32)
+    eles[:,0] = pitch*(np.arange(nele) - (nele-1)/2)
+
+    alphas = np.deg2rad(np.linspace(-18, 18, nang)) if nang > 1 else np.zeros(1)
+    xrefs = np.array([eles[0] if alpha >= 0 else eles[-1] for alpha in alphas])
+    trefs = np.zeros(nang)
+
+    nx = 2*nele - 1
+    nz = max(1, npts//nx)
+    X, Z = np.meshgrid(pitch/2*(np.arange(nx) - (nx-1)/2), np.linspace(5E-3, 45E-3, nz), indexing='ij')
+    points = np.zeros((nx*nz, 3), dtype=np.float32)
+    points[:,0] = X.ravel()
+    points[:,2] = Z.ravel()
+    return eles, alphas, xrefs, trefs, points
+
+def rfdata(nang:int, nele:int, seed:int=0):
+    """Ntx by Nrx by Nsamp float32 noise covering the round trip to the deepest point"""
+    nsamp = int(2*50E-3/C*FS)
+    return np.random.default_rng(seed).standard_normal((nang, nele, nsamp), dtype=np.float32)
+
+@benchmark('nele')
+def bench_lagNRho(p):
+    data = rfdata(1, p['nele'])[0]
+    return lambda: lagNRho(data, lag=1, axis=0), dict(channel_samples=data.size)
+
+@benchmark('nele')
+def bench_lagNRho_int16(p):
+    data = (1000*rfdata(1, p['nele'])[0]).astype(np.int16)
+    return lambda: lagNRho(data, lag=1, axis=0), dict(channel_samples=data.size)
+
+@benchmark('nele')
+def bench_RofM_direct(p):
+    data = rfdata(1, p['nele'])[0]
+    return lambda: RofM(data, axis=0, method='direct'), dict(channel_samples=data.size)
+
+@benchmark('nele')
+def bench_RofM_fft(p):
+    data = rfdata(1, p['nele'])[0]
+    return lambda: RofM(data, axis=0, method='fft'), dict(channel_samples=data.size)
+
+@benchmark()
+def bench_RofM2D_radial(p):
+    # radial lag bins of a 32 by 32 matrix array, about half a million pairs per sample
+    data = rfdata(1, 32*32)[0]
+    return lambda: RofM2D(data, (32, 32), axis=0, radial=True), dict(channel_samples=data.size)
+
+@benchmark('nele', 'npts')
+def bench_geteletaus(p):
+    eles, _, _, _, points = geometry(p['nele'], 1, p['npts'])
+    out = np.empty((p['nele'], points.shape[0]), dtype=np.float32)
+    return lambda: geteletaus(eles, points, C, out=out), dict(pixels=points.shape[0], delays=out.size)
+
+@benchmark('nang', 'npts')
+def bench_getpwtaus(p):
+    _, alphas, xrefs, trefs, points = geometry(2, p['nang'], p['npts'])
+    out = np.empty((p['nang'], points.shape[0]), dtype=np.float32)
+    return lambda: getpwtaus(xrefs, points, trefs, alphas, C, out=out), dict(pixels=points.shape[0], delays=out.size)
+
+@benchmark('npts')
+def bench_genmask3D(p):
+    _, _, _, _, points = geometry(2, 1, p['npts'])
+    nap = np.array([1, 0, 0], dtype=np.float32)
+    focus = np.array([0, 0, 20E-3], dtype=np.float32)
+    ref = np.zeros(3, dtype=np.float32)
+    mask = np.empty(points.shape[0], dtype=np.int32)
+    sp, sd = estrides(points)
+    def run():
+        __trig__.genmask3D(points.shape[0], ct.c_float(1.5), 1, fptr(nap), fptr(focus), fptr(ref), fptr(points), sp, sd, iptr(mask))
+    return run, dict(pixels=points.shape[0])
+
+@benchmark('nele', 'npts')
+def bench_getaperture(p):
+    eles, _, _, _, points = geometry(p['nele'], 1, p['npts'])
+    return lambda: getaperture(eles, points, 1.5), dict(pixels=points.shape[0])
+
+@benchmark('nele', 'npts')
+def bench_FullRX_c_gentabs(p):
+    eles, _, _, _, points = geometry(p['nele'], 1, p['npts'])
+    rx = FullRX(eles, C, grid=False)
+    return lambda: rx.c_gentabs(points, points.shape[0]), dict(pixels=points.shape[0], delays=p['nele']*points.shape[0])
+
+@benchmark('nele', 'npts')
+def bench_c_norm_grid(p):
+    eles, _, _, _, points = geometry(p['nele'], 1, p['npts'])
+    return lambda: c_norm_grid(eles, points, C), dict(pixels=points.shape[0], delays=p['nele']*points.shape[0])
+
+@benchmark('nang', 'npts')
+def bench_PWTX_c_gentabs(p):
+    _, alphas, xrefs, trefs, points = geometry(2, p['nang'], p['npts'])
+    tx = PWTX(alphas, xrefs, trefs, c=C)
+    return lambda: tx.c_gentabs(points, points.shape[0]), dict(pixels=points.shape[0], delays=p['nang']*points.shape[0])
+
+@benchmark('nele', 'nang')
+def bench_interpgather(p):
+    # the table grows with Ntx*Nrx*P, so it is built for a fixed 10^4 points whatever the sweep
+    eles, alphas, xrefs, trefs, points = geometry(p['nele'], p['nang'], 10**4)
+    tx = tabledelays(getpwtaus(xrefs, points, trefs, alphas, C))
+    rx = tabledelays(geteletaus(eles, points, C))
+    data = rfdata(p['nang'], p['nele'])
+    table = interptable(tx, rx, data.shape[2], FS, 0, kind='cubic', dtype=np.float16)
+    out = np.empty((p['nele'], points.shape[0]), dtype=np.float32)
+    return lambda: interpgather(data, table, compound=True, out=out), dict(pixels=points.shape[0], delays=table.index.size)
+
+def _slsc(p, tabmode:str, dtype=np.float32, grid:bool=False):
+    # the half-pitch grid of geometry() qualifies for grid storage, which is only used where asked for
+    eles, alphas, xrefs, trefs, points = geometry(p['nele'], p['nang'], p['npts'])
+    nkernel = max(1, int(round(p['kwl']*FS/FC)))
+    proc = SLSCProc(C, points, PWTX(alphas, xrefs, trefs, c=C), FullRX(eles, C, grid=grid), lags=10, nkernel=nkernel, tabmode=tabmode)
+    data = (1000*rfdata(p['nang'], p['nele'])).astype(dtype)
+    out = np.empty(proc.Np, dtype=np.float32)
+    work = dict(pixels=proc.Np, channel_samples=proc.Np*p['nang']*p['nele']*nkernel)
+    return lambda: proc(data, FS, 0, out=out), work
+
+@benchmark('nele', 'nang', 'npts', 'kwl')
+def bench_SLSCProc_table(p):
+    return _slsc(p, 'table')
+
+@benchmark('nele', 'nang', 'npts', 'kwl')
+def bench_SLSCProc_grid(p):
+    return _slsc(p, 'table', grid=True)
+
+@benchmark('nele', 'nang', 'npts', 'kwl')
+def bench_SLSCProc_otf(p):
+    return _slsc(p, 'otf')
+
+@benchmark('nele', 'nang', 'npts', 'kwl')
+def bench_SLSCProc_int16(p):
+    return _slsc(p, 'table', np.int16)
+
+@benchmark('nele', 'nang', 'npts')
+def bench_SLSCProc_sweep(p):
+    # a 21 value sweep of the speed of sound on lag-one coherence
+    eles, alphas, xrefs, trefs, points = geometry(p['nele'], p['nang'], p['npts'])
+    proc = SLSCProc(C, points, PWTX(alphas, xrefs, trefs, c=C), FullRX(eles, C, grid=False), lags=[1])
+    data = rfdata(p['nang'], p['nele'])
+    speeds = np.linspace(1440, 1640, 21)
+    out = np.empty((speeds.size, proc.Np), dtype=np.float32)
+    work = dict(pixels=speeds.size*proc.Np, channel_samples=speeds.size*proc.Np*p['nang']*p['nele']*5)
+    return lambda: proc.sweep(data, FS, speeds, 0, out=out), work
+
+@benchmark('nele', 'nang', 'npts', 'kwl')
+def bench_SLSCProc_iq(p):
+    eles, alphas, xrefs, trefs, points = geometry(p['nele'], p['nang'], p['npts'])
+    nkernel = max(1, int(round(p['kwl']*FS/FC/4)))
+    proc = SLSCProc(C, points, PWTX(alphas, xrefs, trefs, c=C), FullRX(eles, C, grid=False), lags=10, nkernel=nkernel, tabmode='table')
+    data = demodIQ(rfdata(p['nang'], p['nele']), FS, FC, decim=4)
+    out = np.empty(proc.Np, dtype=np.float32)
+    work = dict(pixels=proc.Np, channel_samples=proc.Np*p['nang']*p['nele']*nkernel)
+    return lambda: proc(data, FS/4, 0, out=out, fc=FC), work
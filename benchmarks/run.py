@@ -0,0 +1,128 @@
+"""Offline benchmark runner for pyrho
+
+Runs each case in a fresh process so its peak memory is its own, reports time per call, throughput, and
+peak resident memory, and optionally saves the results as a baseline or compares them against one.
+
+Usage:
+----
+python benchmarks/run.py                                 # quick sweep
+python benchmarks/run.py --size full --save base.json    # production sizes, saved as a baseline
+python benchmarks/run.py --size full --compare base.json # fail on any case slower than the baseline by >10%
+"""
+import argparse
+import json
+import multiprocessing as mp
+import platform
+import re
+import sys
+import time
+
+import numpy as np
+
+def _peakrss():
+    """peak resident memory of this process in bytes, or None where the resource module is unavailable"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else 1024*peak
+
+def _measure(name:str, params:dict, mintime:float, threads:int|None):
+    """build one case, then time calls until mintime has passed, in the current process"""
+    import pyrho
+    from cases import BENCHMARKS
+    if threads is not None: pyrho.set_num_threads(threads)
+
+    func, _ = BENCHMARKS[name]
+    run, work = func(params)
+    run()
+
+    times = []
+    start = time.perf_counter()
+    while (len(times) < 3) or ((time.perf_counter() - start < mintime) and (len(times) < 1000)):
+        tic = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - tic)
+    return dict(name=name, params=params, best=min(times), median=float(np.median(times)), ncalls=len(times),
+                work=work, peakrss=_peakrss())
+
+def _child(conn, *args):
+    try:
+        conn.send(_measure(*args))
+    except Exception as err:
+        conn.send(dict(error=f"{type(err).__name__}: {err}"))
+    conn.close()
+
+def measure(name:str, params:dict, mintime:float=1, threads:int|None=None):
+    """run one case in a fresh process and return its timings"""
+    ctx = mp.get_context('spawn')
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_child, args=(child, name, params, mintime, threads))
+    proc.start()
+    child.close()
+    result = parent.recv()
+    proc.join()
+    if 'error' in result: raise RuntimeError(f"{name} failed: {result['error']}")
+    return result
+
+def key(name:str, params:dict, uses):
+    """identifier of a case and the parameters it depends on, e.g. lagNRho[nele=128]"""
+    return f"{name}[{','.join(f'{u}={params[u]}' for u in uses)}]"
+
+def cases(size:str, pattern:str|None):
+    """every distinct (key, name, params) of the sweep, skipping repeats of parameters a case ignores"""
+    from cases import BENCHMARKS, sweep
+    seen = set()
+    for name, (_, uses) in BENCHMARKS.items():
+        if (pattern is not None) and not re.search(pattern, name): continue
+        for params in sweep(size):
+            k = key(name, params, uses)
+            if k in seen: continue
+            seen.add(k)
+            yield k, name, params
+
+def report(k:str, result:dict, base:dict|None):
+    """one line per case: time per call, throughput of each kind of work, peak memory, and the ratio to the baseline"""
+    rates = '  '.join(f"{v/result['best']:.3e} {u.replace('_', '-')}/s" for u, v in result['work'].items())
+    peak = '' if result['peakrss'] is None else f"  peak {result['peakrss']/2**20:.0f} MiB"
+    line = f"{k:<60s} {1E3*result['best']:10.3f} ms  {rates}{peak}"
+    if base is not None: line += f"  x{result['best']/base['best']:.2f} vs baseline"
+    print(line, flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pyrho kernels and SLSC pipeline")
+    parser.add_argument('--size', choices=('quick', 'full'), default='quick', help="parameter sweep to run")
+    parser.add_argument('--filter', default=None, help="regular expression selecting the cases to run by name")
+    parser.add_argument('--mintime', type=float, default=1, help="seconds to spend timing each case")
+    parser.add_argument('--threads', type=int, default=None, help="OpenMP threads, defaults to OMP_NUM_THREADS")
+    parser.add_argument('--save', default=None, help="write the results to this JSON file")
+    parser.add_argument('--compare', default=None, help="compare against the results saved in this JSON file")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="relative slowdown tolerated before a case counts as a regression")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare is not None:
+        with open(args.compare) as f: baseline = json.load(f)['results']
+
+    results = {}
+    regressions = []
+    for k, name, params in cases(args.size, args.filter):
+        results[k] = measure(name, params, args.mintime, args.threads)
+        base = baseline.get(k)
+        report(k, results[k], base)
+        if (base is not None) and (results[k]['best'] > (1 + args.tolerance)*base['best']): regressions.append(k)
+
+    if args.save is not None:
+        meta = dict(machine=platform.machine(), processor=platform.processor(), python=platform.python_version(),
+                    numpy=np.__version__, threads=args.threads, size=args.size, time=time.strftime('%Y-%m-%dT%H:%M:%S'))
+        with open(args.save, 'w') as f: json.dump(dict(meta=meta, results=results), f, indent=1)
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {100*args.tolerance:.0f}%:")
+        for k in regressions: print(f"  {k}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -43,6 +43,17 @@ trefs = np.zeros(nang)
 tx = PWTX(alphas, xrefs, trefs, c=c, dtype=c_float)
 rx = FullRX(eles, c=c, dtype=c_float)
 
-loc = SLSCProc(c, field, tx, rx, lags=1)
+# one wavelength long axial kernel
+loc = SLSCProc(c, field, tx, rx, lags=10, nkernel=int(fs/fc))
 
-loc(np.zeros((5,5)))
\ No newline at end of file
+# placeholder speckle RF, Ntx by Nrx by Nsamp
+nsamp = int(2*40E-3/c*fs)
+rng = np.random.default_rng(0)
+data = rng.standard_normal((nang, nele, nsamp)).astype(np.float32)
+
+slsc = loc(data, fs, tstart)
+
+plt.figure()
+plt.imshow(slsc.reshape(Xfield.squeeze().shape).T, extent=[1E3*xfield[0], 1E3*xfield[-1], 1E3*zfield[-1], 1E3*zfield[0]])
+plt.colorbar()
+plt.show()
\ No newline at end of file
@@ -1,7 +1,5 @@
 from pyrho.trig import geteletaus
 import numpy as np
-import cinpy as cnp
-import ctypes as ct
 import matplotlib.pyplot as plt
 
 
@@ -23,9 +21,8 @@ Xfield, Yfield, Zfield = np.meshgrid(xfield, yfield, zfield, indexing='ij')
 field = np.array([Xfield.flatten(), Yfield.flatten(), Zfield.flatten()]).T
 print(field.shape)
 taus = geteletaus(eles, field)
-print(len(taus))
-print(taus[0])
-tau0 = cnp.copy2py(taus[nele//2], ct.c_int(field.shape[0]))
+print(taus.shape)
+tau0 = taus[nele//2]
 print(tau0.shape)
 
 plt.figure()
@@ -1,3 +0,0 @@
-import cinpy as cnp
-import numpy as np
-
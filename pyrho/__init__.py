@@ -1,2 +1,5 @@
 from pyrho.rho import *
-from pyrho.trig import *
\ No newline at end of file
+from pyrho.trig import *
+from pyrho.parallel import set_num_threads, get_num_threads
+from pyrho.backend import set_backend, get_backend, use_backend, available_backends, register_backend
+from pyrho.instrument import profile, stats, reset_stats, enable_stats, stats_enabled, set_stats_hook
\ No newline at end of file
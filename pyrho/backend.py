@@ -0,0 +1,194 @@
+"""Kernel backends: the compiled C libraries, loaded on first use, and a vectorized pure-NumPy fallback
+
+Every kernel wrapper in pyrho.rho and pyrho.trig dispatches to the active backend, and every backend takes the
+same arguments and returns the same arrays. 'c' runs the OpenMP kernels, 'numpy' runs the same math with NumPy
+on any platform, e.g. where the C libraries were not built, and 'auto' (default) picks 'c' if its libraries load,
+otherwise 'numpy'. Importing pyrho loads neither library. The starting backend can be set with the PYRHO_BACKEND
+environment variable, and further backends added with register_backend. set_backend selects the backend of every
+thread, while use_backend overrides it for the calling thread only, so concurrent calls can use different backends.
+
+Usage:
+----
+pyrho.set_backend('numpy')
+with pyrho.use_backend('c'):
+    img = proc(data, fs)
+"""
+import ctypes as ct
+import functools
+import importlib
+import os
+import platform
+import threading
+from contextlib import contextmanager
+from glob import glob
+
+class SharedLibrary():
+    """a compiled library next to its wrapper module, loaded with ctypes.CDLL on first use
+
+    Attributes of the library, i.e. its functions, are looked up on the loaded ctypes.CDLL, so the first kernel
+    call loads it and declares its signatures.
+
+    Parameters:
+    ----
+    dirpath: the directory the library was built into
+    declare: callable setting the argtypes and restypes of the functions of a freshly loaded ctypes.CDLL
+    """
+    def __init__(self, dirpath:str, declare):
+        self._dirpath = dirpath
+        self._declare = declare
+        self._lib = None
+        self._lock = threading.Lock()
+
+    def path(self):
+        """the path of the compiled library, None if it was not built"""
+        pattern = {'Windows': '*.dll', 'Linux': '*.so'}.get(platform.system(), '*.dylib')
+        res = glob(os.path.abspath(os.path.join(self._dirpath, pattern)))
+        return res[0] if len(res) > 0 else None
+
+    def available(self):
+        """whether the compiled library exists, without loading it"""
+        return self._lib is not None or self.path() is not None
+
+    @property
+    def loaded(self):
+        """whether the library has been loaded"""
+        return self._lib is not None
+
+    def load(self):
+        """load the library and declare its signatures, once"""
+        if self._lib is not None: return self._lib
+        with self._lock:
+            if self._lib is None:
+                name = self.path()
+                if name is None:
+                    raise ImportError(f"No compiled pyrho library in {self._dirpath}, build pyrho or use the 'numpy' backend")
+                lib = ct.CDLL(name)
+                self._declare(lib)
+                self._lib = lib
+        return self._lib
+
+    def __getattr__(self, name:str):
+        if name.startswith('_'): raise AttributeError(name)
+        return getattr(self.load(), name)
+
+# C implementation of every kernel wrapper, filled in by the kernel decorator as the wrapper modules are imported
+_native = {}
+
+def _loadc():
+    from pyrho.rho.pyrho import __rho__
+    from pyrho.trig.pytrig import __trig__
+    __rho__.load()
+    __trig__.load()
+    return _native
+
+def _availablec():
+    from pyrho.rho.pyrho import __rho__
+    from pyrho.trig.pytrig import __trig__
+    return __rho__.available() and __trig__.available()
+
+def _loadnumpy():
+    return importlib.import_module('pyrho.npbackend').KERNELS
+
+# registered backends, name: (loader, available)
+_backends = {
+    'c': (_loadc, _availablec),
+    'numpy': (_loadnumpy, lambda: True),
+}
+
+_lock = threading.Lock()
+_selected = os.environ.get('PYRHO_BACKEND', 'auto')
+_local = threading.local()
+_loaded = {}
+_auto = None
+
+def _checkname(name:str, source:str='backend'):
+    """raise a ValueError listing the backends if name is neither 'auto' nor a registered backend"""
+    if (name != 'auto') and (name not in _backends): raise ValueError(f"{source} must be 'auto' or one of {list(_backends)}, not {name!r}")
+
+def register_backend(name:str, loader, available=None):
+    """add a backend, or replace one, under name
+
+    Parameters:
+    ----
+    name: the name to select the backend by
+    loader: callable returning a dict that maps kernel names, e.g. 'lagNRho' or 'c_norm_batch', to functions with
+        the signatures of the pyrho wrappers of the same name. Called once, when the backend is first used
+    available: optional callable returning whether the backend can be loaded, without loading it
+    """
+    global _auto
+    if name == 'auto': raise ValueError("'auto' is reserved")
+    if not callable(loader): raise TypeError("loader must be callable")
+    with _lock:
+        _backends[name] = (loader, (lambda: True) if available is None else available)
+        _loaded.pop(name, None)
+        _auto = None
+
+def available_backends():
+    """names of the backends that can be loaded here"""
+    return [name for name, (loader, available) in _backends.items() if available()]
+
+def set_backend(name:str='auto'):
+    """select the backend every kernel call dispatches to, in every thread without a use_backend override
+
+    Parameters:
+    ----
+    name: 'c', 'numpy', any registered backend, or 'auto' (default) for 'c' if its libraries load, otherwise 'numpy'
+    """
+    global _selected
+    _checkname(name)
+    with _lock:
+        _selected = name
+
+def get_backend():
+    """the name of the backend kernel calls of this thread dispatch to, resolving 'auto' and loading the backend if needed"""
+    return _resolve()[0]
+
+@contextmanager
+def use_backend(name:str):
+    """select a backend for the kernel calls of this thread within a with block, other threads are unaffected"""
+    _checkname(name)
+    previous = getattr(_local, 'name', None)
+    _local.name = name
+    try:
+        yield
+    finally:
+        _local.name = previous
+
+def _load(name:str):
+    """the kernels of a backend, loaded once"""
+    kernels = _loaded.get(name)
+    if kernels is not None: return kernels
+    with _lock:
+        if name not in _loaded: _loaded[name] = _backends[name][0]()
+        return _loaded[name]
+
+def _resolve():
+    """the name and kernels of the backend selected for this thread, loaded once per backend"""
+    global _auto
+    name = getattr(_local, 'name', None) or _selected
+    if name != 'auto':
+        kernels = _loaded.get(name)
+        if kernels is not None: return name, kernels
+        _checkname(name, 'PYRHO_BACKEND')
+        return name, _load(name)
+
+    if _auto is None:
+        try:
+            _auto = ('c', _load('c'))
+        except (OSError, ImportError):
+            _auto = ('numpy', _load('numpy'))
+    return _auto
+
+def kernel(name:str):
+    """decorator registering a wrapper as the C implementation of kernel name, calls go to the active backend"""
+    def register(func):
+        _native[name] = func
+
+        @functools.wraps(func)
+        def dispatch(*args, **kwargs):
+            backend, kernels = _resolve()
+            impl = kernels.get(name)
+            if impl is None: raise NotImplementedError(f"The {backend} backend does not implement {name}")
+            return impl(*args, **kwargs)
+        return dispatch
+    return register
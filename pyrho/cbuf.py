@@ -0,0 +1,112 @@
+"""Helpers to hand NumPy buffers to the C kernels without copying"""
+import ctypes as ct
+import numpy as np
+from pyrho.instrument import count
+
+def asfloat32(arr):
+    """view an array as float32, only copying if it is not already float32 with float-aligned strides
+    
+    Parameters:
+    ----
+    arr: array-like input
+
+    Returns:
+    ----
+    arr: float32 ndarray sharing memory with the input whenever possible
+    """
+    arr = np.asarray(arr)
+    if arr.dtype != np.float32:
+        arr = arr.astype(np.float32)
+        count(copied=arr.nbytes)
+    if any(stride % arr.itemsize for stride in arr.strides):
+        arr = np.ascontiguousarray(arr)
+        count(copied=arr.nbytes)
+    return arr
+
+def ascomplex64(arr):
+    """view complex IQ data as complex64, only copying if it is not already complex64 with sample-aligned strides
+
+    The kernels read complex64 data as interleaved (real, imaginary) float32 pairs.
+
+    Parameters:
+    ----
+    arr: array-like input
+
+    Returns:
+    ----
+    arr: complex64 ndarray sharing memory with the input whenever possible
+    """
+    arr = np.asarray(arr)
+    if arr.dtype != np.complex64:
+        arr = arr.astype(np.complex64)
+        count(copied=arr.nbytes)
+    if any(stride % arr.itemsize for stride in arr.strides):
+        arr = np.ascontiguousarray(arr)
+        count(copied=arr.nbytes)
+    return arr
+
+# sample formats the kernels widen to float32 as they read, matching the RF_* codes in rho.h
+RF_FORMATS = {np.dtype(np.float32): 0, np.dtype(np.int16): 1, np.dtype(np.float16): 2}
+
+def asrf(arr):
+    """view raw channel data in a sample format the kernels read natively, only copying other dtypes to float32
+
+    int16 and float16 data are passed to the kernels as is and widened inside them, so they are never converted
+    as a whole. The coherence is invariant to the scale of the data, so no calibration is applied.
+
+    Parameters:
+    ----
+    arr: array-like input
+
+    Returns:
+    ----
+    arr: float32, int16, or float16 ndarray sharing memory with the input whenever possible
+    fmt: the RF_* code of the sample format of arr
+    """
+    arr = np.asarray(arr)
+    if arr.dtype not in RF_FORMATS: return asfloat32(arr), RF_FORMATS[np.dtype(np.float32)]
+    if any(stride % arr.itemsize for stride in arr.strides):
+        arr = np.ascontiguousarray(arr)
+        count(copied=arr.nbytes)
+    return arr, RF_FORMATS[arr.dtype]
+
+def vptr(arr):
+    """ctypes void pointer to the first element of an array of any dtype"""
+    return ct.c_void_p(arr.ctypes.data)
+
+def fptr(arr):
+    """ctypes float pointer to the first element of a float32 array, or the first real part of a complex64 array"""
+    return arr.ctypes.data_as(ct.POINTER(ct.c_float))
+
+def iptr(arr):
+    """ctypes int pointer to the first element of an int32 array"""
+    return arr.ctypes.data_as(ct.POINTER(ct.c_int))
+
+def estrides(arr):
+    """strides of an array in elements rather than bytes, as ctypes ssize_t"""
+    return tuple(ct.c_ssize_t(stride // arr.itemsize) for stride in arr.strides)
+
+def outbuf(out, shape, dtype=np.float32):
+    """validate a caller-owned output buffer, or allocate one if out is None
+    
+    Parameters:
+    ----
+    out: None or a C-contiguous, writeable array of the given shape and dtype
+    shape: the required shape
+    dtype: the required dtype
+
+    Returns:
+    ----
+    out: the array the kernel will write into
+    """
+    shape = tuple(int(s) for s in np.atleast_1d(shape))
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+        count(allocated=out.nbytes)
+        return out
+    if not isinstance(out, np.ndarray): raise TypeError("out must be a numpy array")
+    if out.shape != shape: raise ValueError(f"out must have shape {shape}")
+    if out.dtype != dtype: raise ValueError(f"out must have dtype {np.dtype(dtype).name}")
+    if not out.flags['C_CONTIGUOUS']: raise ValueError("out must be C-contiguous")
+    if not out.flags['WRITEABLE']: raise ValueError("out must be writeable")
+    return out
@@ -0,0 +1,164 @@
+"""Opt-in instrumentation of wall time, calls, and bytes copied or allocated per stage
+
+Stages are the Python entry points (SLSCProc setup and calls, the kernel wrappers, the table builders) and the
+C kernels of the rho library, whose counters are filled from the C side. The kernel stages are named 'kernel.*';
+the phases of the fused kernel ('kernel.slscFused.delays', '.interp', '.stats' and '.lags') hold thread time
+summed over threads. Kernel stages are only recorded by the C backend. Nothing is measured until instrumentation
+is enabled, and the counters then cost a clock read per stage, or per point and phase inside the fused kernel.
+
+Usage:
+----
+with pyrho.profile() as stats:
+    img = proc(data, fs)
+print(stats['SLSCProc.call']['seconds'], stats['kernel.slscFused.interp']['seconds'])
+"""
+import ctypes as ct
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# names of the counters of the rho library, in the order of its RHOSTAT_* stages
+KERNEL_STAGES = ('kernel.lagNRho', 'kernel.multiLagRho', 'kernel.slscPoints', 'kernel.slscSliding', 'kernel.slscFused',
+                 'kernel.slscFused.delays', 'kernel.slscFused.interp', 'kernel.slscFused.stats', 'kernel.slscFused.lags',
+                 'kernel.demodIQ', 'kernel.multiLagRhoIQ', 'kernel.slscFusedIQ', 'kernel.lagNSums',
+                 'kernel.lagSums', 'kernel.interpTable', 'kernel.interpGather', 'kernel.slscSweep',
+                 'kernel.multiLagRho2D')
+
+_enabled = False
+_hook = None
+_lock = threading.Lock()
+_records = {}
+_local = threading.local()
+
+def _blank():
+    return dict(calls=0, seconds=0.0, copied=0, allocated=0, items=0)
+
+def enable_stats(on:bool=True):
+    """start (True) or stop (False) recording stages, in Python and in the C kernels"""
+    global _enabled
+    from pyrho.rho.pyrho import __rho__
+    _enabled = bool(on)
+    if __rho__.available(): __rho__.setRhoStats(int(_enabled))
+
+def stats_enabled():
+    """whether stages are being recorded"""
+    return _enabled
+
+def set_stats_hook(hook=None):
+    """call hook(name, record) as every Python stage ends, e.g. to export the numbers to a metrics system
+
+    Parameters:
+    ----
+    hook: callable taking the stage name and a dict of calls, seconds, copied, allocated and items for that one
+        call, or None (default) to remove the hook
+    """
+    global _hook
+    if (hook is not None) and not callable(hook): raise TypeError("hook must be callable")
+    _hook = hook
+
+def reset_stats():
+    """zero every counter, in Python and in the C kernels"""
+    from pyrho.rho.pyrho import __rho__
+    with _lock:
+        _records.clear()
+    if __rho__.loaded: __rho__.resetRhoStats()
+
+def stats():
+    """totals of every stage recorded since the last reset
+
+    Returns:
+    ----
+    stats: dict mapping each stage name to a dict of calls, seconds, copied and allocated bytes, and items of work
+    """
+    from pyrho.rho.pyrho import __rho__
+    n = len(KERNEL_STAGES)
+    seconds, calls, nbytes, items = (ct.c_double*n)(), (ct.c_longlong*n)(), (ct.c_longlong*n)(), (ct.c_longlong*n)()
+    if __rho__.loaded: __rho__.readRhoStats(seconds, calls, nbytes, items)
+
+    with _lock:
+        result = {name: dict(record) for name, record in _records.items()}
+    for i, name in enumerate(KERNEL_STAGES):
+        if calls[i] == 0: continue
+        result[name] = dict(calls=calls[i], seconds=seconds[i], copied=0, allocated=nbytes[i], items=items[i])
+    return result
+
+@contextmanager
+def profile(hook=None):
+    """record every stage within a with block, the yielded dict is filled with the totals when the block exits
+
+    Parameters:
+    ----
+    hook: optional callable to install with set_stats_hook for the duration of the block
+    """
+    previous = (_enabled, _hook)
+    reset_stats()
+    if hook is not None: set_stats_hook(hook)
+    enable_stats(True)
+    result = {}
+    try:
+        yield result
+    finally:
+        result.update(stats())
+        enable_stats(previous[0])
+        set_stats_hook(previous[1])
+
+def count(copied:int=0, allocated:int=0):
+    """charge bytes copied or allocated to every stage in progress on this thread"""
+    if not _enabled: return
+    frames = getattr(_local, 'frames', None)
+    if not frames:
+        _add('unstaged', dict(calls=0, seconds=0.0, copied=int(copied), allocated=int(allocated), items=0))
+        return
+    for frame in frames:
+        frame['copied'] += int(copied)
+        frame['allocated'] += int(allocated)
+
+def _add(name:str, record:dict):
+    with _lock:
+        total = _records.setdefault(name, _blank())
+        for key, value in record.items(): total[key] += value
+
+class stage():
+    """context manager timing one named stage, free of cost while instrumentation is off
+
+    Stages nest, and the time and bytes of a stage include those of the stages within it.
+
+    Parameters:
+    ----
+    name: the name the stage is recorded under
+    items: units of work done by the stage, e.g. points, reported with the time
+    """
+    __slots__ = ('name', 'items', 'frame')
+
+    def __init__(self, name:str, items:int=0):
+        self.name = name
+        self.items = items
+        self.frame = None
+
+    def __enter__(self):
+        if not _enabled: return self
+        self.frame = dict(calls=1, seconds=time.perf_counter(), copied=0, allocated=0, items=int(self.items))
+        if not hasattr(_local, 'frames'): _local.frames = []
+        _local.frames.append(self.frame)
+        return self
+
+    def __exit__(self, *exc):
+        if self.frame is None: return False
+        frame, self.frame = self.frame, None
+        frame['seconds'] = time.perf_counter() - frame['seconds']
+        _local.frames.pop()
+        _add(self.name, frame)
+        if _hook is not None: _hook(self.name, dict(frame))
+        return False
+
+def staged(name:str):
+    """decorator recording every call of a function as one stage"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled: return func(*args, **kwargs)
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,553 @@
+"""Vectorized pure-NumPy implementations of the kernels, the 'numpy' backend of pyrho.backend
+
+Every function takes the same arguments and returns the same arrays as the wrapper of the same name in pyrho.rho
+or pyrho.trig, and validates its inputs with the same helpers. Work is vectorized over channels, pairs and points,
+in blocks of points where a whole tensor would not fit in memory, so the fallback is slower than the C kernels but
+never loops in Python per sample or per point. Sums are formed in float64.
+"""
+import numpy as np
+from pyrho.cbuf import asrf, outbuf
+from pyrho.rho import pyrho as _rho
+from pyrho.rho.pyrho import DelayModel
+from pyrho.trig import pytrig as _trig
+
+# number of values a block of points may expand to in the blocked kernels
+BLOCK = 2**20
+
+# variance of a sliding window, relative to the cumulative energy it is differenced from, below which it is rounding
+SLIDE_RTOL = 1E-10
+
+def _blocks(P:int, size:int):
+    """slices of consecutive points that each expand to about BLOCK values, at size values per point"""
+    step = max(1, BLOCK // max(1, size))
+    return [slice(p, min(p+step, P)) for p in range(0, P, step)]
+
+def _widen(arr):
+    """float64 or complex128 copy of raw or IQ samples"""
+    return arr.astype(np.complex128 if np.iscomplexobj(arr) else np.float64)
+
+def _channels(arr, axis:int):
+    """M by N float64 or complex128 copy of the channels of a 2D matrix, and whether it holds IQ data"""
+    arr, fmt, M, N, sm, sn = _rho._channelview(arr, axis)
+    x = _widen(arr)
+    return (x.T if axis == 1 else x), fmt is None
+
+def _normalize(x):
+    """channels about their means scaled to unit energy, samples along the last axis, empty channels are zeroed"""
+    x = x - np.mean(x, axis=-1, keepdims=True)
+    energy = np.sum(np.abs(x)**2, axis=-1, keepdims=True)
+    gain = np.divide(1.0, np.sqrt(energy), out=np.zeros_like(energy), where=energy > 0)
+    return x * gain
+
+def _paircoherence(y, lag:int, part:str='real'):
+    """normalized correlation of every pair (m, m+lag) of normalized channels along the second to last axis"""
+    M = y.shape[-2]
+    cross = np.sum(y[..., :M-lag, :] * np.conj(y[..., lag:, :]), axis=-1)
+    if not np.iscomplexobj(cross): return cross
+    return np.abs(cross) if part == 'abs' else cross.real
+
+def lagNRho(arr, lag:int=1, axis:int=1, part:str='real', accumulators:bool=False):
+    """see pyrho.rho.lagNRho"""
+    x, iq = _channels(arr, axis)
+    M = x.shape[0]
+    if (lag < 0) or (lag >= M): raise ValueError("lag must be between 0 and nele-1")
+
+    if accumulators:
+        if iq: raise ValueError("accumulators are only available for real data")
+        c = x - np.mean(x, axis=1, keepdims=True)
+        cross = np.sum(c[:M-lag] * c[lag:], axis=1).astype(np.float32)
+        energy = np.sum(c*c, axis=1).astype(np.float32)
+        norm = np.sqrt(energy[:M-lag].astype(np.float64) * energy[lag:])
+        rho = np.sum(np.divide(cross, norm, out=np.zeros_like(norm), where=norm > 0)) / (M-lag)
+        coherent = np.sum(np.sum(x, axis=0)**2)
+        return float(rho), dict(cross=cross, self=energy, coherent=float(coherent), incoherent=float(np.sum(x*x)))
+
+    if iq: _rho._iqpart(part)
+    return float(np.mean(_paircoherence(_normalize(x), lag, part)))
+
+def RofM(arr, axis:int=1, lags=None, method:str='auto', part:str='real', out=None):
+    """see pyrho.rho.RofM"""
+    x, iq = _channels(arr, axis)
+    nele = x.shape[0]
+
+    if lags is None:
+        lags = np.arange(nele-1)
+    lags = np.array(lags, dtype=np.int32).flatten()
+    if np.any(lags < 0) or np.any(lags >= nele):
+        raise ValueError("lags must be between 0 and nele-1")
+    if method not in ('auto', 'fft', 'direct'): raise ValueError("method must be 'auto', 'fft', or 'direct'")
+
+    y = _normalize(x)
+    if iq:
+        if method == 'fft': raise ValueError("IQ data only supports the 'direct' method")
+        _rho._iqpart(part)
+        rhos = np.array([np.mean(_paircoherence(y, lag, part)) for lag in lags])
+    else:
+        rhos = _rhosreal(y, lags, method)
+
+    if out is None: return rhos.astype(np.float32).astype(float)
+    out = outbuf(out, lags.size)
+    out[...] = rhos
+    return out
+
+def _rhosreal(y, lags, method:str):
+    """the coherence of real normalized channels at each lag, by FFT or by direct pair sums as RofM would pick"""
+    nele = y.shape[0]
+
+    K = int(2**np.ceil(np.log2(max(2*nele-1, 2))))
+    if method == 'auto':
+        usefft = np.sum(nele - lags) > 1.5 * K * np.log2(K)
+    else:
+        usefft = method == 'fft'
+
+    # the autocorrelation along the elements, summed over samples, holds every lag at once
+    if usefft:
+        spec = np.fft.rfft(y, n=K, axis=0)
+        acf = np.fft.irfft(np.sum(np.abs(spec)**2, axis=1), n=K)
+        rhos = acf[lags] / (nele - lags)
+    else:
+        rhos = np.array([np.mean(_paircoherence(y, lag)) for lag in lags])
+    return rhos
+
+def RofM2D(arr, shape, axis:int=1, lags=None, radial:bool=False, method:str='auto', out=None):
+    """see pyrho.rho.RofM2D"""
+    x, iq = _channels(arr, axis)
+    if iq: raise ValueError("RofM2D only supports real data")
+    Mx, My = _rho._lattice(shape, x.shape[0])
+    vecs = _rho._lags2d(Mx, My, lags, radial)
+    y = _normalize(x).reshape(Mx, My, -1)
+
+    # the 2D autocorrelation of the lattice, summed over samples, holds every lag at once
+    if _rho._usefft2d(Mx, My, vecs, method):
+        spec = np.fft.fft2(y, s=(2*Mx-1, 2*My-1), axes=(0, 1))
+        acf = np.fft.ifft2(np.sum(np.abs(spec)**2, axis=2)).real
+        rhos = acf[vecs[:,0] % (2*Mx-1), vecs[:,1] % (2*My-1)] / _rho._pairs2d(Mx, My, vecs)
+    else:
+        rhos = np.empty(vecs.shape[0])
+        for l, (dx, dy) in enumerate(vecs):
+            a = y[max(0, -dx):Mx-max(0, dx), max(0, -dy):My-max(0, dy)]
+            b = y[max(0, dx):Mx-max(0, -dx), max(0, dy):My-max(0, -dy)]
+            rhos[l] = np.mean(np.sum(a*b, axis=-1))
+    return _rho._from2d(rhos, vecs, Mx, My, lags, radial, out)
+
+def lagSums(arr, lags, axis:int=1, cross=None, energy=None):
+    """see pyrho.rho.lagSums"""
+    if np.ndim(arr) == 2:
+        x, iq = _channels(arr, axis)
+        if iq: raise ValueError("lagSums only supports real data")
+        x, shape = x[np.newaxis], ()
+    elif np.ndim(arr) == 3:
+        x, shape = _widen(asrf(arr)[0]), (np.shape(arr)[0],)
+    else:
+        raise ValueError("Input array must be 2D (elements by samples) or 3D (points by elements by kernel)")
+    M = x.shape[1]
+
+    lags = np.array(lags, dtype=np.int32).flatten()
+    if np.any(lags < 0) or np.any(lags >= M): raise ValueError("lags must be between 0 and nele-1")
+    Npairs = int(np.sum(M - lags))
+    cross = outbuf(cross, shape + (Npairs,), np.float64)
+    energy = outbuf(energy, shape + (M,), np.float64)
+
+    c = x - np.mean(x, axis=2, keepdims=True)
+    cross[...] = np.concatenate([np.sum(c[:, :M-lag] * c[:, lag:], axis=2) for lag in lags], axis=1).reshape(cross.shape)
+    energy[...] = np.sum(c*c, axis=2).reshape(energy.shape)
+    return cross, energy
+
+def slscPoints(cube, lags=1, out=None):
+    """see pyrho.rho.slscPoints"""
+    if np.ndim(cube) != 3:
+        raise ValueError("Input array must be 3D (points by elements by kernel)")
+
+    cube = np.asarray(cube)
+    P, M, K = cube.shape
+    lags = _rho._shortlags(lags, M)
+    out = outbuf(out, P)
+
+    for blk in _blocks(P, M*K):
+        y = _normalize(cube[blk].astype(np.float64))
+        out[blk] = sum(np.mean(_paircoherence(y, lag), axis=-1) for lag in lags)
+    return out
+
+def slscSliding(arr, nkernel:int, lags=1, out=None):
+    """see pyrho.rho.slscSliding"""
+    if np.ndim(arr) not in (2, 3):
+        raise ValueError("Input array must be 2D (elements by samples) or 3D (lines by elements by samples)")
+    if nkernel < 1: raise ValueError("nkernel must be at least 1")
+
+    arr, fmt = asrf(arr)
+    single = arr.ndim == 2
+    if single: arr = arr[np.newaxis]
+    Q, M, N = arr.shape
+    lags = _rho._shortlags(lags, M)
+    out = outbuf(out, (N,) if single else (Q, N))
+    lines = out.reshape(Q, N)
+
+    # window of each output sample, clipped to the trace
+    n = np.arange(N)
+    lo = np.clip(n - nkernel//2, 0, N)
+    hi = np.clip(n - nkernel//2 + nkernel, 0, N)
+    count = (hi - lo).astype(np.float64)
+
+    def cumulative(x):
+        return np.concatenate([np.zeros(x.shape[:-1] + (1,)), np.cumsum(x, axis=-1)], axis=-1)
+
+    def window(x):
+        csum = cumulative(x)
+        return csum[..., hi] - csum[..., lo]
+
+    for q in range(Q):
+        x = arr[q].astype(np.float64)
+        s = window(x)
+        v = window(x*x) - s*s/count
+        # variances at the rounding level of the cumulative sums are those of constant windows, see SLIDE_RTOL in slsc.c
+        v = np.where(v > SLIDE_RTOL * cumulative(x*x)[..., hi], v, 0)
+        total = np.zeros(N)
+        for lag in lags:
+            cov = window(x[:M-lag] * x[lag:]) - s[:M-lag]*s[lag:]/count
+            norm = v[:M-lag] * v[lag:]
+            valid = (v[:M-lag] > 0) & (v[lag:] > 0)
+            rho = np.divide(cov, np.sqrt(np.where(valid, norm, 1.0)), out=np.zeros_like(cov), where=valid)
+            total += np.sum(rho, axis=0) / (M-lag)
+        lines[q] = total
+    return out
+
+def _delaysat(model, points, blk:slice):
+    """N by Pb float32 matrix of the delays of a delay model at a block of points, see delaysat in delays.c"""
+    if model.kind == DelayModel.TABLE:
+        return model._tabs[:, blk]
+    if model.kind == DelayModel.GRID:
+        return model._tabs[model._index[blk][np.newaxis,:] + model.step*np.arange(model.N)[:,np.newaxis]]
+
+    diff = points[np.newaxis, blk, :] - model._refs[:, np.newaxis, :]
+    c = np.float32(model.c)
+    if model.kind == DelayModel.SPHERICAL:
+        return np.sqrt(np.sum(diff*diff, axis=-1)) / c
+    return np.sum(model._norms[:, np.newaxis, :] * diff, axis=-1) / c + model._trefs[:, np.newaxis]
+
+def _apodwindow(apod, lo, hi, M:int):
+    """Pb by M channel weights of a window across each point's active channels, 0 outside, see apodwindow in slsc.c"""
+    m = np.arange(M)[np.newaxis, :]
+    width = np.maximum(hi - lo, 1)[:, np.newaxis]
+    inside = (m >= lo[:, np.newaxis]) & (m < hi[:, np.newaxis])
+    x = (m - lo[:, np.newaxis] + 0.5) / width
+    if apod == 'hann':
+        w = 0.5 - 0.5*np.cos(2*np.pi*x)
+    elif apod == 'hamming':
+        w = 0.54 - 0.46*np.cos(2*np.pi*x)
+    else:
+        w = np.ones_like(x)
+    return np.where(inside, w, 0.0)
+
+def _kernmetrics(kern, blo, bhi, apod, lags, part:str, Q:int, spec:bool):
+    """per-lag coherence, spatial spectrum and energy of a Pb by Nrx by K block of kernels"""
+    Nrx = kern.shape[1]
+
+    # pairs are weighted by the window across each point's active channels, and skipped outside of them
+    weights = _apodwindow(apod, blo, bhi, Nrx)
+    y = _normalize(kern)
+    perlag = np.zeros((kern.shape[0], lags.size))
+    for l, lag in enumerate(lags):
+        w = weights[:, :Nrx-lag] * weights[:, lag:]
+        wsum = np.sum(w, axis=1)
+        rho = np.sum(w * _paircoherence(y, lag, part), axis=1)
+        perlag[:, l] = np.divide(rho, wsum, out=np.zeros_like(rho), where=wsum > 0)
+    empty = (bhi - blo) < 2
+    perlag[empty] = 0
+    if not spec: return perlag, None, None
+
+    # spatial spectrum of the raw kernel across each point's active channels
+    inside = weights > 0
+    M = (bhi - blo)[:, np.newaxis]
+    m = np.arange(Nrx)[np.newaxis, :] - blo[:, np.newaxis]
+    power = np.zeros((kern.shape[0], Q+1))
+    for q in range(Q+1):
+        phase = np.where(inside, np.exp(-2j*np.pi*q*m/np.maximum(M, 1)), 0)
+        coef = np.einsum('pm,pmk->pk', phase, kern)
+        power[:, q] = np.sum(np.abs(coef)**2, axis=1)
+        power[(2*q > M[:, 0]) | empty, q] = 0
+        if q > 0: power[2*q < M[:, 0], q] *= 2
+    energy = np.where(empty, 0, np.sum(np.where(inside[..., np.newaxis], kern, 0)**2, axis=(1, 2)))
+    return perlag, power, energy
+
+def _fusedsetup(f:dict):
+    """float32 data, aperture ranges and transmit groups of inputs from pyrho.rho.pyrho._fusedinputs"""
+    Ntx, Nrx, Ns = f['shape']
+    P = f['P']
+    data = f['data'] if f['iq'] or (f['data'].dtype == np.float32) else f['data'].astype(np.float32)
+    lo = np.zeros(P, dtype=np.int32) if f['lo'] is None else f['lo']
+    hi = np.full(P, Nrx, dtype=np.int32) if f['hi'] is None else f['hi']
+    if f['txorder'] is None:
+        groups = [np.arange(Ntx)]
+    else:
+        groups = [f['txorder'][start:stop] for start, stop in zip(f['txstart'][:-1], f['txstart'][1:])]
+    return data, lo, hi, groups
+
+def _fusedblock(f:dict, data, txtau, rxtau, blo, bhi, groups, fs:float, tstart:float, nkernel:int, apod, fc=None, part:str='real',
+                Q:int=0, spec:bool=False):
+    """per-lag coherence, spectrum and energy of a block of points with the given delays, averaged over the groups"""
+    Ntx, Nrx, Ns = f['shape']
+    K = nkernel
+
+    # fractional sample of each kernel center, the weights are shared by every kernel sample
+    total = txtau[:, np.newaxis, :] + rxtau[np.newaxis, :, :]
+    tau = (total - np.float32(tstart)) * np.float32(fs)
+    i0 = np.floor(tau)
+    frac = (tau - i0)[..., np.newaxis]
+    idx = i0.astype(np.int64)[..., np.newaxis] - K//2 + np.arange(K+1)
+
+    # the K+1 samples each kernel interpolates between, zero outside of the trace
+    valid = (idx >= 0) & (idx < Ns)
+    span = np.take_along_axis(data, np.clip(idx, 0, Ns-1).reshape(Ntx, Nrx, -1), axis=2).reshape(idx.shape)
+    span = np.where(valid, span, 0)
+    chans = (1 - frac) * span[..., :K] + frac * span[..., 1:]
+    if f['iq']: chans = chans * np.exp(2j*np.pi*fc*total.astype(np.float64))[..., np.newaxis]
+
+    # each group of transmits is compounded coherently, and the metrics averaged over the groups
+    perlag, power, kernenergy = 0, 0, 0
+    for group in groups:
+        kern = np.moveaxis(np.sum(chans[group], axis=0, dtype=chans.dtype), 1, 0).astype(np.complex128 if f['iq'] else np.float64)
+        grouplag, grouppower, groupenergy = _kernmetrics(kern, blo, bhi, apod, f['lags'], part, Q, spec)
+        perlag = perlag + grouplag/len(groups)
+        if spec:
+            power = power + grouppower/len(groups)
+            kernenergy = kernenergy + groupenergy/len(groups)
+    return perlag, power, kernenergy
+
+def _runfused(f:dict, fs:float, tstart:float, nkernel:int, apod, out, fc=None, part:str='real', rhos=None, Q:int=0, spec=None, energy=None):
+    """the fused kernels on inputs from pyrho.rho.pyrho._fusedinputs, blocked over points"""
+    Ntx, Nrx, Ns = f['shape']
+    if f['iq']: _rho._iqpart(part)
+    data, lo, hi, groups = _fusedsetup(f)
+
+    for blk in _blocks(f['P'], Ntx*Nrx*(nkernel+1)):
+        txtau = _delaysat(f['tx'], f['points'], blk).astype(np.float32)
+        rxtau = _delaysat(f['rx'], f['points'], blk).astype(np.float32)
+        perlag, power, kernenergy = _fusedblock(f, data, txtau, rxtau, lo[blk], hi[blk], groups, fs, tstart, nkernel, apod, fc, part, 
+                                                Q, spec is not None)
+        out[blk] = np.sum(perlag, axis=1)
+        if rhos is not None: rhos[blk] = perlag
+        if spec is not None: spec[blk] = power
+        if (spec is not None) and (energy is not None): energy[blk] = kernenergy
+    return out
+
+def slscFused(data, tx, rx, fs:float, tstart:float=0, nkernel:int=5, lags=1, points=None, aperture=None, apod:str|None=None, out=None,
+              fc:float|None=None, part:str='real', work=None, txgroups=None, order=None, tile:int=0):
+    """see pyrho.rho.slscFused, the points are processed in blocks whatever their order"""
+    f = _rho._fusedinputs(data, tx, rx, nkernel, lags, points, aperture, apod, fc, txgroups, order, tile)
+    out = outbuf(out, f['P'])
+    return _runfused(f, fs, tstart, nkernel, apod, out, fc, part)
+
+def slscSums(data, tx, rx, fs:float, tstart:float=0, nkernel:int=5, lags=1, points=None, aperture=None, apod:str|None=None, m0:int=0,
+             out=None, work=None, txgroups=None, order=None, tile:int=0):
+    """see pyrho.rho.slscSums"""
+    if np.iscomplexobj(data): raise ValueError("slscSums only supports real RF data")
+    if m0 < 0: raise ValueError("m0 must be non-negative")
+    f = _rho._fusedinputs(data, tx, rx, nkernel, lags, points, aperture, apod, None, txgroups, order, tile)
+    P, L = f['P'], f['lags'].size
+
+    sums = _rho._sumsbufs(out, P, L, m0)
+    _runfused(f, fs, tstart, nkernel, apod, sums['slsc'], rhos=sums['rhos'], Q=int(m0), spec=sums['spectrum'], energy=sums['energy'])
+
+    Nrx = f['shape'][1]
+    sums['nchan'] = np.full(P, Nrx, dtype=np.int32) if f['lo'] is None else f['hi'] - f['lo']
+    sums['lags'] = f['lags']
+    return sums
+
+def slscSweep(data, tx, rx, fs:float, speeds, tstart:float=0, nkernel:int=5, lags=1, points=None, aperture=None, apod:str|None=None,
+              txoff=None, rxoff=None, out=None, txgroups=None, order=None, tile:int=0, c=1540, work=None):
+    """see pyrho.rho.slscSweep, the path lengths of each block of points are rescaled for every speed"""
+    if np.iscomplexobj(data): raise ValueError("slscSweep only supports real RF data")
+    f = _rho._fusedinputs(data, tx, rx, nkernel, lags, points, aperture, apod, None, txgroups, order, tile)
+    Ntx, Nrx, Ns = f['shape']
+    slowness, (txc, rxc), txoff, rxoff = _rho._sweepinputs(speeds, c, txoff, rxoff, Ntx, Nrx)
+    txoff = np.zeros(Ntx, dtype=np.float32) if txoff is None else txoff
+    rxoff = np.zeros(Nrx, dtype=np.float32) if rxoff is None else rxoff
+    out = outbuf(out, (slowness.size, f['P']))
+    data, lo, hi, groups = _fusedsetup(f)
+
+    for blk in _blocks(f['P'], Ntx*Nrx*(nkernel+1)):
+        txlen = (_delaysat(f['tx'], f['points'], blk).astype(np.float32) - txoff[:, np.newaxis]) * np.float32(txc)
+        rxlen = (_delaysat(f['rx'], f['points'], blk).astype(np.float32) - rxoff[:, np.newaxis]) * np.float32(rxc)
+        for ic, slow in enumerate(slowness):
+            txtau = txlen*slow + txoff[:, np.newaxis]
+            rxtau = rxlen*slow + rxoff[:, np.newaxis]
+            perlag, _, _ = _fusedblock(f, data, txtau, rxtau, lo[blk], hi[blk], groups, fs, tstart, nkernel, apod)
+            out[ic, blk] = np.sum(perlag, axis=1)
+    return out
+
+def fusedworksize(shape, nkernel:int=5, iq:bool=False, sweep:bool=False):
+    """see pyrho.rho.fusedworksize, the blocked kernels allocate their own blocks"""
+    return 0
+
+def _interpweights(kind:str, W:int, tau):
+    """first sample of each fractional sample tau and the weights of its W samples, see interpweights in interp.c"""
+    tau = np.asarray(tau, dtype=np.float32)
+    if kind == 'nearest':
+        return np.floor(tau + np.float32(0.5)).astype(np.int64), np.ones(tau.shape + (1,), dtype=np.float32)
+
+    i0 = np.floor(tau)
+    frac = (tau - i0)[..., np.newaxis]
+    i0 = i0.astype(np.int64)
+    if kind == 'linear':
+        return i0, np.concatenate((1 - frac, frac), axis=-1)
+    if kind == 'cubic':
+        weights = (((-0.5*frac + 1)*frac - 0.5)*frac, (1.5*frac - 2.5)*frac*frac + 1, ((-1.5*frac + 2)*frac + 0.5)*frac, (0.5*frac - 0.5)*frac*frac)
+        return i0 - 1, np.concatenate(weights, axis=-1)
+
+    # Hann-windowed sinc normalized to unit DC gain
+    x = (np.arange(W) - (W//2 - 1)) - frac
+    weights = np.sinc(x) * (0.5 + 0.5*np.cos(np.pi*x/(0.5*W)))
+    total = np.sum(weights, axis=-1, keepdims=True)
+    weights = np.divide(weights, total, out=weights, where=total != 0)
+    return i0 - (W//2 - 1), weights.astype(np.float32)
+
+def interptable(tx, rx, nsamp:int, fs:float, tstart:float=0, points=None, kind:str='linear', taps:int=8, dtype=np.float32):
+    """see pyrho.rho.interptable"""
+    W = _rho.interpwidth(kind, taps)
+    if np.dtype(dtype) not in (np.float32, np.float16): raise ValueError("dtype must be np.float32 or np.float16")
+    if nsamp < W: raise ValueError(f"nsamp must be at least the {W} samples of the kernel")
+    tx = _rho._asdelaymodel(tx)
+    rx = _rho._asdelaymodel(rx)
+    P, points = _rho._modelpoints(tx, rx, points)[:2]
+
+    index = np.empty((tx.N, rx.N, P), dtype=np.int32)
+    weights = np.empty((tx.N, rx.N, P, W), dtype=dtype)
+    for blk in _blocks(P, tx.N*rx.N*W):
+        txtau = _delaysat(tx, points, blk).astype(np.float32)
+        rxtau = _delaysat(rx, points, blk).astype(np.float32)
+        tau = (txtau[:, np.newaxis, :] + rxtau[np.newaxis, :, :] - np.float32(tstart)) * np.float32(fs)
+        first, kern = _interpweights(kind, W, tau)
+
+        # shift each kernel onto a window of samples within the trace, zeroing the samples it does not reach
+        base = np.clip(first, 0, nsamp - W)
+        tap = (base - first)[..., np.newaxis] + np.arange(W)
+        reach = (tap >= 0) & (tap < W)
+        index[:, :, blk] = base
+        weights[:, :, blk] = np.where(reach, np.take_along_axis(kern, np.clip(tap, 0, W-1), axis=-1), 0)
+    return _rho.InterpTable(index, weights, kind, nsamp)
+
+def interpgather(data, table, compound:bool=False, out=None):
+    """see pyrho.rho.interpgather"""
+    if np.ndim(data) != 3: raise ValueError("Input data must be 3D (Ntx by Nrx by Nsamp)")
+    if not isinstance(table, _rho.InterpTable): raise ValueError("table must be an InterpTable from interptable")
+    data = _widen(asrf(data)[0])
+    Ntx, Nrx, Ns = data.shape
+    if (Ntx, Nrx) != table.shape[:2]: raise ValueError("data must have the Ntx transmits and Nrx channels of the table")
+    if Ns != table.nsamp: raise ValueError("data must have the nsamp samples per trace the table was built for")
+    P, W = table.shape[2], table.width
+    out = outbuf(out, (Nrx, P) if compound else (Ntx, Nrx, P))
+
+    for blk in _blocks(P, Ntx*Nrx*W):
+        idx = table.index[:, :, blk, np.newaxis] + np.arange(W)
+        span = np.take_along_axis(data, idx.reshape(Ntx, Nrx, -1), axis=2).reshape(idx.shape)
+        delayed = np.sum(span * table.weights[:, :, blk].astype(np.float32), axis=-1)
+        if compound:
+            out[:, blk] = np.sum(delayed, axis=0)
+        else:
+            out[:, :, blk] = delayed
+    return out
+
+def demodIQ(data, fs:float, fc:float, decim:int=2, tstart:float=0, taps=None, axis:int=-1, out=None):
+    """see pyrho.rho.demodIQ"""
+    if decim < 1: raise ValueError("decim must be at least 1")
+    if taps is None: taps = _rho.lowpass(8*decim+1, 0.5/decim)
+    taps = np.ascontiguousarray(taps, dtype=np.float32).flatten()
+    if taps.size < 1: raise ValueError("taps must hold at least one tap")
+
+    arr, fmt = asrf(data)
+    arr = np.moveaxis(arr, axis, -1)
+    shape = arr.shape
+    arr = arr.reshape(-1, shape[-1])
+    T, Ns = arr.shape
+    Nout = -(-Ns // decim)
+
+    if (out is not None) and ((axis % len(shape)) != len(shape)-1): raise ValueError("out requires axis to be the last axis")
+    out = outbuf(out, shape[:-1] + (Nout,), np.complex64)
+
+    # mix with the phase of absolute time, then filter each decimated output from the taps around it
+    half = (taps.size - 1)//2
+    n = np.arange(Ns)
+    mixed = np.zeros((T, Ns + half + taps.size), dtype=np.complex128)
+    mixed[:, half:half+Ns] = arr * np.exp(-2j*np.pi*fc*(tstart + n/fs))
+    iq = np.zeros((T, Nout), dtype=np.complex128)
+    for k, tap in enumerate(taps):
+        iq += tap * mixed[:, k:k + decim*(Nout-1) + 1:decim]
+    out[...] = (2*iq).reshape(out.shape)
+
+    return np.moveaxis(out, -1, axis)
+
+def c_norm_batch(xrefs, points, c:float=1540, out=None):
+    """see pyrho.trig.c_norm_batch"""
+    xrefs = _trig._vecs3(xrefs, "xrefs")
+    points, Np, sp, sd = _trig._pointview(points)
+    E = xrefs.shape[0]
+    out = outbuf(out, (E, Np))
+
+    for blk in _blocks(Np, 3*E):
+        diff = points[np.newaxis, blk, :] - xrefs[:, np.newaxis, :]
+        out[:, blk] = np.sqrt(np.sum(diff*diff, axis=-1)) / np.float32(c)
+    return out
+
+def c_pw_batch(xrefs, trefs, norms, points, c:float=1540, out=None):
+    """see pyrho.trig.c_pw_batch"""
+    xrefs = _trig._vecs3(xrefs, "xrefs")
+    norms = _trig._vecs3(norms, "norms")
+    trefs = np.ascontiguousarray(trefs, dtype=np.float32).flatten()
+    E = xrefs.shape[0]
+    if (norms.shape[0] != E) or (trefs.size != E):
+        raise ValueError("xrefs, trefs, and norms must have the same number of transmissions")
+    points, Np, sp, sd = _trig._pointview(points)
+    out = outbuf(out, (E, Np))
+
+    for blk in _blocks(Np, 3*E):
+        diff = points[np.newaxis, blk, :] - xrefs[:, np.newaxis, :]
+        out[:, blk] = np.sum(norms[:, np.newaxis, :] * diff, axis=-1) / np.float32(c) + trefs[:, np.newaxis]
+    return out
+
+def c_pw_engine(xref, tref, norm, points, c:float=1540, out=None):
+    """see pyrho.trig.c_pw_engine"""
+    xref = _trig._vec3(xref, "xref")
+    norm = _trig._vec3(norm, "norm")
+    points, Np, sp, sd = _trig._pointview(points)
+    out = outbuf(out, Np)
+    out[:] = np.sum(norm * (points - xref), axis=-1) / np.float32(c) + np.float32(tref)
+    return out
+
+def c_norm_engine(xref, points, c:float=1540, out=None):
+    """see pyrho.trig.c_norm_engine"""
+    xref = _trig._vec3(xref, "xref")
+    points, Np, sp, sd = _trig._pointview(points)
+    out = outbuf(out, Np)
+    diff = points - xref
+    out[:] = np.sqrt(np.sum(diff*diff, axis=-1)) / np.float32(c)
+    return out
+
+def getaperture(eles, points, fnum, fnorm=None, dyn:bool=True, focus=None, out=None):
+    """see pyrho.trig.getaperture"""
+    eles = _trig._lineeles(eles)
+    points, Np, sp, sd = _trig._pointview(points)
+    fnums, naps, focus = _trig._apertureaxes(fnum, fnorm, dyn, focus)
+    E = eles.shape[0]
+
+    lo, hi = (None, None) if out is None else out
+    lo = outbuf(lo, Np, np.int32)
+    hi = outbuf(hi, Np, np.int32)
+    for blk in _blocks(Np, 3*E):
+        diff = points[blk, np.newaxis, :] - eles[np.newaxis, :, :]
+        depth = diff[..., 2] if dyn else (focus[2] - eles[:, 2])[np.newaxis, :]
+        active = np.ones(diff.shape[:2], dtype=bool)
+        for fnum, nap in zip(fnums, naps):
+            active &= 2*np.abs(diff @ nap) <= depth/fnum
+
+        # the range spans the first through the last active element, empty ranges are (0, 0)
+        found = np.any(active, axis=1)
+        lo[blk] = np.where(found, np.argmax(active, axis=1), 0)
+        hi[blk] = np.where(found, E - np.argmax(active[:, ::-1], axis=1), 0)
+    return lo, hi
+
+# the kernels of this backend, by the name of the wrapper they stand in for
+KERNELS = dict(
+    lagNRho=lagNRho, RofM=RofM, RofM2D=RofM2D, lagSums=lagSums, slscPoints=slscPoints, slscSliding=slscSliding, slscFused=slscFused,
+    slscSums=slscSums, slscSweep=slscSweep, fusedworksize=fusedworksize, interptable=interptable, interpgather=interpgather, demodIQ=demodIQ, c_norm_batch=c_norm_batch, c_pw_batch=c_pw_batch, c_pw_engine=c_pw_engine,
+    c_norm_engine=c_norm_engine, getaperture=getaperture,
+)
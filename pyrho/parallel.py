@@ -0,0 +1,28 @@
+"""Thread count control for the C kernels
+
+The kernels are OpenMP parallel. By default they use the OpenMP default thread count, which honors 
+OMP_NUM_THREADS. The libraries are loaded with ctypes.CDLL, which releases the GIL for the duration of 
+every kernel call, and the kernels keep no global state besides the thread count and the instrumentation 
+counters, which are updated atomically, so calls made from several Python threads run concurrently.
+The thread count only applies to the C backend, and setting it loads the libraries if they were built.
+"""
+from pyrho.rho.pyrho import __rho__
+from pyrho.trig.pytrig import __trig__
+
+def set_num_threads(n:int|None=None):
+    """set the number of threads used by every pyrho kernel
+    
+    Parameters:
+    ----
+    n: the number of threads. If None or 0 (default), defer to OpenMP, which honors OMP_NUM_THREADS
+    """
+    if n is None: n = 0
+    n = int(n)
+    if n < 0: raise ValueError("n must be non-negative")
+    if __rho__.available(): __rho__.setRhoThreads(n)
+    if __trig__.available(): __trig__.setTrigThreads(n)
+
+def get_num_threads():
+    """the number of threads the pyrho kernels will use, 1 if they were built without OpenMP or not built at all"""
+    if not __rho__.available(): return 1
+    return int(__rho__.getRhoThreads())
@@ -1 +1,6 @@
-from pyrho.processors.slsc import SLSCProc, TXType, RXType, PWTX, FullRX
\ No newline at end of file
+from pyrho.processors.slsc import SLSCProc, TXType, RXType, PWTX, FullRX, InterRFDataSet
+from pyrho.processors.cache import TableCache
+from pyrho.processors.workspace import Workspace
+from pyrho.processors.tiling import tileorder, mortonorder, depthorder, autotile
+from pyrho.processors.pool import SLSCPool
+from pyrho.processors.ensemble import RhoEnsemble
\ No newline at end of file
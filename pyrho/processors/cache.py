@@ -0,0 +1,117 @@
+"""Delay-table cache keyed by geometry, shared between processors and worker processes"""
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+# bump when the table kernels change what they compute, so stale files on disk are never reused
+CACHE_VERSION = 1
+
+class TableCache():
+    def __init__(self, maxbytes:int=2**30, cachedir:str|None=None):
+        """Initialize a delay-table cache with an in-memory LRU layer and an optional on-disk store
+
+        Tables are looked up by a hash of everything that determines them. Tables found on disk are 
+        memory-mapped read-only, so every process that loads the same table shares its pages.
+
+        Parameters:
+        ----
+        maxbytes: bound on the total size of the tables held by the in-memory layer
+        cachedir: directory of the on-disk store of .npy files. If None (default), the cache is memory only
+        """
+        if maxbytes < 0: raise ValueError("maxbytes must be non-negative")
+        self.maxbytes = int(maxbytes)
+        self.cachedir = cachedir
+        if cachedir is not None: os.makedirs(cachedir, exist_ok=True)
+
+        self.__tables__ = OrderedDict()
+        self.__lock__ = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(kind:str, *arrays, **params):
+        """hash of a table kind, the arrays and the scalar parameters that define it
+        
+        Parameters:
+        ----
+        kind: name of the table engine, e.g. 'pwtx' or 'fullrx'
+        arrays: geometry and point arrays, hashed by dtype, shape, and contents
+        params: scalar parameters such as c and dtype, hashed by their repr
+
+        Returns:
+        ----
+        key: hex digest identifying the table
+        """
+        h = hashlib.sha1()
+        h.update(f"{CACHE_VERSION}:{kind}".encode())
+        for arr in arrays:
+            arr = np.ascontiguousarray(arr)
+            h.update(f"|{arr.dtype.str}{arr.shape}".encode())
+            h.update(memoryview(arr).cast('B'))
+        for name in sorted(params):
+            h.update(f"|{name}={params[name]!r}".encode())
+        return h.hexdigest()
+
+    def _path(self, key:str):
+        return os.path.join(self.cachedir, key + ".npy")
+
+    def _remember(self, key:str, tabs):
+        """add a table to the in-memory layer, evicting the least recently used tables past maxbytes"""
+        if key in self.__tables__:
+            self.nbytes -= self.__tables__.pop(key).nbytes
+        if tabs.nbytes > self.maxbytes: return
+        self.__tables__[key] = tabs
+        self.nbytes += tabs.nbytes
+        while self.nbytes > self.maxbytes:
+            _, old = self.__tables__.popitem(last=False)
+            self.nbytes -= old.nbytes
+
+    def get(self, key:str):
+        """the table stored under key, or None if it is in neither layer"""
+        with self.__lock__:
+            if key in self.__tables__:
+                self.__tables__.move_to_end(key)
+                self.hits += 1
+                return self.__tables__[key]
+
+            if (self.cachedir is not None) and os.path.exists(self._path(key)):
+                tabs = np.load(self._path(key), mmap_mode='r')
+                self._remember(key, tabs)
+                self.hits += 1
+                return tabs
+
+            self.misses += 1
+            return None
+
+    def put(self, key:str, tabs):
+        """store a table in the in-memory layer and, if there is one, the on-disk store"""
+        tabs = np.asarray(tabs)
+        with self.__lock__:
+            self._remember(key, tabs)
+            if (self.cachedir is not None) and not os.path.exists(self._path(key)):
+                # write under a unique name and rename so readers never see a partial file
+                tmp = os.path.join(self.cachedir, f".{key}.{uuid.uuid4().hex}.npy")
+                np.save(tmp, tabs)
+                os.replace(tmp, self._path(key))
+
+    def fetch(self, key:str, build):
+        """the table stored under key, building and storing it with build() if it is missing"""
+        tabs = self.get(key)
+        if tabs is None:
+            tabs = build()
+            self.put(key, tabs)
+        return tabs
+
+    def clear(self, disk:bool=False):
+        """empty the in-memory layer, and the on-disk store if disk is True"""
+        with self.__lock__:
+            self.__tables__.clear()
+            self.nbytes = 0
+            if disk and (self.cachedir is not None):
+                for fname in os.listdir(self.cachedir):
+                    if fname.endswith(".npy"): os.remove(os.path.join(self.cachedir, fname))
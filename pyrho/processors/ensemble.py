@@ -0,0 +1,96 @@
+"""Incremental ensemble coherence over a sequence of frames"""
+import numpy as np
+
+from pyrho.rho import lagSums
+
+class RhoEnsemble():
+    def __init__(self, lags=1, window:int|None=None, forget:float|None=None, axis:int=1):
+        """Initialize a running ensemble of lag coherences, fed one frame at a time
+
+        Every frame adds its pair cross sums and channel self sums to running totals, and the coherence of each 
+        lag is formed from the totals: the mean over pairs (m, m+l) of the summed cross sums normalized by the 
+        summed self sums of the two channels. Each new frame costs one pass over that frame whatever the window.
+
+        Parameters:
+        ----
+        lags: maximum lag Q to track lags 1 through Q, or a list of lag indices
+        window: if given, only the most recent window frames are pooled, the oldest frame's sums are subtracted as 
+            a new one arrives. The sums of window frames are kept
+        forget: if given, a factor between 0 and 1 that the totals are scaled by before each new frame is added, 
+            for an exponentially weighted ensemble. Cannot be combined with window
+        axis: the axis corresponding to the elements of 2D frames
+        """
+        if np.ndim(lags) == 0: lags = np.arange(1, int(lags)+1)
+        self.lags = np.array(lags, dtype=np.int32).flatten()
+        if self.lags.size == 0: raise ValueError("At least one lag must be given")
+        if np.any(self.lags < 0): raise ValueError("lags must be non-negative")
+        if (window is not None) and (forget is not None): raise ValueError("window and forget cannot be combined")
+        if (window is not None) and (window < 1): raise ValueError("window must be at least 1")
+        if (forget is not None) and not (0 < forget <= 1): raise ValueError("forget must be between 0 and 1")
+        self.window = None if window is None else int(window)
+        self.forget = None if forget is None else float(forget)
+        self.axis = axis
+        self.reset()
+
+    def reset(self):
+        """drop every frame pooled so far"""
+        self.nframes = 0
+        self.shape = None
+        self.cross = None
+        self.energy = None
+        self.__history__ = None
+        self.__oldest__ = 0
+
+    def push(self, frame):
+        """pool one frame into the ensemble
+
+        Parameters:
+        ----
+        frame: M by N matrix of channel data with the elements along axis, or a P by M by K tensor of per-point 
+            channel kernels for an ensemble per point. Every frame must have the same number of points and elements
+        """
+        if self.cross is None:
+            cross, energy = lagSums(frame, self.lags, self.axis)
+            self.shape = np.shape(frame)
+            self.cross, self.energy = cross, energy
+            if self.window is not None:
+                self.__history__ = (np.zeros((self.window,) + cross.shape), np.zeros((self.window,) + energy.shape))
+        else:
+            if np.shape(frame) != self.shape: raise ValueError("every frame must have the shape of the first frame")
+            cross, energy = lagSums(frame, self.lags, self.axis)
+            if self.forget is not None:
+                self.cross *= self.forget
+                self.energy *= self.forget
+            self.cross += cross
+            self.energy += energy
+
+        # a full window drops its oldest frame as the new one is stored in its slot
+        if self.window is not None:
+            oldcross, oldenergy = self.__history__
+            if self.nframes >= self.window:
+                self.cross -= oldcross[self.__oldest__]
+                self.energy -= oldenergy[self.__oldest__]
+            oldcross[self.__oldest__] = cross
+            oldenergy[self.__oldest__] = energy
+            self.__oldest__ = (self.__oldest__ + 1) % self.window
+        self.nframes += 1
+
+    def rho(self):
+        """the pooled coherence of each lag, a vector of length L, or a P by L matrix for frames of points"""
+        if self.cross is None: raise ValueError("No frames have been pushed")
+        M = self.energy.shape[-1]
+        if np.any(self.lags >= M): raise ValueError("lags must be less than the number of elements")
+
+        rhos = []
+        start = 0
+        for lag in self.lags:
+            stop = start + M - lag
+            norm = np.sqrt(np.clip(self.energy[..., :M-lag] * self.energy[..., lag:], 0, None))
+            pairs = np.divide(self.cross[..., start:stop], norm, out=np.zeros_like(norm), where=norm > 0)
+            rhos.append(np.mean(pairs, axis=-1))
+            start = stop
+        return np.stack(rhos, axis=-1).astype(np.float32)
+
+    def slsc(self):
+        """the sum of the pooled lag coherences, a float, or a vector of length P for frames of points"""
+        return np.sum(self.rho(), axis=-1)
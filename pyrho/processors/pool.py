@@ -0,0 +1,176 @@
+"""Process-pool execution of SLSCProc over the frames or rotations of a scan
+
+The parent builds the delay tables, points, and apertures once and places them in shared memory. Workers
+attach to them without copying, read their RF chunk from a shared block or a memory-mapped dataset, and
+write their image slice straight into a shared output array.
+"""
+import multiprocessing as mp
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from pyrho.rho import DelayModel, slscFused, tabledelays, griddelays, sphericaldelays, planedelays
+from pyrho.parallel import set_num_threads
+from pyrho.backend import set_backend, get_backend
+from pyrho.processors.slsc import SLSCProc, InterRFDataSet
+
+def _share(arr):
+    """copy an array into a new shared memory block, returning the block and a picklable (name, shape, dtype) handle"""
+    arr = np.asarray(arr)
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, arr.dtype, buffer=shm.buf)[...] = arr
+    return shm, (shm.name, arr.shape, arr.dtype.str)
+
+def _attach(handle):
+    """attach to the shared memory block behind a handle, returning the block and an array view of it"""
+    name, shape, dtype = handle
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype, buffer=shm.buf)
+
+# per-worker state, set once by _initworker
+_worker = {}
+
+def _initworker(spec:dict, threads:int):
+    """attach a worker to the shared tables and rebuild the delay models over them"""
+    set_backend(spec['backend'])
+    set_num_threads(threads)
+    blocks = []
+    def view(handle):
+        if handle is None: return None
+        shm, arr = _attach(handle)
+        blocks.append(shm)
+        return arr
+
+    def model(m):
+        if m['kind'] == DelayModel.TABLE: return tabledelays(view(m['tabs']))
+        if m['kind'] == DelayModel.GRID: return griddelays(view(m['tabs']), view(m['index']), m['step'], m['N'])
+        if m['kind'] == DelayModel.SPHERICAL: return sphericaldelays(m['refs'], m['c'])
+        return planedelays(m['refs'], m['norms'], m['trefs'], m['c'])
+
+    aperture = None if spec['aperture'] is None else tuple(view(h) for h in spec['aperture'])
+    _worker.update(blocks=blocks, tx=model(spec['tx']), rx=model(spec['rx']), points=view(spec['points']),
+                   aperture=aperture, nkernel=spec['nkernel'], lags=spec['lags'], apod=spec['apod'], part=spec['part'],
+                   txgroups=spec['txgroups'], order=None if spec['order'] is None else view(spec['order']), tile=spec['tile'])
+
+def _runframe(task):
+    """process one frame or rotation into its row of the shared output"""
+    i, source, outhandle, fs, tstart, fc = task
+    outshm, out = _attach(outhandle)
+    datashm = frames = None
+    try:
+        if isinstance(source, InterRFDataSet):
+            data = source[i]
+        else:
+            datashm, frames = _attach(source)
+            data = frames[i]
+        slscFused(data, _worker['tx'], _worker['rx'], fs, tstart, _worker['nkernel'], _worker['lags'],
+                  points=_worker['points'], aperture=_worker['aperture'], apod=_worker['apod'], out=out[i],
+                  fc=fc, part=_worker['part'], txgroups=_worker['txgroups'], order=_worker['order'], tile=_worker['tile'])
+    finally:
+        # drop the views before closing the blocks they point into
+        data = frames = out = None
+        if datashm is not None: datashm.close()
+        outshm.close()
+    return i
+
+class SLSCPool():
+    def __init__(self, proc:SLSCProc, nworkers:int|None=None, threads:int=1, context:str|None=None):
+        """Initialize a process pool that runs an SLSC processor over independent frames or rotations
+
+        The delay tables of proc are built once here and shared with every worker, so the workers never
+        rebuild or copy them.
+
+        Parameters:
+        ----
+        proc: the processor whose geometry, tables, lags, and aperture every frame shares
+        nworkers: number of worker processes. Defaults to the number of cpus divided by threads
+        threads: OpenMP threads used by each worker
+        context: multiprocessing start method, e.g. 'fork' or 'spawn'. Defaults to the platform default
+        """
+        if threads < 1: raise ValueError("threads must be at least 1")
+        if nworkers is None: nworkers = max(1, (os.cpu_count() or 1) // threads)
+        if nworkers < 1: raise ValueError("nworkers must be at least 1")
+        self.proc = proc
+        self.nworkers = int(nworkers)
+        self.threads = int(threads)
+        self.__blocks__ = []
+
+        spec = dict(tx=self._export(proc.tx.delays()), rx=self._export(proc.rx.delays()), points=self._put(proc.points),
+                    aperture=None if proc.aperture is None else tuple(self._put(a) for a in proc.aperture),
+                    nkernel=proc.nkernel, lags=proc.lags, apod=proc.apod, part=proc.part, txgroups=proc.txgroups,
+                    order=None if proc.order is None else self._put(proc.order), tile=proc.tile, backend=get_backend())
+        self.__pool__ = mp.get_context(context).Pool(self.nworkers, initializer=_initworker, initargs=(spec, self.threads))
+
+    def _put(self, arr):
+        """share an array for the lifetime of the pool"""
+        shm, handle = _share(arr)
+        self.__blocks__.append(shm)
+        return handle
+
+    def _export(self, model:DelayModel):
+        """picklable description of a delay model, with its tables in shared memory"""
+        m = dict(kind=model.kind, N=model.N, c=model.c, step=model.step)
+        if model.kind in (DelayModel.TABLE, DelayModel.GRID): m['tabs'] = self._put(model._tabs)
+        if model.kind == DelayModel.GRID: m['index'] = self._put(model._index)
+        if model.kind in (DelayModel.SPHERICAL, DelayModel.PLANE): m['refs'] = model._refs
+        if model.kind == DelayModel.PLANE: m.update(norms=model._norms, trefs=model._trefs)
+        return m
+
+    def map(self, frames, fs:float|None=None, tstart:float|None=None, out=None, fc:float|None=None):
+        """Process every frame of a stack, or every rotation of a dataset, across the pool
+
+        Parameters:
+        ----
+        frames: F by Ntx by Nrx by Nsamp RF frames, copied once into shared memory, or an opened InterRFDataSet
+            whose file each worker memory-maps itself and reads one rotation at a time
+        fs: sampling frequency in Hz. Required for frame stacks, taken from the time axis of a dataset
+        tstart: time of the first sample in s. Defaults to 0 for frame stacks and the time axis of a dataset
+        out: optional caller-owned F by P float32 array to write into
+        fc: demodulation frequency in Hz, required for complex IQ frames or datasets
+
+        Returns:
+        ----
+        slsc: F by P float32 array holding the SLSC image of each frame or rotation
+        """
+        if isinstance(frames, InterRFDataSet):
+            t = frames.axes_out['t']
+            if fs is None: fs = 1/t['delta']
+            if tstart is None: tstart = t['start']
+            nframes, source, datashm = frames.nrot, frames, None
+        else:
+            if np.ndim(frames) != 4: raise ValueError("frames must be 4D (F by Ntx by Nrx by Nsamp)")
+            if fs is None: raise ValueError("fs is required for frame stacks")
+            if tstart is None: tstart = 0
+            nframes = np.shape(frames)[0]
+            datashm, source = _share(frames)
+
+        outshm, outhandle = _share(np.zeros((nframes, self.proc.Np), np.float32))
+        try:
+            tasks = [(i, source, outhandle, float(fs), float(tstart), None if fc is None else float(fc)) for i in range(nframes)]
+            for _ in self.__pool__.imap_unordered(_runframe, tasks): pass
+            result = np.ndarray((nframes, self.proc.Np), np.float32, buffer=outshm.buf)
+            if out is None: out = result.copy()
+            else: out[...] = result
+            result = None
+        finally:
+            for shm in (outshm, datashm):
+                if shm is None: continue
+                shm.close()
+                shm.unlink()
+        return out
+
+    def close(self):
+        """stop the workers and release the shared tables"""
+        self.__pool__.close()
+        self.__pool__.join()
+        for shm in self.__blocks__:
+            shm.close()
+            shm.unlink()
+        self.__blocks__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,11 +1,19 @@
 """SLSC processing wrapper for a given acq"""
 import ctypes as ct
-from cinpy import copy2c, free
 import numpy as np
-from pyrho.trig import c_norm_engine, c_pw_engine
+from pyrho.cbuf import asfloat32
+from pyrho.instrument import stage, staged
+from pyrho.trig import c_norm_batch, c_pw_batch, c_norm_grid, getaperture
+from pyrho.rho import slscFused, slscSums, slscSweep, fusedworksize, coherencemetrics, METRICS, tabledelays, griddelays, sphericaldelays, planedelays
+from pyrho.processors.cache import TableCache
+from pyrho.processors.workspace import Workspace
+from pyrho.processors.tiling import autotile, tileorder
 
 from abc import ABC, abstractmethod
 
+# default memory budget, in bytes, for the delay tables SLSCProc stores before falling back to on-the-fly delays
+TABLE_BUDGET = 2**30
+
 class DataAxis(dict):
     @classmethod
     @abstractmethod
@@ -38,8 +46,8 @@ class DataAxisSet(dict):
         dict.__init__(self)
         labels = []
         shape = []
-        for key, item in kwargs:
-            if not issubclass(DataAxis): raise ValueError("All inputs to DataAxisSet must be of type DataAxis")
+        for key, item in kwargs.items():
+            if not isinstance(item, DataAxis): raise ValueError("All inputs to DataAxisSet must be of type DataAxis")
             if (key in self.keys()): raise KeyError("Each key must be unique")
             self[key] = item
             labels.append(key)
@@ -88,8 +96,23 @@ class RawDataSet(ABC):
         raise NotImplementedError
     
 class InterRFDataSet(RawDataSet):
-    def __init__(self, nrot:int, nang:int, nele:int, nsamp:int, dphi, dalpha, Ts, tstart, alpha0=None, phi0=None):
-        """Initialize the InterRFDataSet with given number of rotations, steering angles, elements, and samples with associated sampling periods"""
+    def __init__(self, nrot:int, nang:int, nele:int, nsamp:int, dphi, dalpha, Ts, tstart, alpha0=None, phi0=None, 
+                 path:str|None=None, dtype=np.int16, offset:int=0, order=('rot', 'steer', 't', 'ele')):
+        """Initialize the InterRFDataSet with given number of rotations, steering angles, elements, and samples with associated sampling periods
+        
+        Parameters:
+        ----
+        nrot, nang, nele, nsamp: number of rotations, steering angles, elements, and samples per trace
+        dphi, dalpha: rotation and steering angle increments
+        Ts: sampling period in s
+        tstart: time of the first sample in s
+        alpha0, phi0: first steering angle and rotation. Default to a centered steering sweep and 0 rotation
+        path: optional raw acquisition file to memory-map, see open
+        dtype: datatype of the raw samples
+        offset: number of header bytes before the first sample
+        order: the four output axes in the order they are stored in the raw file, slowest first. The default 
+            stores the elements interleaved sample by sample
+        """
         # define the 4 axis of the total transformed dataset
         if phi0 is None: phi0 = 0
         rot = SampledDataAxis(phi0, dphi, nrot)
@@ -107,18 +130,81 @@ class InterRFDataSet(RawDataSet):
         # Store the axis sets
         self.axes_in = DataAxisSet(samples=samples)
         self.axes_out = DataAxisSet(rot=rot, steer=steer, ele=ele, t=t)
+        if sorted(order) != sorted(self.axes_out.labels): raise ValueError(f"order must be a permutation of {self.axes_out.labels}")
+        self.order = tuple(order)
+        self.dtype = np.dtype(dtype)
+        self.path = None
+        self.offset = 0
         self.__data__ = None
 
-    def __getitem__(self, sel):
-        print(sel)
-        pass
+        if path is not None: self.open(path, offset)
+
+    def open(self, path:str, offset:int=0):
+        """memory-map a raw acquisition file read-only, nothing is read until a view of it is used
+        
+        Parameters:
+        ----
+        path: the raw acquisition file, holding nrot*nang*nele*nsamp samples of self.dtype in self.order
+        offset: number of header bytes before the first sample
+        """
+        self.__data__ = np.memmap(path, dtype=self.dtype, mode='r', offset=offset, shape=(self.axes_in.shape[0],))
+        self.path = path
+        self.offset = offset
+
+    def __getstate__(self):
+        # pickle the file location rather than the samples, so worker processes map the file themselves
+        state = self.__dict__.copy()
+        state['__data__'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.path is not None: self.open(self.path, self.offset)
 
     def transform(self, data):
-        print(type(data))
-        pass
+        """reinterpret flat interleaved samples as a zero-copy (rot, steer, ele, t) view
+        
+        Parameters:
+        ----
+        data: flat array or memmap holding nrot*nang*nele*nsamp samples stored in self.order
+
+        Returns:
+        ----
+        view: strided 4D view of data, no samples are copied
+        """
+        data = np.asarray(data)
+        if data.size != self.axes_in.shape[0]: raise ValueError(f"data must hold {self.axes_in.shape[0]} samples")
+
+        # reshape in storage order, then permute the strides into the output order
+        stored = data.reshape(tuple(self.axes_out[label]['N'] for label in self.order))
+        return stored.transpose(tuple(self.order.index(label) for label in self.axes_out.labels))
+
+    def __getitem__(self, sel):
+        """basic-index the (rot, steer, ele, t) view, e.g. ds[irot] or ds[irot, isteer], without copying"""
+        return self.data()[sel]
 
     def data(self, type='numpy'):
-        pass
+        """the whole dataset as a zero-copy (rot, steer, ele, t) view of the memory-mapped file"""
+        if type != 'numpy': raise ValueError("Only 'numpy' data is currently supported")
+        if self.__data__ is None: raise ValueError("No acquisition file has been opened")
+        return self.transform(self.__data__)
+
+    def chunks(self, nrot:int=1):
+        """stream the dataset a few rotations at a time, only the pages of the current chunk are read
+
+        Parameters:
+        ----
+        nrot: number of rotations per chunk
+
+        Yields:
+        ----
+        irot: index of the first rotation of the chunk
+        chunk: zero-copy (rot, steer, ele, t) view of rotations irot through irot+nrot-1
+        """
+        if nrot < 1: raise ValueError("nrot must be at least 1")
+        view = self.data()
+        for irot in range(0, self.nrot, nrot):
+            yield irot, view[irot:irot+nrot]
 
 class TXType(ABC):
     @classmethod
@@ -126,6 +212,18 @@ class TXType(ABC):
     def gentabs(self, points):
         raise NotImplementedError
     
+    @classmethod
+    @abstractmethod
+    def delays(self):
+        """DelayModel for the fused kernels, reading the tables in 'table' mode or recomputing delays in 'otf' mode"""
+        raise NotImplementedError
+    
+    @classmethod
+    @abstractmethod
+    def tabbytes(self, points):
+        """number of bytes the delay tables take for a P by 3 matrix of points"""
+        raise NotImplementedError
+    
     @classmethod
     @abstractmethod
     def c_gentabs(self, points, Np:int):
@@ -135,6 +233,11 @@ class TXType(ABC):
     @abstractmethod
     def cleartabs(self):
         raise NotImplementedError
+
+    def sweepdelays(self):
+        """(DelayModel, offsets, c) of delays() for speed of sound sweeps: the delays in s that do not scale with the 
+        speed of sound, None for 0, and the speed of sound c in m/s the rest of the delays are taken at"""
+        raise ValueError(f"{type(self).__name__} does not describe its geometry, so it cannot be swept over speeds of sound")
     
 class RXType(ABC):
     @classmethod
@@ -142,6 +245,18 @@ class RXType(ABC):
     def gentabs(self, points):
         raise NotImplementedError
     
+    @classmethod
+    @abstractmethod
+    def delays(self):
+        """DelayModel for the fused kernels, reading the tables in 'table' mode or recomputing delays in 'otf' mode"""
+        raise NotImplementedError
+    
+    @classmethod
+    @abstractmethod
+    def tabbytes(self, points):
+        """number of bytes the delay tables take for a P by 3 matrix of points"""
+        raise NotImplementedError
+    
     @classmethod
     @abstractmethod
     def c_gentabs(self, points, Np:int):
@@ -151,80 +266,134 @@ class RXType(ABC):
     @abstractmethod
     def cleartabs(self):
         raise NotImplementedError
+
+    def sweepdelays(self):
+        """(DelayModel, offsets, c) of delays() for speed of sound sweeps: the delays in s that do not scale with the 
+        speed of sound, None for 0, and the speed of sound c in m/s the rest of the delays are taken at"""
+        raise ValueError(f"{type(self).__name__} does not describe its geometry, so it cannot be swept over speeds of sound")
     
 class FullRX(RXType):
-    def __init__(self, xrefs, c=1540, dtype=ct.c_float):
+    def __init__(self, xrefs, c=1540, dtype=ct.c_float, cache:TableCache|None=None, grid:bool|None=None):
+        """Full receive aperture with one delay per element and point
+
+        Parameters:
+        ----
+        xrefs: Nrx by 3 matrix of element positions in m
+        c: speed of sound in m/s
+        dtype: ctypes datatype - only currently supported option is ctype.c_float
+        cache: optional TableCache to look full tables up in
+        grid: whether to store the delays as one base table on a rectilinear grid with evenly spaced elements. 
+            If None (default), the grid storage is used whenever the elements and points allow it
+        """
         # vaidate the inputs are valid shapes
         if np.ndim(xrefs) != 2: raise ValueError("xrefs must be 2D")
         if xrefs.shape[1] != 3: raise ValueError("xrefs must be Nacq by 3")
+        if dtype is not ct.c_float: raise ValueError("Only ctypes.c_float is currently supported")
         self.Nrx = xrefs.shape[0]
 
-        # copy attributes and convert data to lists of ctypes
-        self.xrefs = [ct.cast((dtype * 3)(*[dtype(x) for x in xrefs[irx][:]]), ct.POINTER(dtype))
-                      for irx in range(self.Nrx)]
+        # copy attributes as float32 arrays the kernels can read directly
+        self.xrefs = np.array(xrefs, dtype=np.float32)
         self.c = c
         self.dtype = dtype
+        self.cache = cache
+        self.grid = grid
 
-        # initialize and fill RXtabs
+        # initialize and fill RXtabs or GRIDtabs, or recompute delays on the fly in 'otf' mode
+        self.mode = 'table'
         self.RXtabs = None
-
+        self.GRIDtabs = None
+        self.Np = None
+        self.workspace = Workspace()
+        self.__gridof__ = (None, None)
+        self.__model__ = None
+
+    def _gridtabs(self, points):
+        """(base, index, step) grid tables of the points, or None if they are disabled or do not apply"""
+        if self.grid is False: return None
+        if self.__gridof__[0] is not points:
+            self.__gridof__ = (points, c_norm_grid(self.xrefs, points, self.c))
+        if (self.grid is True) and (self.__gridof__[1] is None):
+            raise ValueError("The elements and points are not an evenly spaced line and rectilinear grid")
+        return self.__gridof__[1]
+
+    @staged('FullRX.gentabs')
     def gentabs(self, points):
-        if self.RXtabs is not None:
-            self.cleartabs()
-        
         if np.ndim(points) != 2: raise ValueError("points matrix must be 2D")
         if points.shape[1] != 3: raise ValueError("points matrix must be P by 3")
 
+        # a single base table holds every delay on structured grids
+        gridtabs = self._gridtabs(points)
+        if gridtabs is not None:
+            self.cleartabs()
+            self.Np = points.shape[0]
+            self.GRIDtabs = gridtabs
+            return
+
+        # look the tables up by geometry, the cached arrays are shared so they are never written in place
+        points = asfloat32(points)
+        self.GRIDtabs = None
+        self.__model__ = None
         self.Np = points.shape[0]
+        if self.cache is not None:
+            key = TableCache.key('fullrx', self.xrefs, points, c=float(self.c), dtype='float32')
+            self.RXtabs = self.cache.fetch(key, lambda: c_norm_batch(self.xrefs, points, self.c))
+            return
 
-        c_points, Mp, Np = copy2c(points)
+        # the table buffer only grows, so fields of view of the same or fewer points reuse it
+        self.RXtabs = self.workspace.get('RXtabs', (self.Nrx, self.Np))
+        c_norm_batch(self.xrefs, points, self.c, out=self.RXtabs)
 
-        self.RXtabs = []
-        for itx in range(self.Nrx):
-            tabs = c_norm_engine(
-                self.xrefs[itx],
-                c_points,
-                Mp.value,
-                self.c,
-                self.dtype
-            )
-            self.RXtabs.append(tabs)
-
-        free(c_points, Mp, Np)
-
-    def c_gentabs(self, c_points, Np:int):
-        if self.RXtabs is not None:
-            self.cleartabs()
-
-        self.Np = Np
-
-        self.RXtabs = []
-        for itx in range(self.Nrx):
-            tabs = c_norm_engine(
-                self.xrefs[itx],
-                c_points,
-                Np,
-                self.c,
-                self.dtype
-            )
-            self.RXtabs.append(tabs)
+    def c_gentabs(self, points, Np:int):
+        if points.shape[0] != Np: raise ValueError("Np must match the number of points")
+        self.gentabs(points)
     
     def cleartabs(self):
-        if self.RXtabs is not None:
-            for tabs in self.RXtabs:
-                free(tabs, ct.c_int(self.Np))
-            self.TXtabs = None
-            self.Np = None
+        self.RXtabs = None
+        self.GRIDtabs = None
+        self.Np = None
+        self.__model__ = None
+        self.workspace.release()
+
+    def fulltabs(self):
+        """Nrx by Np matrix of every delay, expanded from the grid tables if those are stored"""
+        if self.GRIDtabs is not None:
+            base, index, step = self.GRIDtabs
+            return base[index[np.newaxis,:] + step*np.arange(self.Nrx)[:,np.newaxis]]
+        return self.RXtabs
+
+    def delays(self):
+        # the model is built once per set of tables and mode, not on every call
+        if (self.__model__ is not None) and (self.__model__[0] == self.mode): return self.__model__[1]
+        if self.mode == 'otf':
+            model = sphericaldelays(self.xrefs, self.c)
+        elif self.GRIDtabs is not None:
+            model = griddelays(*self.GRIDtabs, self.Nrx)
+        elif self.RXtabs is None:
+            raise ValueError("gentabs must be called before the tables can be used")
+        else:
+            model = tabledelays(self.RXtabs)
+        self.__model__ = (self.mode, model)
+        return model
+
+    def sweepdelays(self):
+        """(DelayModel, None, c) of delays(), which all scale with the speed of sound, for speed of sound sweeps"""
+        return self.delays(), None, float(self.c)
+
+    def tabbytes(self, points):
+        gridtabs = self._gridtabs(points)
+        if gridtabs is not None: return gridtabs[0].nbytes + gridtabs[1].nbytes
+        return 4 * self.Nrx * int(np.shape(points)[0])
 
     def __del__(self):
         # clear all tabs if any exists
-        self.cleartabs()
+        if hasattr(self, 'workspace'): self.cleartabs()
 
 class PWTX(TXType):
-    def __init__(self, alphas, xrefs, trefs, betas=None, c=1540, dtype=ct.c_float):
+    def __init__(self, alphas, xrefs, trefs, betas=None, c=1540, dtype=ct.c_float, cache:TableCache|None=None):
         # vaidate the inputs are valid shapes
         if np.ndim(xrefs) != 2: raise ValueError("xrefs must be 2D")
         if xrefs.shape[1] != 3: raise ValueError("xrefs must be Nacq by 3")
+        if dtype is not ct.c_float: raise ValueError("Only ctypes.c_float is currently supported")
         self.Ntx = xrefs.shape[0]
         if betas is None: betas = np.zeros(self.Ntx)
         if np.ndim(alphas) != 1: raise ValueError("alphas must be a 1D vector")
@@ -234,83 +403,91 @@ class PWTX(TXType):
         if len(betas) != self.Ntx: raise ValueError("betas must have the same length as xrefs")
         if len(trefs) != self.Ntx: raise ValueError("trefs must have the same length as xrefs")
 
-        # initialize and fill TXtabs
+        # initialize and fill TXtabs, or recompute delays on the fly in 'otf' mode
+        self.mode = 'table'
         self.TXtabs = None
         self.Np = None
-
-        # copy attributes and convert data to lists of ctypes
-        self.norms = [ct.cast((dtype * 3)(
-                        np.sin(alpha), 
-                        np.cos(alpha)*np.cos(beta), 
-                        np.sin(beta)), ct.POINTER(dtype))
-                      for alpha, beta in zip(alphas, betas)]
-        self.xrefs = [ct.cast((dtype * 3)(*[dtype(x) for x in xrefs[itx][:]]), ct.POINTER(dtype))
-                      for itx in range(self.Ntx)]
-        self.trefs = [dtype(tref) for tref in trefs]
+        self.workspace = Workspace()
+        self.__model__ = None
+
+        # copy attributes as float32 arrays the kernels can read directly. Waves travel along +z (depth), steered 
+        # by alpha in the x-z plane and by beta in the y-z plane
+        self.norms = np.array([[np.sin(alpha)*np.cos(beta), np.sin(beta), np.cos(alpha)*np.cos(beta)] 
+                               for alpha, beta in zip(alphas, betas)], dtype=np.float32)
+        self.xrefs = np.array(xrefs, dtype=np.float32)
+        self.trefs = np.array(trefs, dtype=np.float32)
         self.c = c
         self.dtype = dtype
+        self.cache = cache
 
+    @staged('PWTX.gentabs')
     def gentabs(self, points):
-        if self.TXtabs is not None:
-            self.cleartabs()
-        
         if np.ndim(points) != 2: raise ValueError("points matrix must be 2D")
         if points.shape[1] != 3: raise ValueError("points matrix must be P by 3")
+
+        # look the tables up by geometry, the cached arrays are shared so they are never written in place
+        points = asfloat32(points)
+        self.__model__ = None
         self.Np = points.shape[0]
-        c_points, Mp, Np = copy2c(points)
-
-        self.TXtabs = []
-        for itx in range(self.Ntx):
-            tabs = c_pw_engine(
-                self.xrefs[itx],
-                self.trefs[itx],
-                self.norms[itx],
-                c_points,
-                Mp.value,
-                self.c,
-                self.dtype
-            )
-            self.TXtabs.append(tabs)
-
-        free(c_points, Mp, Np)
-
-    def c_gentabs(self, c_points, Np:int):
-        if self.TXtabs is not None:
-            self.cleartabs()
+        if self.cache is not None:
+            key = TableCache.key('pwtx', self.xrefs, self.norms, self.trefs, points, c=float(self.c), dtype='float32')
+            self.TXtabs = self.cache.fetch(key, lambda: c_pw_batch(self.xrefs, self.trefs, self.norms, points, self.c))
+            return
 
-        self.Np = Np
-
-        self.TXtabs = []
-        for itx in range(self.Ntx):
-            tabs = c_pw_engine(
-                self.xrefs[itx],
-                self.trefs[itx],
-                self.norms[itx],
-                c_points,
-                Np,
-                self.c,
-                self.dtype
-            )
-            self.TXtabs.append(tabs)
+        # the table buffer only grows, so fields of view of the same or fewer points reuse it
+        self.TXtabs = self.workspace.get('TXtabs', (self.Ntx, self.Np))
+        c_pw_batch(self.xrefs, self.trefs, self.norms, points, self.c, out=self.TXtabs)
+
+    def c_gentabs(self, points, Np:int):
+        if points.shape[0] != Np: raise ValueError("Np must match the number of points")
+        self.gentabs(points)
     
     def cleartabs(self):
-        if self.TXtabs is not None:
-            for tabs in self.TXtabs:
-                free(tabs, ct.c_int(self.Np))
-            self.TXtabs = None
-            self.Np = None
+        self.TXtabs = None
+        self.Np = None
+        self.__model__ = None
+        self.workspace.release()
+
+    def delays(self):
+        # the model is built once per set of tables and mode, not on every call
+        if (self.__model__ is not None) and (self.__model__[0] == self.mode): return self.__model__[1]
+        if self.mode == 'otf':
+            model = planedelays(self.xrefs, self.norms, self.trefs, self.c)
+        elif self.TXtabs is None:
+            raise ValueError("gentabs must be called before the tables can be used")
+        else:
+            model = tabledelays(self.TXtabs)
+        self.__model__ = (self.mode, model)
+        return model
+
+    def sweepdelays(self):
+        """(DelayModel, trefs, c) of delays(), whose reference delays trefs do not scale with the speed of sound, for 
+        speed of sound sweeps"""
+        return self.delays(), self.trefs, float(self.c)
+
+    def tabbytes(self, points):
+        return 4 * self.Ntx * int(np.shape(points)[0])
 
     def __del__(self):
         # clear all tabs if any exists
-        self.cleartabs()
+        if hasattr(self, 'workspace'): self.cleartabs()
 
 class SLSCProc():
+    @staged('SLSCProc.init')
     def __init__(self, c, points, 
                  tx:TXType,
                  rx:RXType,
                  lags:list|int=1, 
                  fnum:list|float|None=None,
                  fnorm:list|np.ndarray|None=None,
+                 nkernel:int=5,
+                 apod:str|None=None,
+                 tabmode:str='auto',
+                 membudget:int|None=None,
+                 part:str='real',
+                 compound='before',
+                 tiling:str|None=None,
+                 tile:int|None=None,
                  dtype=ct.c_float, **kwargs):
         """Initialize a SLSC processor. 
         Define the speed of sound, the 3D points to be reconstructed, the effective fnumber(s) and relative axis(axes)
@@ -320,26 +497,221 @@ class SLSCProc():
         c: the assumed speed of sound in the medium in m/s
         tx: the transmit object
         points: a P by 3 matrix where each row represents the spatial coordinates of a reconstruction point in m
-        lags: list of lag indices to integrate over
+        lags: list of lag indices to integrate over, or the maximum lag Q for lags 1 through Q. With fnum, lags as wide 
+            as a point's active aperture or wider have no pairs and are skipped, so shallow points with narrow 
+            apertures sum fewer lags than deep ones and SLSC brightness then depends on depth. Keep Q below the 
+            narrowest aperture of interest, or normalize by the number of lags each point sums
         fnum: fnumber(s) to use when reconstructucting effective apertures. If None (default), will use all channels for all points.
-        fnorm: normal vectors
+            Requires the elements of rx to lie in order along one line, see pyrho.trig.getaperture
+        fnorm: normal vectors of the aperture axes, one per fnumber. Defaults to the x axis
+        nkernel: length of the axial kernel in samples of the data, centered on each point. IQ data decimated by D 
+            covers the same depth with about nkernel/D samples
+        apod: window across each point's active aperture, None or 'rect' (default), 'hann', or 'hamming'
+        tabmode: 'table' to store the TX and RX delay tables, 'otf' to recompute every delay inside the kernel, 
+            or 'auto' (default) to store whichever tables fit in membudget, smallest first
+        membudget: bytes allowed for delay tables in 'auto' mode, defaults to TABLE_BUDGET
+        part: for complex IQ data, 'real' (default) or 'abs' to keep the real part or the magnitude of each pair's 
+            normalized complex correlation
+        compound: how the transmits, e.g. the angles of a PWTX, are combined. 'before' (default) compounds every
+            transmit coherently before the coherence is taken, 'after' averages the coherence of each transmit, and
+            a sequence of groups of transmit indices compounds each group and averages the coherence over the 
+            groups. Each point's compounded channels are the only channel buffer held, whatever the number of angles
+        tiling: None (default) to process the points in the order given, or 'morton' or 'depth' to visit them in 
+            spatially compact tiles that share their RF samples in cache, see pyrho.processors.tiling. The images 
+            are in the order of points either way
+        tile: the number of points per tile, each thread's unit of work. Defaults to 64 without tiling, and to 
+            pyrho.processors.tiling.autotile, sized to the cache, with tiling
         """
 
         # check that the correct transmission parameters are included
         self.tx = tx
         self.rx = rx
         self.c = dtype(c)
-        self.points, self.c_Npoints, _ = copy2c(points)
+        if np.ndim(points) != 2: raise ValueError("points matrix must be 2D")
+        if np.shape(points)[1] != 3: raise ValueError("points matrix must be P by 3")
+        if nkernel < 1: raise ValueError("nkernel must be at least 1")
+        self.points = asfloat32(points)
+        self.Np = self.points.shape[0]
         self.lags = lags
         self.fnum = fnum
         self.fnorm = fnorm
+        self.nkernel = int(nkernel)
+        self.apod = apod
+        if part not in ('real', 'abs'): raise ValueError("part must be 'real' or 'abs'")
+        self.part = part
+        self.compound = compound
+        self.txgroups = self._txgroups(compound)
         self.dtype = dtype
 
-        self.tx.c_gentabs(self.points, self.c_Npoints.value)
-        self.rx.c_gentabs(self.points, self.c_Npoints.value)
+        # order the kernels visit the points in, as tiles of spatially compact points
+        if (tile is not None) and (tile < 1): raise ValueError("tile must be at least 1")
+        self.tiling = tiling
+        if tiling is None:
+            self.tile = 0 if tile is None else int(tile)
+            self.order = None
+        else:
+            self.tile = autotile(self.tx.Ntx, self.rx.Nrx, self.nkernel, self.Np) if tile is None else int(tile)
+            with stage('SLSCProc.tiling', self.Np):
+                self.order = tileorder(self.points, tiling, self.tile)
+
+        # kernel scratch and accumulators reused from call to call, one set per calling thread
+        self.workspace = Workspace(perthread=True)
+
+        # dynamic receive aperture of each point, stored as element ranges
+        if fnum is None:
+            self.aperture = None
+        else:
+            if not hasattr(rx, 'xrefs'): raise ValueError("fnum requires a receive object with element positions (xrefs)")
+            with stage('SLSCProc.aperture', self.Np):
+                self.aperture = getaperture(rx.xrefs, self.points, fnum, fnorm)
+
+        # pick between stored tables and on-the-fly delays
+        if tabmode not in ('auto', 'table', 'otf'): raise ValueError("tabmode must be 'auto', 'table', or 'otf'")
+        if membudget is None: membudget = TABLE_BUDGET
+        self.membudget = membudget
+        budget = membudget
+        for trx in sorted((self.tx, self.rx), key=lambda trx: trx.tabbytes(self.points)):
+            if (tabmode == 'table') or ((tabmode == 'auto') and (trx.tabbytes(self.points) <= budget)):
+                trx.mode = 'table'
+                budget -= trx.tabbytes(self.points)
+            else:
+                trx.mode = 'otf'
+
+        with stage('SLSCProc.tables', self.Np):
+            for trx in (self.tx, self.rx):
+                if trx.mode == 'table':
+                    trx.gentabs(self.points)
+                else:
+                    trx.cleartabs()
+
+    def _txgroups(self, compound):
+        """the groups of transmits compounded together for a compound option, None to compound them all"""
+        if isinstance(compound, str):
+            if compound == 'before': return None
+            if compound == 'after': return tuple((itx,) for itx in range(self.tx.Ntx))
+            raise ValueError("compound must be 'before', 'after', or a sequence of groups of transmit indices")
+        groups = tuple(tuple(int(itx) for itx in np.atleast_1d(group)) for group in compound)
+        if (len(groups) == 0) or any(len(group) == 0 for group in groups): raise ValueError("every group of compound must hold a transmit")
+        if any((itx < 0) or (itx >= self.tx.Ntx) for group in groups for itx in group):
+            raise ValueError("compound groups must only hold transmits between 0 and Ntx-1")
+        return groups
+
+    def __call__(self, data, fs:float, tstart:float=0, out=None, fc:float|None=None):
+        """Process a raw 3D data tensor (Ntx by Nrx by Nsamp)
+        
+        Parameters:
+        ----
+        data: Ntx by Nrx by Nsamp RF data, read in place if float32, int16 or float16, or complex IQ data from
+            pyrho.rho.demodIQ, read in place if complex64
+        fs: sampling frequency of data in Hz, the decimated rate for IQ data
+        tstart: time of the first sample in s
+        out: optional caller-owned float32 vector of length P to write into
+        fc: demodulation frequency of IQ data in Hz, required for complex data
+
+        Returns:
+        ----
+        slsc: float32 vector of length P holding the SLSC value of each point in self.points
+        """
+        if np.ndim(data) != 3: raise ValueError("Input data must be 3D (Ntx by Nrx by Nsamp)")
+        if data.shape[0] != self.tx.Ntx: raise ValueError("Input data must have one transmit per row of the tx tables")
+        if data.shape[1] != self.rx.Nrx: raise ValueError("Input data must have one channel per row of the rx tables")
+
+        with stage('SLSCProc.call', self.Np):
+            with stage('SLSCProc.delays'):
+                tx, rx = self.tx.delays(), self.rx.delays()
+            work = self.workspace.get('work', fusedworksize(data.shape, self.nkernel, np.iscomplexobj(data)))
+            return slscFused(data, tx, rx, fs, tstart, self.nkernel, self.lags, points=self.points, aperture=self.aperture, 
+                             apod=self.apod, out=out, fc=fc, part=self.part, work=work, txgroups=self.txgroups, order=self.order, 
+                             tile=self.tile)
+
+    def images(self, data, fs:float, tstart:float=0, metrics=METRICS, m0:int=1, weights=None, out=None):
+        """Process a raw 3D data tensor into several coherence images with a single pass over the channel data
+        
+        Parameters:
+        ----
+        data: Ntx by Nrx by Nsamp RF data, read in place if float32, int16 or float16
+        fs: sampling frequency of data in Hz
+        tstart: time of the first sample in s
+        metrics: names of the images to form, any of 'slsc', 'cf', 'gcf', and 'lwslsc', see pyrho.rho.coherencemetrics
+        m0: the highest spatial frequency index of the generalized coherence factor
+        weights: optional length L vector of lag weights for 'lwslsc'. Defaults to the image-wide coherence of each lag
+        out: optional dict mapping any of the metrics to a caller-owned float32 vector of length P to write into. 
+            The accumulators live in self.workspace, so with every image supplied no array of P values is allocated
+
+        Returns:
+        ----
+        images: dict mapping each requested metric to a float32 vector of length P, averaged over the groups of 
+            transmits for compound options other than 'before'
+        """
+        if np.ndim(data) != 3: raise ValueError("Input data must be 3D (Ntx by Nrx by Nsamp)")
+        if data.shape[0] != self.tx.Ntx: raise ValueError("Input data must have one transmit per row of the tx tables")
+        if data.shape[1] != self.rx.Nrx: raise ValueError("Input data must have one channel per row of the rx tables")
+
+        with stage('SLSCProc.images', self.Np):
+            with stage('SLSCProc.delays'):
+                tx, rx = self.tx.delays(), self.rx.delays()
+            L = int(self.lags) if np.ndim(self.lags) == 0 else int(np.size(self.lags))
+            bufs = dict(slsc=self.workspace.get('slsc', self.Np), rhos=self.workspace.get('rhos', (self.Np, L)), 
+                        spectrum=self.workspace.get('spectrum', (self.Np, m0+1)), energy=self.workspace.get('energy', self.Np))
+            work = self.workspace.get('work', fusedworksize(data.shape, self.nkernel))
+            sums = slscSums(data, tx, rx, fs, tstart, self.nkernel, self.lags, points=self.points, aperture=self.aperture, 
+                            apod=self.apod, m0=m0, out=bufs, work=work, txgroups=self.txgroups, order=self.order, tile=self.tile)
+
+            # images handed back must outlive the accumulators, which the next call overwrites
+            if isinstance(metrics, str): metrics = (metrics,)
+            out = {} if out is None else dict(out)
+            for metric in metrics:
+                if metric not in out: out[metric] = np.empty(self.Np, dtype=np.float32)
+            return coherencemetrics(sums, metrics, m0, weights, out=out)
+
+    def sweep(self, data, fs:float, speeds, tstart:float=0, out=None):
+        """SLSC of a raw 3D data tensor (Ntx by Nrx by Nsamp) at every point for each of a vector of speeds of sound
+
+        The delays of each point, read from the same tables or recomputed in 'otf' mode as in a call, are only 
+        rescaled per speed inside a single pass over the points, so no table beyond those of membudget is held, 
+        e.g. to pick the speed of sound that maximizes the lag-one coherence. self.c is left unchanged.
 
-    def __call__(self, data):
-        """Process a raw 3D data tensor (Ntx by Nrx by Nsamp)"""
-        if isinstance(data, np.ndarray):
-            if np.ndim(data) != 3: raise ValueError("Input data must be 3D (Ntx by Nrx by Nsamp)")
+        Parameters:
+        ----
+        data: Ntx by Nrx by Nsamp RF data, read in place if float32, int16 or float16
+        fs: sampling frequency of data in Hz
+        speeds: vector of the Nc speeds of sound in m/s
+        tstart: time of the first sample in s
+        out: optional caller-owned float32 Nc by P matrix to write into
 
+        Returns:
+        ----
+        slsc: float32 Nc by P matrix holding the SLSC value of each point in self.points at each speed
+        """
+        if np.ndim(data) != 3: raise ValueError("Input data must be 3D (Ntx by Nrx by Nsamp)")
+        if data.shape[0] != self.tx.Ntx: raise ValueError("Input data must have one transmit per row of the tx tables")
+        if data.shape[1] != self.rx.Nrx: raise ValueError("Input data must have one channel per row of the rx tables")
+
+        with stage('SLSCProc.sweep', self.Np):
+            with stage('SLSCProc.delays'):
+                (tx, txoff, txc), (rx, rxoff, rxc) = self.tx.sweepdelays(), self.rx.sweepdelays()
+            work = self.workspace.get('work', fusedworksize(data.shape, self.nkernel, sweep=True))
+            return slscSweep(data, tx, rx, fs, speeds, tstart, self.nkernel, self.lags, points=self.points, aperture=self.aperture,
+                             apod=self.apod, txoff=txoff, rxoff=rxoff, out=out, txgroups=self.txgroups, order=self.order, tile=self.tile,
+                             c=(txc, rxc), work=work)
+
+    def stream(self, dataset:InterRFDataSet, nrot:int=1, fc:float|None=None, out=None):
+        """Process a memory-mapped dataset one rotation at a time without loading the whole scan
+        
+        Parameters:
+        ----
+        dataset: an opened InterRFDataSet whose steering angles and elements match self.tx and self.rx
+        nrot: number of rotations paged in per chunk
+        fc: demodulation frequency in Hz, required for datasets of complex IQ samples
+        out: optional caller-owned float32 vector of length P that every rotation's image is written into, so 
+            each yielded image is only valid until the next one is produced
+
+        Yields:
+        ----
+        irot: rotation index
+        slsc: float32 vector of length P holding the SLSC value of each point for that rotation
+        """
+        t = dataset.axes_out['t']
+        for irot, chunk in dataset.chunks(nrot):
+            for i, rot in enumerate(chunk):
+                yield irot + i, self(rot, 1/t['delta'], t['start'], out=out, fc=fc)
@@ -0,0 +1,100 @@
+"""Orders that group the reconstruction points into spatially compact tiles, and the tile size to process them in
+
+Neighbouring points read nearly the same RF samples, so visiting the points of a tile one after the other keeps
+their sample windows in cache across every element. The fused kernels take such an order and a tile size, hand
+whole tiles to their threads, and still write every output at its point's index in the caller's order.
+"""
+import os
+
+import numpy as np
+
+# bytes of cache assumed per core when the platform does not report it
+DEFAULT_CACHE = 2**20
+
+# orders tileorder can build
+TILINGS = ('morton', 'depth')
+
+def cachesize():
+    """bytes of L2 cache of one core, DEFAULT_CACHE if the platform does not report it"""
+    try:
+        size = os.sysconf('SC_LEVEL2_CACHE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        size = 0
+    return int(size) if (size is not None) and (size > 0) else DEFAULT_CACHE
+
+def _ranks(points):
+    """P by 3 int64 matrix of the rank of each coordinate among the distinct values along its axis"""
+    points = np.asarray(points)
+    if (np.ndim(points) != 2) or (points.shape[1] != 3): raise ValueError("points must be P by 3")
+    return np.stack([np.unique(points[:,d], return_inverse=True)[1].ravel() for d in range(3)], axis=1).astype(np.int64)
+
+def _spread3(v):
+    """spread the low 21 bits of v two zero bits apart, so three spread values interleave into one Morton code"""
+    v = v & 0x1fffff
+    v = (v | (v << 32)) & 0x1f00000000ffff
+    v = (v | (v << 16)) & 0x1f0000ff0000ff
+    v = (v | (v << 8)) & 0x100f00f00f00f00f
+    v = (v | (v << 4)) & 0x10c30c30c30c30c3
+    v = (v | (v << 2)) & 0x1249249249249249
+    return v
+
+def mortonorder(points):
+    """int32 permutation visiting the points along a Morton (Z-order) curve over their grid
+
+    Every coordinate is replaced by its rank among the distinct values of its axis, so rectilinear grids of any
+    spacing map onto an integer lattice, and any aligned run of 4^n points of a 2D grid (8^n in 3D) is a square
+    (cube) of the grid. Scattered points are ordered by the same curve over the lattice of their ranks.
+    """
+    ranks = _ranks(points)
+    if np.any(ranks >= 2**21): raise ValueError("Morton order supports at most 2^21 distinct values per axis")
+    codes = _spread3(ranks[:,0]) | (_spread3(ranks[:,1]) << 1) | (_spread3(ranks[:,2]) << 2)
+    return np.argsort(codes, kind='stable').astype(np.int32)
+
+def depthorder(points, tile:int):
+    """int32 permutation visiting the points in depth-major strips of about sqrt(tile) lateral grid lines
+
+    The lateral (x, y) extent is cut into blocks of sqrt(tile) distinct positions per axis, and each block is
+    visited from shallow to deep, so any tile points in a row form a narrow strip a few samples deep.
+    """
+    if tile < 1: raise ValueError("tile must be at least 1")
+    ranks = _ranks(points)
+    width = max(1, int(round(np.sqrt(tile))))
+    return np.lexsort((ranks[:,1], ranks[:,0], ranks[:,2], ranks[:,1]//width, ranks[:,0]//width)).astype(np.int32)
+
+def autotile(Ntx:int, Nrx:int, nkernel:int, P:int|None=None, itemsize:int=4, cache:int|None=None, nthreads:int|None=None):
+    """largest power of two number of points whose RF samples fit in cache, for a spatially compact tile
+
+    A compact tile of n points spans about sqrt(n) grid lines in depth, taken here as one sample each, so its
+    points read about nkernel + sqrt(n) samples of each of the Ntx*Nrx traces. The tile is kept between 16 and
+    4096 points, and small enough to give every thread at least 4 tiles of the P points.
+
+    Parameters:
+    ----
+    Ntx, Nrx: the number of transmits and receive channels
+    nkernel: the length of the axial kernel in samples
+    P: the number of points, to leave every thread enough tiles. None to ignore
+    itemsize: bytes per sample of the data, 4 for float32, 2 for int16 or float16, 8 for complex64
+    cache: bytes of cache to fill, defaults to cachesize()
+    nthreads: threads sharing the points, defaults to pyrho.get_num_threads()
+
+    Returns:
+    ----
+    tile: the number of points per tile
+    """
+    if cache is None: cache = cachesize()
+    perspan = max(1, int(Ntx) * int(Nrx) * int(itemsize))
+    tile = 16
+    while (tile < 4096) and (perspan * (nkernel + np.sqrt(2*tile)) <= cache): tile *= 2
+
+    if P is not None:
+        if nthreads is None:
+            from pyrho.parallel import get_num_threads
+            nthreads = get_num_threads()
+        while (tile > 16) and (4 * nthreads * tile > P): tile //= 2
+    return int(tile)
+
+def tileorder(points, tiling:str='morton', tile:int=256):
+    """int32 permutation of the points into spatially compact tiles of tile points, see mortonorder and depthorder"""
+    if tiling not in TILINGS: raise ValueError(f"tiling must be one of {TILINGS}")
+    if tiling == 'morton': return mortonorder(points)
+    return depthorder(points, tile)
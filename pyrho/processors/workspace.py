@@ -0,0 +1,58 @@
+"""Reusable arena of NumPy buffers, so processors allocate once and reuse the memory from call to call"""
+import threading
+
+import numpy as np
+
+from pyrho.instrument import count
+
+class Workspace():
+    def __init__(self, perthread:bool=False):
+        """Initialize an empty arena of named buffers
+
+        Each name holds one block of bytes that only grows, so a request of the same or a smaller size, e.g.
+        after a smaller field of view, is served without allocating.
+
+        Parameters:
+        ----
+        perthread: if True, every thread gets its own blocks, so scratch buffers can be reused by calls made
+            from several threads at once
+        """
+        self.perthread = bool(perthread)
+        self.__local__ = threading.local()
+        self.__shared__ = {}
+
+    def _blocks(self):
+        if not self.perthread: return self.__shared__
+        if not hasattr(self.__local__, 'blocks'): self.__local__.blocks = {}
+        return self.__local__.blocks
+
+    def get(self, name:str, shape, dtype=np.float32):
+        """C-contiguous array of the given shape and dtype over the block of name, allocated only if it grows
+
+        The contents are left over from the previous use of the block. Arrays handed out earlier under the
+        same name share its memory until the block grows.
+        """
+        shape = tuple(int(s) for s in np.atleast_1d(shape))
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+
+        blocks = self._blocks()
+        block = blocks.get(name)
+        if (block is None) or (block.nbytes < nbytes):
+            block = np.empty(max(nbytes, 1), dtype=np.uint8)
+            count(allocated=block.nbytes)
+            blocks[name] = block
+        return block[:nbytes].view(dtype).reshape(shape)
+
+    def release(self, name:str|None=None):
+        """drop the block of name, or every block of this thread if name is None"""
+        blocks = self._blocks()
+        if name is None:
+            blocks.clear()
+        else:
+            blocks.pop(name, None)
+
+    @property
+    def nbytes(self):
+        """bytes held by the blocks of this thread, or by every block if they are shared"""
+        return sum(block.nbytes for block in self._blocks().values())
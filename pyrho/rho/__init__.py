@@ -1 +1 @@
-from pyrho.rho.pyrho import lagNRho, RofM
\ No newline at end of file
+from pyrho.rho.pyrho import lagNRho, RofM, RofM2D, lagSums, slscPoints, slscSliding, slscFused, slscSums, slscSweep, fusedworksize, coherencemetrics, METRICS, interptable, interpgather, interpwidth, InterpTable, demodIQ, lowpass, DelayModel, tabledelays, griddelays, sphericaldelays, planedelays
\ No newline at end of file
@@ -0,0 +1,61 @@
+#include "rho.h"
+
+/**
+ * delaysat: evaluate the N delays of a delay model at one point
+ * 
+ * Table models read column p of their N by P table. Grid models exploit translation symmetry, every delay
+ * is an entry of one small base table offset by a fixed step per delay. The geometric models recompute 
+ * the delay from the point coordinates, which trades a few flops per delay for never storing a table.
+ * 
+ * Parameters:
+ * model: the delay model
+ * P: the number of points the tables were built for
+ * p: the index of the point
+ * point: pointer to the (x, y, z) coordinates of the point, coordinates spaced by sd floats
+ * sd: the stride, in floats, between coordinates
+ * tau: vector of length model->N to write the delays into [s]
+*/
+void delaysat(const delaymodel * model, int P, int p, const float * point, ptrdiff_t sd, float * tau)
+{
+    const float * ref;
+    const float * norm;
+    float xdiff, ydiff, zdiff;
+    int i;
+
+    switch (model->kind)
+    {
+        case DELAY_TABLE:
+            for (i=0; i<model->N; ++i) tau[i] = model->tabs[(ptrdiff_t) i*P + p];
+            break;
+
+        case DELAY_GRID:
+            for (i=0; i<model->N; ++i) tau[i] = model->tabs[model->index[p] + i*model->step];
+            break;
+
+        case DELAY_SPHERICAL:
+            for (i=0; i<model->N; ++i)
+            {
+                ref = model->refs + 3*i;
+                xdiff = point[0] - ref[0];
+                ydiff = point[sd] - ref[1];
+                zdiff = point[2*sd] - ref[2];
+                tau[i] = sqrtf(xdiff*xdiff + ydiff*ydiff + zdiff*zdiff)/model->c;
+            }
+            break;
+
+        case DELAY_PLANE:
+            for (i=0; i<model->N; ++i)
+            {
+                ref = model->refs + 3*i;
+                norm = model->norms + 3*i;
+                xdiff = norm[0] * (point[0] - ref[0]);
+                ydiff = norm[1] * (point[sd] - ref[1]);
+                zdiff = norm[2] * (point[2*sd] - ref[2]);
+                tau[i] = (xdiff + ydiff + zdiff)/model->c + model->trefs[i];
+            }
+            break;
+
+        default:
+            for (i=0; i<model->N; ++i) tau[i] = NAN;
+    }
+}
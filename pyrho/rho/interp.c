@@ -0,0 +1,202 @@
+#include "rho.h"
+
+/**
+ * interpweights: the first sample and the W weights that interpolate a trace at fractional sample tau
+ *
+ * Cubic interpolation uses the Catmull-Rom (Keys, a = -0.5) kernel. The windowed sinc kernel is a sinc tapered by a
+ * Hann window spanning its W taps, normalized so that its weights sum to 1.
+ *
+ * Parameters:
+ * kind: INTERP_NEAREST, INTERP_LINEAR, INTERP_CUBIC, or INTERP_SINC
+ * W: the number of taps, 1, 2, 4, or the number of taps of the windowed sinc kernel
+ * tau: the fractional sample to interpolate at
+ * weights: vector of length W to write the weight of samples first through first+W-1 into
+ *
+ * Returns:
+ *  first: the sample the first weight applies to
+*/
+static int interpweights(int kind, int W, float tau, float * weights)
+{
+    float frac, x, arg, total;
+    int i0, k;
+
+    if (INTERP_NEAREST == kind)
+    {
+        weights[0] = 1.0f;
+        return (int) floorf(tau + 0.5f);
+    }
+
+    i0 = (int) floorf(tau);
+    frac = tau - (float) i0;
+    switch (kind)
+    {
+        case INTERP_LINEAR:
+            weights[0] = 1.0f - frac;
+            weights[1] = frac;
+            return i0;
+
+        case INTERP_CUBIC:
+            weights[0] = ((-0.5f*frac + 1.0f)*frac - 0.5f)*frac;
+            weights[1] = (1.5f*frac - 2.5f)*frac*frac + 1.0f;
+            weights[2] = ((-1.5f*frac + 2.0f)*frac + 0.5f)*frac;
+            weights[3] = (0.5f*frac - 0.5f)*frac*frac;
+            return i0 - 1;
+
+        default:
+            total = 0.0f;
+            for (k=0; k<W; ++k)
+            {
+                // distance, in samples, from the interpolated instant to tap k
+                x = (float) (k - (W/2 - 1)) - frac;
+                arg = (float) M_PI * x;
+                weights[k] = ((0.0f == x) ? 1.0f : sinf(arg)/arg) * (0.5f + 0.5f*cosf(arg/(0.5f*(float) W)));
+                total += weights[k];
+            }
+            if (0.0f != total) for (k=0; k<W; ++k) weights[k] /= total;
+            return i0 - (W/2 - 1);
+    }
+}
+
+/**
+ * interpTable: precompute the sample index and interpolation weights of every transmit, receive channel and point
+ *
+ * The delay of each (transmit, receive, point) triple, the sum of the transmit and receive delays, is converted
+ * into the first of W consecutive samples and their weights. The first sample is clamped so that all W samples
+ * lie within the trace, and the weights of samples the kernel does not reach, e.g. beyond either end of the trace,
+ * are 0, so applying the table never needs a bounds check or any index arithmetic.
+ *
+ * Parameters:
+ * Ntx, Nrx, Ns: the number of transmits, receive channels, and samples of the data the table applies to, Ns >= W
+ * fs: the sampling frequency [Hz]
+ * tstart: the time of the first sample [s]
+ * P: the number of points
+ * points: pointer to the first coordinate of a strided P by 3 matrix of points, only read by geometric models
+ * sp, sd: the strides, in floats, between points and between coordinates
+ * tx: model of the Ntx transmit delays
+ * rx: model of the Nrx receive delays
+ * kind: INTERP_NEAREST, INTERP_LINEAR, INTERP_CUBIC, or INTERP_SINC
+ * W: the number of taps, 1, 2, 4, or the number of taps of the windowed sinc kernel
+ * index: Ntx by Nrx by P C-contiguous tensor to write the first sample of each triple into
+ * weights: Ntx by Nrx by P by W C-contiguous tensor to write the weights of each triple into
+ * half: nonzero to write the weights as IEEE 754 half precision floats, 0 for float32
+*/
+void interpTable(int Ntx, int Nrx, int Ns, float fs, float tstart, int P, const float * points, ptrdiff_t sp, ptrdiff_t sd,
+                 const delaymodel * tx, const delaymodel * rx, int kind, int W, int * index, void * weights, int half)
+{
+    int nthreads = getRhoThreads();
+    double t0 = getRhoStats() ? rhoclock() : 0.0;
+    float * wfull = (float *) weights;
+    unsigned short * whalf = (unsigned short *) weights;
+
+    #pragma omp parallel num_threads(nthreads)
+    {
+        float * txtau = (float *) malloc(sizeof(float) * (Ntx + Nrx + W));
+        float * rxtau = txtau + Ntx;
+        float * kern = rxtau + Nrx;
+        const float * point;
+        float w;
+        ptrdiff_t i;
+        int p, itx, irx, k, first, base;
+
+        #pragma omp for schedule(static)
+        for (p=0; p<P; ++p)
+        {
+            point = (NULL == points) ? NULL : points + p*sp;
+            delaysat(tx, P, p, point, sd, txtau);
+            delaysat(rx, P, p, point, sd, rxtau);
+
+            for (itx=0; itx<Ntx; ++itx)
+            {
+                for (irx=0; irx<Nrx; ++irx)
+                {
+                    // kernel weights at the delay, then shifted onto a window of samples that lies within the trace
+                    first = interpweights(kind, W, (txtau[itx] + rxtau[irx] - tstart) * fs, kern);
+                    base = (first < 0) ? 0 : ((first > Ns - W) ? Ns - W : first);
+
+                    i = ((ptrdiff_t) itx*Nrx + irx)*P + p;
+                    index[i] = base;
+                    for (k=0; k<W; ++k)
+                    {
+                        w = ((base + k >= first) && (base + k < first + W)) ? kern[base + k - first] : 0.0f;
+                        if (half) whalf[i*W + k] = floattohalf(w);
+                        else wfull[i*W + k] = w;
+                    }
+                }
+            }
+        }
+
+        free(txtau);
+    }
+
+    if (getRhoStats()) rhostat(RHOSTAT_INTERPTABLE, rhoclock() - t0, 1, sizeof(float)*(Ntx + Nrx + W)*(long long) nthreads, (long long) Ntx*Nrx*P);
+}
+
+/**
+ * interpGather: apply an interpolation table to a block of channel data, a gather and multiply-add per output
+ *
+ * Parameters:
+ * data: pointer to the first sample of an Ntx by Nrx by Ns strided tensor of RF data
+ * fmt: the sample format of data, RF_FLOAT32, RF_INT16, or RF_FLOAT16
+ * Ntx, Nrx: the number of transmits and receive channels, every trace holding the samples the table was built for
+ * st, sr, ss: the strides, in samples, between transmits, receive channels, and samples
+ * P: the number of points
+ * W: the number of taps of the table
+ * index: Ntx by Nrx by P C-contiguous tensor of the first sample of each triple, from interpTable
+ * weights: Ntx by Nrx by P by W C-contiguous tensor of the weights of each triple, from interpTable
+ * half: nonzero if weights holds IEEE 754 half precision floats, 0 for float32
+ * compound: nonzero to sum over transmits into an Nrx by P output, 0 for an Ntx by Nrx by P output
+ * output: C-contiguous float32 output, Ntx by Nrx by P, or Nrx by P when compounding
+*/
+void interpGather(const void * data, int fmt, int Ntx, int Nrx, ptrdiff_t st, ptrdiff_t sr, ptrdiff_t ss,
+                  int P, int W, const int * index, const void * weights, int half, int compound, float * output)
+{
+    int nthreads = getRhoThreads();
+    double t0 = getRhoStats() ? rhoclock() : 0.0;
+    const float * wfull = (const float *) weights;
+    const unsigned short * whalf = (const unsigned short *) weights;
+
+    // every thread gathers one contiguous range of points for every transmit and channel, so the table is read
+    // sequentially and compounded outputs never need a reduction across threads
+    #pragma omp parallel num_threads(nthreads)
+    {
+        const void * trace;
+        float * out;
+        float val;
+        ptrdiff_t i, j;
+        int itx, irx, p, k;
+        int nteam = nthreads;
+        int lo, hi;
+#ifdef _OPENMP
+        nteam = omp_get_num_threads();
+#endif
+        lo = (int) (((long long) P * rhothreadnum()) / nteam);
+        hi = (int) (((long long) P * (rhothreadnum() + 1)) / nteam);
+
+        for (irx=0; irx<Nrx; ++irx)
+        {
+            if (compound) for (p=lo; p<hi; ++p) output[(ptrdiff_t) irx*P + p] = 0.0f;
+            for (itx=0; itx<Ntx; ++itx)
+            {
+                trace = rfoffset(data, fmt, itx*st + irx*sr);
+                out = output + (compound ? (ptrdiff_t) irx*P : ((ptrdiff_t) itx*Nrx + irx)*P);
+                for (p=lo; p<hi; ++p)
+                {
+                    i = ((ptrdiff_t) itx*Nrx + irx)*P + p;
+                    j = index[i];
+                    val = 0.0f;
+                    if (half)
+                    {
+                        for (k=0; k<W; ++k) val += halftofloat(whalf[i*W + k]) * rfload(trace, fmt, (j + k)*ss);
+                    }
+                    else
+                    {
+                        for (k=0; k<W; ++k) val += wfull[i*W + k] * rfload(trace, fmt, (j + k)*ss);
+                    }
+                    out[p] = compound ? out[p] + val : val;
+                }
+            }
+        }
+    }
+
+    if (getRhoStats()) rhostat(RHOSTAT_GATHER, rhoclock() - t0, 1, 0, (long long) Ntx*Nrx*P*W);
+}
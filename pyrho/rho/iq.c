@@ -0,0 +1,201 @@
+#include "rho.h"
+
+/**
+ * demodIQ: mix raw RF down to baseband, low-pass filter, and decimate it into complex IQ
+ *
+ * Sample n of each trace is mixed with exp(-j 2 pi fc (tstart + n/fs)), so the phase of the IQ data is referenced
+ * to absolute time and a delay tau is undone by rotating by exp(j 2 pi fc tau). Output sample j is the FIR filter
+ * centered on input sample j*decim, scaled by 2 so the IQ magnitude matches the RF envelope.
+ *
+ * Parameters:
+ * input: pointer to the first sample of a T by Ns strided matrix of RF traces
+ * fmt: the sample format of input, RF_FLOAT32, RF_INT16, or RF_FLOAT16
+ * T: the number of traces
+ * Ns: the number of RF samples in each trace
+ * st, ss: the strides, in samples, between traces and samples
+ * fs: the RF sampling frequency [Hz]
+ * fc: the demodulation frequency [Hz]
+ * tstart: the time of the first sample [s]
+ * taps: vector of ntaps low-pass filter taps, centered on tap (ntaps-1)/2
+ * ntaps: the number of filter taps
+ * decim: the decimation factor
+ * Nout: the number of IQ samples in each trace
+ * output: T by Nout C-contiguous matrix of interleaved (real, imaginary) IQ samples
+*/
+void demodIQ(const void * input, int fmt, int T, int Ns, ptrdiff_t st, ptrdiff_t ss, float fs, float fc, float tstart,
+             const float * taps, int ntaps, int decim, int Nout, float * output)
+{
+    int nthreads = getRhoThreads();
+    double t0 = getRhoStats() ? rhoclock() : 0.0;
+    int half = (ntaps - 1)/2;
+
+    #pragma omp parallel num_threads(nthreads)
+    {
+        float * buf = (float *) malloc(sizeof(float) * Ns);
+        float * mixre = (float *) malloc(sizeof(float) * Ns);
+        float * mixim = (float *) malloc(sizeof(float) * Ns);
+        const float * trace;
+        float * out;
+        double phase;
+        float re, im;
+        int t, n, j, k, idx;
+
+        #pragma omp for schedule(static)
+        for (t=0; t<T; ++t)
+        {
+            // mix the whole trace once, each sample is reused by ntaps/decim outputs
+            trace = rfspan(rfoffset(input, fmt, t*st), fmt, ss, Ns, 0, Ns, buf);
+            for (n=0; n<Ns; ++n)
+            {
+                phase = -2.0 * M_PI * (double) fc * ((double) tstart + (double) n / (double) fs);
+                mixre[n] = trace[n] * (float) cos(phase);
+                mixim[n] = trace[n] * (float) sin(phase);
+            }
+
+            out = output + 2*(ptrdiff_t) t*Nout;
+            for (j=0; j<Nout; ++j)
+            {
+                re = 0.0f;
+                im = 0.0f;
+                for (k=0; k<ntaps; ++k)
+                {
+                    idx = j*decim + k - half;
+                    if ((idx < 0) || (idx >= Ns)) continue;
+                    re += taps[k] * mixre[idx];
+                    im += taps[k] * mixim[idx];
+                }
+                out[2*j] = 2.0f * re;
+                out[2*j+1] = 2.0f * im;
+            }
+        }
+
+        free(buf);
+        free(mixre);
+        free(mixim);
+    }
+
+    if (getRhoStats()) rhostat(RHOSTAT_DEMOD, rhoclock() - t0, 1, 3*sizeof(float)*Ns*(long long) nthreads, (long long) T*Ns);
+}
+
+/**
+ * iqstats: calculate the complex mean and inverse root energy of each channel of IQ data
+ *
+ * Parameters:
+ * input: pointer to the first sample of an M by N strided matrix of interleaved (real, imaginary) samples
+ * M: the number of channels
+ * N: the number of samples in each channel
+ * sm, sn: the strides, in complex samples, between channels and between samples
+ * avg: vector of length 2*M to write the interleaved complex mean of each channel into
+ * gain: vector of length M to write 1/sqrt(sum |x - mean|^2) of each channel into, 0 if the channel is empty
+*/
+void iqstats(const float * input, int M, int N, ptrdiff_t sm, ptrdiff_t sn, float * avg, float * gain)
+{
+    const float * vec;
+    float mure, muim, energy, re, im;
+    int m, n;
+
+    for (m=0; m<M; ++m)
+    {
+        vec = input + 2*m*sm;
+
+        mure = 0.0f;
+        muim = 0.0f;
+        for (n=0; n<N; ++n)
+        {
+            mure += vec[2*n*sn];
+            muim += vec[2*n*sn+1];
+        }
+        mure /= (float) N;
+        muim /= (float) N;
+
+        energy = 0.0f;
+        for (n=0; n<N; ++n)
+        {
+            re = vec[2*n*sn] - mure;
+            im = vec[2*n*sn+1] - muim;
+            energy += re*re + im*im;
+        }
+
+        avg[2*m] = mure;
+        avg[2*m+1] = muim;
+        gain[m] = (energy > 0.0f) ? 1.0f/sqrtf(energy) : 0.0f;
+    }
+}
+
+/**
+ * iqpair: normalized complex correlation of two IQ channels, reduced to its real part or magnitude
+ *
+ * Parameters:
+ * vec1, vec2: pointers to the first interleaved sample of each channel
+ * N: the number of samples
+ * sn: the stride, in complex samples, between samples
+ * avg1, avg2: interleaved complex means of each channel, from iqstats
+ * gain1, gain2: inverse root energies of each channel, from iqstats
+ * part: IQ_REAL for the real part of sum((x1 - mu1) conj(x2 - mu2)), IQ_ABS for its magnitude
+*/
+float iqpair(const float * vec1, const float * vec2, int N, ptrdiff_t sn, const float * avg1, const float * avg2, float gain1, float gain2, int part)
+{
+    float crossre, crossim, re1, im1, re2, im2;
+    int n;
+
+    crossre = 0.0f;
+    crossim = 0.0f;
+    for (n=0; n<N; ++n)
+    {
+        re1 = vec1[2*n*sn] - avg1[0];
+        im1 = vec1[2*n*sn+1] - avg1[1];
+        re2 = vec2[2*n*sn] - avg2[0];
+        im2 = vec2[2*n*sn+1] - avg2[1];
+        crossre += re1*re2 + im1*im2;
+        crossim += im1*re2 - re1*im2;
+    }
+
+    if (IQ_ABS == part) return sqrtf(crossre*crossre + crossim*crossim) * gain1 * gain2;
+    return crossre * gain1 * gain2;
+}
+
+/**
+ * multiLagRhoIQ: calculate the coherence of complex IQ data at several lags in a single sweep
+ *
+ * The mean and energy of each channel are computed once, then every pair of each requested lag is correlated
+ * and reduced to its real part or magnitude. The input is only read.
+ *
+ * Parameters:
+ * input: pointer to the first sample of an M by N strided matrix of interleaved (real, imaginary) samples
+ * M: the number of channels
+ * N: the number of samples in each channel
+ * sm, sn: the strides, in complex samples, between channels and between samples
+ * lags: vector of L lag indices, each between 0 and M-1
+ * L: the number of lags
+ * part: IQ_REAL or IQ_ABS, see iqpair
+ * output: vector of length L to write the coherence of each lag into
+*/
+void multiLagRhoIQ(const float * input, int M, int N, ptrdiff_t sm, ptrdiff_t sn, const int * lags, int L, int part, float * output)
+{
+    float * avg;
+    float * gain;
+    float sum;
+    int m, l, lag;
+    int nthreads = getRhoThreads();
+    double t0 = getRhoStats() ? rhoclock() : 0.0;
+
+    avg = (float *) malloc(sizeof(float) * 2 * M);
+    gain = (float *) malloc(sizeof(float) * M);
+    iqstats(input, M, N, sm, sn, avg, gain);
+
+    for (l=0; l<L; ++l)
+    {
+        lag = lags[l];
+        sum = 0.0f;
+        #pragma omp parallel for num_threads(nthreads) reduction(+:sum) schedule(static)
+        for (m=0; m<(M-lag); ++m)
+        {
+            sum += iqpair(input + 2*m*sm, input + 2*(m+lag)*sm, N, sn, avg + 2*m, avg + 2*(m+lag), gain[m], gain[m+lag], part);
+        }
+        output[l] = sum / (float)(M-lag);
+    }
+
+    free(avg);
+    free(gain);
+    if (getRhoStats()) rhostat(RHOSTAT_IQ, rhoclock() - t0, 1, 3*sizeof(float)*M, (long long) M*N);
+}
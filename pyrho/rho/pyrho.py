@@ -1,96 +1,1087 @@
 """Python wrapper for c-type coherence functions"""
 import ctypes as ct
-import cinpy as cnp
 import numpy as np
-from glob import glob
-import platform as _pltfm
+from pyrho.cbuf import asfloat32, ascomplex64, asrf, fptr, iptr, vptr, estrides, outbuf
+from pyrho.instrument import staged
+from pyrho.backend import SharedLibrary, kernel
 import os
 
 # determine installed path
 dirpath = os.path.dirname(__file__)
 
-# determine the OS and relative binary file
-if _pltfm.uname()[0] == "Windows":
-    res = glob(os.path.abspath(os.path.join(dirpath, "*.dll")))
-    name = res[0]
-elif _pltfm.uname()[0] == "Linux":
-    res = glob(os.path.abspath(os.path.join(dirpath, "*.so")))
-    name = res[0]
-else:
-    res = glob(os.path.abspath(os.path.join(dirpath, "*.dylib")))
-    name = res[0]
+class DelayModel(ct.Structure):
+    """ctypes mirror of the delaymodel struct: N delays to any point, either stored in a table or recomputed from geometry
+    
+    Build instances with tabledelays, sphericaldelays, or planedelays, which keep the referenced arrays alive.
+    """
+    _fields_ = [
+        ("kind", ct.c_int),
+        ("N", ct.c_int),
+        ("tabs", ct.POINTER(ct.c_float)),
+        ("refs", ct.POINTER(ct.c_float)),
+        ("norms", ct.POINTER(ct.c_float)),
+        ("trefs", ct.POINTER(ct.c_float)),
+        ("c", ct.c_float),
+        ("index", ct.POINTER(ct.c_int)),
+        ("step", ct.c_ssize_t),
+    ]
+
+    TABLE = 0
+    SPHERICAL = 1
+    PLANE = 2
+    GRID = 3
+
+def _vecs3(vecs, name:str):
+    """contiguous float32 copy of an N by 3 matrix of small vectors"""
+    if (np.ndim(vecs) != 2) or (np.shape(vecs)[1] != 3): raise ValueError(f"{name} must be N by 3")
+    return np.ascontiguousarray(vecs, dtype=np.float32)
+
+def tabledelays(tabs):
+    """delay model reading an N by P table of delays in s"""
+    if np.ndim(tabs) != 2: raise ValueError("tabs must be N by P")
+    model = DelayModel(kind=DelayModel.TABLE, N=np.shape(tabs)[0])
+    model._tabs = np.ascontiguousarray(tabs, dtype=np.float32)
+    model.tabs = fptr(model._tabs)
+    model.P = model._tabs.shape[1]
+    return model
+
+def griddelays(base, index, step:int, N:int):
+    """delay model reading delay i of point p from base[index[p] + i*step], for N delays
+    
+    Parameters:
+    ----
+    base: base table of delays in s, flattened
+    index: length P vector of the base entry of each point for the first delay
+    step: offset in the flattened base table between consecutive delays
+    N: the number of delays described
+    """
+    model = DelayModel(kind=DelayModel.GRID, N=N, step=int(step))
+    model._tabs = np.ascontiguousarray(base, dtype=np.float32).ravel()
+    model._index = np.ascontiguousarray(index, dtype=np.int32).ravel()
+    lo = model._index.min() + min(0, (N-1)*step)
+    hi = model._index.max() + max(0, (N-1)*step)
+    if (lo < 0) or (hi >= model._tabs.size): raise ValueError("index and step reach outside of the base table")
+    model.tabs = fptr(model._tabs)
+    model.index = iptr(model._index)
+    model.P = model._index.size
+    return model
+
+def sphericaldelays(refs, c:float=1540):
+    """delay model recomputing |point - ref|/c for N reference points on the fly"""
+    model = DelayModel(kind=DelayModel.SPHERICAL, N=np.shape(refs)[0], c=c)
+    model._refs = _vecs3(refs, "refs")
+    model.refs = fptr(model._refs)
+    model.P = None
+    return model
+
+def planedelays(refs, norms, trefs, c:float=1540):
+    """delay model recomputing dot(norm, point - ref)/c + tref for N plane waves on the fly"""
+    model = DelayModel(kind=DelayModel.PLANE, N=np.shape(refs)[0], c=c)
+    model._refs = _vecs3(refs, "refs")
+    model._norms = _vecs3(norms, "norms")
+    model._trefs = np.ascontiguousarray(trefs, dtype=np.float32).flatten()
+    if (model._norms.shape[0] != model.N) or (model._trefs.size != model.N):
+        raise ValueError("refs, norms, and trefs must describe the same number of waves")
+    model.refs = fptr(model._refs)
+    model.norms = fptr(model._norms)
+    model.trefs = fptr(model._trefs)
+    model.P = None
+    return model
+
+def _declare(lib):
+    """declare the signatures of the functions of the freshly loaded library"""
+    lib.setRhoThreads.argtypes = ct.c_int,
+    lib.setRhoThreads.restype = None
+
+    lib.getRhoThreads.argtypes = ()
+    lib.getRhoThreads.restype = ct.c_int
+
+    lib.setRhoStats.argtypes = ct.c_int,
+    lib.setRhoStats.restype = None
+
+    lib.getRhoStats.argtypes = ()
+    lib.getRhoStats.restype = ct.c_int
+
+    lib.resetRhoStats.argtypes = ()
+    lib.resetRhoStats.restype = None
+
+    lib.readRhoStats.argtypes = ct.POINTER(ct.c_double), ct.POINTER(ct.c_longlong), ct.POINTER(ct.c_longlong), ct.POINTER(ct.c_longlong)
+    lib.readRhoStats.restype = None
+
+    lib.lagNRho.argtypes = ct.c_void_p, ct.c_int, ct.c_int, ct.c_int, ct.c_ssize_t, ct.c_ssize_t, ct.c_int
+    lib.lagNRho.restype = ct.c_float
+
+    lib.multiLagRho.argtypes = ct.c_void_p, ct.c_int, ct.c_int, ct.c_int, ct.c_ssize_t, ct.c_ssize_t, ct.POINTER(ct.c_int), ct.c_int, ct.c_int, ct.POINTER(ct.c_float)
+    lib.multiLagRho.restype = None
+
+    lib.multiLagRho2D.argtypes = ct.c_void_p, ct.c_int, ct.c_int, ct.c_int, ct.c_int, ct.c_ssize_t, ct.c_ssize_t, ct.POINTER(ct.c_int), ct.POINTER(ct.c_int), ct.c_int, ct.c_int, ct.POINTER(ct.c_float)
+    lib.multiLagRho2D.restype = None
+
+    lib.slscPoints.argtypes = ct.POINTER(ct.c_float), ct.c_int, ct.c_int, ct.c_int, ct.c_ssize_t, ct.c_ssize_t, ct.c_ssize_t, ct.POINTER(ct.c_int), ct.c_int, ct.POINTER(ct.c_float)
+    lib.slscPoints.restype = None
+
+    lib.slscSliding.argtypes = ct.c_void_p, ct.c_int, ct.c_int, ct.c_int, ct.c_int, ct.c_ssize_t, ct.c_ssize_t, ct.c_ssize_t, ct.c_int, ct.POINTER(ct.c_int), ct.c_int, ct.POINTER(ct.c_float)
+    lib.slscSliding.restype = None
+
+    lib.slscFused.argtypes = ct.c_void_p, ct.c_int, ct.c_int, ct.c_int, ct.c_int, ct.c_ssize_t, ct.c_ssize_t, ct.c_ssize_t, ct.c_float, ct.c_float, ct.c_int, ct.POINTER(ct.c_float), ct.c_ssize_t, ct.c_ssize_t, ct.POINTER(DelayModel), ct.POINTER(DelayModel), ct.POINTER(ct.c_int), ct.POINTER(ct.c_int), ct.c_int, ct.POINTER(ct.c_int), ct.POINTER(ct.c_int), ct.c_int, ct.c_int, ct.POINTER(ct.c_int), ct.c_int, ct.POINTER(ct.c_float), ct.POINTER(ct.c_float), ct.c_int, ct.POINTER(ct.c_float), ct.POINTER(ct.c_float), ct.POINTER(ct.c_float), ct.POINTER(ct.c_int), ct.c_int
+    lib.slscFused.restype = None
+
+    lib.slscSweep.argtypes = ct.c_void_p, ct.c_int, ct.c_int, ct.c_int, ct.c_int, ct.c_ssize_t, ct.c_ssize_t, ct.c_ssize_t, ct.c_float, ct.c_float, ct.c_int, ct.POINTER(ct.c_float), ct.c_ssize_t, ct.c_ssize_t, ct.POINTER(DelayModel), ct.POINTER(DelayModel), ct.POINTER(ct.c_float), ct.POINTER(ct.c_float), ct.c_float, ct.c_float, ct.POINTER(ct.c_int), ct.POINTER(ct.c_int), ct.c_int, ct.POINTER(ct.c_int), ct.POINTER(ct.c_int), ct.c_int, ct.c_int, ct.POINTER(ct.c_int), ct.c_int, ct.POINTER(ct.c_float), ct.c_int, ct.POINTER(ct.c_float), ct.POINTER(ct.c_float), ct.POINTER(ct.c_int), ct.c_int
+    lib.slscSweep.restype = None
+
+    lib.fusedWork.argtypes = ct.c_int, ct.c_int, ct.c_int, ct.c_int
+    lib.fusedWork.restype = ct.c_ssize_t
+
+    lib.lagNSums.argtypes = ct.c_void_p, ct.c_int, ct.c_int, ct.c_int, ct.c_ssize_t, ct.c_ssize_t, ct.c_int, ct.POINTER(ct.c_float), ct.POINTER(ct.c_float), ct.POINTER(ct.c_double)
+    lib.lagNSums.restype = None
+
+    lib.lagSums.argtypes = ct.c_void_p, ct.c_int, ct.c_int, ct.c_int, ct.c_int, ct.c_ssize_t, ct.c_ssize_t, ct.c_ssize_t, ct.POINTER(ct.c_int), ct.c_int, ct.POINTER(ct.c_double), ct.POINTER(ct.c_double)
+    lib.lagSums.restype = None
+
+    lib.demodIQ.argtypes = ct.c_void_p, ct.c_int, ct.c_int, ct.c_int, ct.c_ssize_t, ct.c_ssize_t, ct.c_float, ct.c_float, ct.c_float, ct.POINTER(ct.c_float), ct.c_int, ct.c_int, ct.c_int, ct.POINTER(ct.c_float)
+    lib.demodIQ.restype = None
+
+    lib.multiLagRhoIQ.argtypes = ct.POINTER(ct.c_float), ct.c_int, ct.c_int, ct.c_ssize_t, ct.c_ssize_t, ct.POINTER(ct.c_int), ct.c_int, ct.c_int, ct.POINTER(ct.c_float)
+    lib.multiLagRhoIQ.restype = None
+
+    lib.slscFusedIQ.argtypes = ct.POINTER(ct.c_float), ct.c_int, ct.c_int, ct.c_int, ct.c_ssize_t, ct.c_ssize_t, ct.c_ssize_t, ct.c_float, ct.c_float, ct.c_float, ct.c_int, ct.POINTER(ct.c_float), ct.c_ssize_t, ct.c_ssize_t, ct.POINTER(DelayModel), ct.POINTER(DelayModel), ct.POINTER(ct.c_int), ct.POINTER(ct.c_int), ct.c_int, ct.POINTER(ct.c_int), ct.POINTER(ct.c_int), ct.c_int, ct.c_int, ct.POINTER(ct.c_int), ct.c_int, ct.c_int, ct.POINTER(ct.c_float), ct.POINTER(ct.c_float), ct.POINTER(ct.c_int), ct.c_int
+    lib.slscFusedIQ.restype = None
 
-# load the c library
-__rho__ = ct.CDLL(name)
+    lib.interpTable.argtypes = ct.c_int, ct.c_int, ct.c_int, ct.c_float, ct.c_float, ct.c_int, ct.POINTER(ct.c_float), ct.c_ssize_t, ct.c_ssize_t, ct.POINTER(DelayModel), ct.POINTER(DelayModel), ct.c_int, ct.c_int, ct.POINTER(ct.c_int), ct.c_void_p, ct.c_int
+    lib.interpTable.restype = None
 
-__rho__.lagNRho.argtypes = ct.POINTER(ct.POINTER(ct.POINTER(ct.c_float))), ct.c_int, ct.c_int, ct.c_int
-__rho__.lagNRho.restype = ct.c_float
+    lib.interpGather.argtypes = ct.c_void_p, ct.c_int, ct.c_int, ct.c_int, ct.c_ssize_t, ct.c_ssize_t, ct.c_ssize_t, ct.c_int, ct.c_int, ct.POINTER(ct.c_int), ct.c_void_p, ct.c_int, ct.c_int, ct.POINTER(ct.c_float)
+    lib.interpGather.restype = None
 
-def lagNRho(arr, lag:int=1, axis:int=1):
+# the c library, loaded on the first kernel call
+__rho__ = SharedLibrary(dirpath, _declare)
+
+# parts of the normalized complex correlation kept by the IQ kernels, matching the IQ_* codes in rho.h
+IQPARTS = {'real': 0, 'abs': 1}
+
+def _iqpart(part:str):
+    if part not in IQPARTS: raise ValueError(f"part must be one of {list(IQPARTS)}")
+    return ct.c_int(IQPARTS[part])
+
+def _channelview(arr, axis:int):
+    """raw view of a 2D matrix with its element and sample strides, copying only if arr is not float32, int16, float16
+    or complex64
+    
+    Returns:
+    ----
+    arr: float32, int16, float16 or complex64 array kept alive for the duration of the kernel call
+    fmt: the RF_* code of the sample format of arr, None for complex IQ data
+    M, N: number of elements and samples
+    sm, sn: element and sample strides, in samples
+    """
+    # only allow 2D input arrays
+    if np.ndim(arr) != 2:
+        raise ValueError("Input array must be 2D")
+    if axis not in (0, 1):
+        raise ValueError("axis must be 0 or 1")
+
+    arr, fmt = (ascomplex64(arr), None) if np.iscomplexobj(arr) else asrf(arr)
+    strides = estrides(arr)
+
+    # the element axis is the slow index in the kernels, no transpose needed
+    if axis == 1:
+        return arr, fmt, arr.shape[1], arr.shape[0], strides[1], strides[0]
+    return arr, fmt, arr.shape[0], arr.shape[1], strides[0], strides[1]
+
+@staged('lagNRho')
+@kernel('lagNRho')
+def lagNRho(arr, lag:int=1, axis:int=1, part:str='real', accumulators:bool=False):
     """calculate the Nth lag of 2D input matrix
     
     Parameters:
     ----
-    arr: the array over which the Nth lag coherence is being calculated
+    arr: the array over which the Nth lag coherence is being calculated, read in place if float32, int16 or float16.
+        Complex IQ data, e.g. from demodIQ, is read in place if complex64
     lag: the lag index
     axis: the axis corresponding to the elements
+    part: for complex IQ data, 'real' (default) or 'abs' to keep the real part or the magnitude of each pair's 
+        normalized complex correlation
+    accumulators: if True, also return the sums the coherence is formed from, so other metrics such as the 
+        coherence factor need no further pass over the data. Real data only
 
     Returns:
     ----
     rho: normalized correlation coefficient at this lag
+    sums: only if accumulators is True, dict of
+        'cross': float32 vector of the covariance of each pair (m, m+lag)
+        'self': float32 vector of the energy of each channel about its mean
+        'coherent': energy of the coherent sum of the channels, sum over samples of (sum over channels)^2
+        'incoherent': sum of x^2 over every channel and sample, so the coherence factor is coherent/(M*incoherent)
     """
 
-    # only allow 2D input arrays
-    if np.ndim(arr) != 2:
-        raise ValueError("Input array must be 2D")
-    
-    # Make the sample axis the fast axis
-    if axis == 1:
-        c_arr, M, N = cnp.copy2c(arr.T)
-    else:
-        c_arr, M, N = cnp.copy2c(arr)
+    arr, fmt, M, N, sm, sn = _channelview(arr, axis)
+    if (lag < 0) or (lag >= M): raise ValueError("lag must be between 0 and nele-1")
+
+    # one pass fills the accumulators, the coherence is then formed from them
+    if accumulators:
+        if fmt is None: raise ValueError("accumulators are only available for real data")
+        cross = np.zeros(M-lag, dtype=np.float32)
+        energy = np.zeros(M, dtype=np.float32)
+        sums = np.zeros(2, dtype=np.float64)
+        __rho__.lagNSums(vptr(arr), fmt, M, N, sm, sn, ct.c_int(lag), fptr(cross), fptr(energy), 
+                         sums.ctypes.data_as(ct.POINTER(ct.c_double)))
+        norm = np.sqrt(energy[:M-lag].astype(np.float64) * energy[lag:])
+        rho = np.sum(np.divide(cross, norm, out=np.zeros_like(norm), where=norm > 0)) / (M-lag)
+        return float(rho), dict(cross=cross, self=energy, coherent=float(sums[0]), incoherent=float(sums[1]))
+
+    # IQ data goes through the complex kernel with a single lag
+    if fmt is None:
+        rho = np.zeros(1, dtype=np.float32)
+        lags = np.array([lag], dtype=np.int32)
+        __rho__.multiLagRhoIQ(fptr(arr), M, N, sm, sn, iptr(lags), ct.c_int(1), _iqpart(part), fptr(rho))
+        return float(rho[0])
 
     # calculate the lag
-    rho = __rho__.lagNRho(ct.byref(c_arr), M, N, ct.c_int(lag))
-    cnp.free(c_arr, M, N)
+    rho = __rho__.lagNRho(vptr(arr), fmt, M, N, sm, sn, ct.c_int(lag))
 
     # return the python-friendly value
     return float(rho)
 
-def RofM(arr, axis:int=1):
-    """calculate the Nth lag of 2D input matrix
+@staged('RofM')
+@kernel('RofM')
+def RofM(arr, axis:int=1, lags=None, method:str='auto', part:str='real', out=None):
+    """calculate the coherence curve R(m) of 2D input matrix in a single pass
     
     Parameters:
     ----
-    arr: the array over which the Nth lag coherence is being calculated
-    lag: the lag index
+    arr: the array over which the coherence curve is being calculated, read in place if float32, int16 or float16.
+        Complex IQ data, e.g. from demodIQ, is read in place if complex64
     axis: the axis corresponding to the elements
+    lags: the lag indices to return. If None (default), returns lags 0 through nele-2
+    method: 'fft' to autocorrelate along the element axis with an FFT, 'direct' to sum the pairs 
+        of each requested lag, or 'auto' (default) to pick the cheaper of the two. IQ data is always summed directly
+    part: for complex IQ data, 'real' (default) or 'abs' to keep the real part or the magnitude of each pair's 
+        normalized complex correlation
+    out: optional caller-owned float32 vector with one entry per lag to write into, returned in place of a float64 copy
 
     Returns:
     ----
-    rho: normalized correlation coefficient at this lag
+    rhos: normalized correlation coefficient at each lag
     """
 
-    # only allow 2D input arrays
-    if np.ndim(arr) != 2:
-        raise ValueError("Input array must be 2D")
+    arr, fmt, nele, N, sm, sn = _channelview(arr, axis)
+
+    if lags is None:
+        lags = np.arange(nele-1)
+    lags = np.array(lags, dtype=np.int32).flatten()
+    if np.any(lags < 0) or np.any(lags >= nele):
+        raise ValueError("lags must be between 0 and nele-1")
+
+    if method not in ('auto', 'fft', 'direct'): raise ValueError("method must be 'auto', 'fft', or 'direct'")
+    rhos = outbuf(out, lags.size)
+
+    # the magnitude of each pair cannot be taken from a summed spectrum, so IQ pairs are summed directly
+    if fmt is None:
+        if method == 'fft': raise ValueError("IQ data only supports the 'direct' method")
+        __rho__.multiLagRhoIQ(fptr(arr), nele, N, sm, sn, iptr(lags), ct.c_int(lags.size), _iqpart(part), fptr(rhos))
+        return rhos if out is not None else rhos.astype(float)
+
+    # pick the cheaper formulation: direct pair sums versus a padded FFT per pair of samples
+    K = int(2**np.ceil(np.log2(max(2*nele-1, 2))))
+    if method == 'auto':
+        usefft = np.sum(nele - lags) > 1.5 * K * np.log2(K)
+    else:
+        usefft = method == 'fft'
+
+    # calculate all lags in one sweep
+    __rho__.multiLagRho(
+        vptr(arr), fmt, nele, N, sm, sn, 
+        iptr(lags), ct.c_int(lags.size), 
+        ct.c_int(int(usefft)), 
+        fptr(rhos)
+    )
+
+    # return the python-friendly value
+    return rhos if out is not None else rhos.astype(float)
+
+def _lattice(shape, nele:int):
+    """(Mx, My) of a 2D element lattice holding nele elements"""
+    if np.size(shape) != 2: raise ValueError("shape must hold the number of elements along each of the 2 lattice axes")
+    Mx, My = (int(s) for s in np.ravel(shape))
+    if (Mx < 1) or (My < 1): raise ValueError("shape must be positive")
+    if Mx*My != nele: raise ValueError("shape must hold one lattice position per element")
+    return Mx, My
+
+def _radii(lags):
+    """radial bin of each (dx, dy) lag, its length in elements rounded to the nearest integer"""
+    return np.rint(np.hypot(lags[:,0], lags[:,1])).astype(np.int64)
+
+def _radialbins(Mx:int, My:int, bins):
+    """int64 vector of radial lag bins, every bin from 0 to the longest lag of the lattice if bins is None"""
+    rmax = int(np.rint(np.hypot(Mx-1, My-1)))
+    if bins is None: return np.arange(rmax+1)
+    bins = np.array(bins, dtype=np.int64).flatten()
+    if bins.size == 0: raise ValueError("radial lags must hold at least one bin")
+    if np.any(bins < 0) or np.any(bins > rmax): raise ValueError(f"radial lags must be between 0 and {rmax}")
+    return bins
+
+def _lags2d(Mx:int, My:int, lags, radial:bool):
+    """int32 L by 2 matrix of the (dx, dy) lags RofM2D takes the coherence of"""
+    if (lags is not None) and not radial:
+        lags = np.array(lags, dtype=np.int32).reshape(-1, 2)
+        if np.any(np.abs(lags[:,0]) >= Mx) or np.any(np.abs(lags[:,1]) >= My): 
+            raise ValueError("lags must be between -(M-1) and M-1 along each lattice axis")
+        return lags
+
+    # (dx, dy) and (-dx, -dy) pair the same elements, so one half of the lag plane holds every distinct lag
+    dx, dy = np.meshgrid(np.arange(Mx), np.arange(-(My-1), My), indexing='ij')
+    half = (dx > 0) | (dy >= 0)
+    every = np.stack([dx[half], dy[half]], axis=1).astype(np.int32)
+    if not radial: return every
+    return every[np.isin(_radii(every), _radialbins(Mx, My, lags))]
+
+def _pairs2d(Mx:int, My:int, lags):
+    """number of pairs of lattice elements at each (dx, dy) lag"""
+    return (Mx - np.abs(lags[:,0]).astype(np.int64)) * (My - np.abs(lags[:,1]).astype(np.int64))
+
+def _usefft2d(Mx:int, My:int, lags, method:str):
+    """whether RofM2D forms the lags by a 2D FFT, the cheaper of the FFT and the direct pair sums for 'auto'"""
+    if method not in ('auto', 'fft', 'direct'): raise ValueError("method must be 'auto', 'fft', or 'direct'")
+    if method != 'auto': return method == 'fft'
+    K = int(2**np.ceil(np.log2(max(2*Mx-1, 1)))) * int(2**np.ceil(np.log2(max(2*My-1, 1))))
+    return np.sum(_pairs2d(Mx, My, lags)) > 1.5 * K * np.log2(max(K, 2))
+
+def _from2d(rhos, vecs, Mx:int, My:int, lags, radial:bool, out):
+    """the result of RofM2D from the coherence of each lag of _lags2d: the lags given, a map of every lag, or radial bins"""
+    rhos = np.asarray(rhos, dtype=np.float64)
+    if radial:
+        # every pair of elements whose separation rounds to a bin weighs equally in that bin
+        bins = _radialbins(Mx, My, lags)
+        radii, npairs = _radii(vecs), _pairs2d(Mx, My, vecs)
+        total = np.bincount(radii, npairs * rhos, minlength=bins.max()+1)[bins]
+        count = np.bincount(radii, npairs, minlength=bins.max()+1)[bins]
+        result = np.divide(total, count, out=np.full(bins.size, np.nan), where=count > 0)
+    elif lags is None:
+        result = np.empty((2*Mx-1, 2*My-1))
+        result[vecs[:,0] + Mx-1, vecs[:,1] + My-1] = rhos
+        result[Mx-1 - vecs[:,0], My-1 - vecs[:,1]] = rhos
+    else:
+        result = rhos
+
+    if out is None: return result.astype(np.float32).astype(float)
+    out = outbuf(out, result.shape)
+    out[...] = result
+    return out
+
+@staged('RofM2D')
+@kernel('RofM2D')
+def RofM2D(arr, shape, axis:int=1, lags=None, radial:bool=False, method:str='auto', out=None):
+    """calculate the coherence of the elements of a 2D lattice, e.g. a matrix array, at 2D lags in a single pass
+
+    The elements are the positions of an Mx by My lattice in C order, element (ix, iy) being channel ix*My + iy, and
+    the coherence at lag (dx, dy) is averaged over every pair of elements (ix, iy) and (ix+dx, iy+dy), so (dx, dy) 
+    and (-dx, -dy) are the same lag. The FFT method forms the 2D autocorrelation of the lattice, every lag at once 
+    in O(M log M) per sample, instead of summing the M^2/2 pairs of a full lag map or of radial bins directly.
+
+    Parameters:
+    ----
+    arr: the array over which the coherence is being calculated, read in place if float32, int16 or float16
+    shape: the lattice shape (Mx, My), Mx*My must equal the number of elements
+    axis: the axis corresponding to the elements
+    lags: L by 2 matrix of (dx, dy) lags in elements, or with radial, the radial lag bins to return. If None (default),
+        returns every lag as a 2Mx-1 by 2My-1 map whose entry [dx+Mx-1, dy+My-1] is lag (dx, dy), or with radial
+        every bin from 0 to the longest separation of the lattice
+    radial: if True, average the coherence over every pair of elements whose separation, in elements, rounds to each 
+        radial bin. Bins no pair falls in are NaN
+    method: 'fft' for the 2D FFT autocorrelation, 'direct' to sum the pairs of each lag, or 'auto' (default) to pick 
+        the cheaper of the two
+    out: optional caller-owned float32 array of the returned shape to write into, returned in place of a float64 copy
+
+    Returns:
+    ----
+    rhos: normalized correlation coefficient at each lag or radial bin, or the map of every lag
+    """
+
+    arr, fmt, nele, N, sm, sn = _channelview(arr, axis)
+    if fmt is None: raise ValueError("RofM2D only supports real data")
+    Mx, My = _lattice(shape, nele)
+    vecs = _lags2d(Mx, My, lags, radial)
+    usefft = _usefft2d(Mx, My, vecs, method)
+
+    lagx, lagy = np.ascontiguousarray(vecs[:,0]), np.ascontiguousarray(vecs[:,1])
+    rhos = np.empty(vecs.shape[0], dtype=np.float32)
+    __rho__.multiLagRho2D(vptr(arr), fmt, Mx, My, N, sm, sn, iptr(lagx), iptr(lagy), ct.c_int(rhos.size), ct.c_int(int(usefft)), fptr(rhos))
+    return _from2d(rhos, vecs, Mx, My, lags, radial, out)
+
+@staged('lagSums')
+@kernel('lagSums')
+def lagSums(arr, lags, axis:int=1, cross=None, energy=None):
+    """calculate the cross sums of every pair and the self sums of every channel at several lags, to pool across frames
+
+    The coherence of lag l pooled over frames is the mean over pairs (m, m+l) of the summed cross sums divided by 
+    sqrt of the product of the summed self sums of the two channels, see pyrho.processors.RhoEnsemble.
+
+    Parameters:
+    ----
+    arr: M by N matrix of channel data with the elements along axis, or a P by M by K tensor of per-point channel 
+        kernels (points by elements by kernel samples), read in place if float32, int16 or float16
+    lags: vector of lag indices, each between 0 and nele-1
+    axis: the axis corresponding to the elements of a 2D matrix, ignored for 3D tensors
+    cross: optional caller-owned float64 array of shape (Npairs,), or (P, Npairs) for 3D input, to write into
+    energy: optional caller-owned float64 array of shape (M,), or (P, M) for 3D input, to write into
+
+    Returns:
+    ----
+    cross: float64 cross sums of each pair (m, m+lags[l]), ordered by lag then m, Npairs = sum of M-lags[l]
+    energy: float64 energy of each channel about its mean
+    """
+    if np.ndim(arr) == 2:
+        arr, fmt, M, N, sm, sn = _channelview(arr, axis)
+        if fmt is None: raise ValueError("lagSums only supports real data")
+        P, sp, shape = 1, ct.c_ssize_t(0), ()
+    elif np.ndim(arr) == 3:
+        arr, fmt = asrf(arr)
+        P, M, N = arr.shape
+        sp, sm, sn = estrides(arr)
+        shape = (P,)
+    else:
+        raise ValueError("Input array must be 2D (elements by samples) or 3D (points by elements by kernel)")
+
+    lags = np.array(lags, dtype=np.int32).flatten()
+    if np.any(lags < 0) or np.any(lags >= M): raise ValueError("lags must be between 0 and nele-1")
+    Npairs = int(np.sum(M - lags))
+    cross = outbuf(cross, shape + (Npairs,), np.float64)
+    energy = outbuf(energy, shape + (M,), np.float64)
+
+    dptr = lambda a: a.ctypes.data_as(ct.POINTER(ct.c_double))
+    __rho__.lagSums(vptr(arr), fmt, P, M, N, sp, sm, sn, iptr(lags), ct.c_int(lags.size), dptr(cross), dptr(energy))
+
+    return cross, energy
+
+def _shortlags(lags, nele:int):
+    """int32 vector of lag indices from either a maximum lag or a list of lags"""
+    if np.ndim(lags) == 0:
+        lags = np.arange(1, int(lags)+1)
+    lags = np.array(lags, dtype=np.int32).flatten()
+    if lags.size == 0: raise ValueError("At least one lag must be given")
+    if np.any(lags < 1) or np.any(lags >= nele):
+        raise ValueError("lags must be between 1 and nele-1")
+    return lags
+
+@staged('slscPoints')
+@kernel('slscPoints')
+def slscPoints(cube, lags=1, out=None):
+    """calculate the short-lag spatial coherence of delayed channel data, one value per point
     
-    # Make the sample axis the fast axis
-    if axis == 1:
-        c_arr, M, N = cnp.copy2c(arr.T)
-        nele = arr.shape[1]
+    Parameters:
+    ----
+    cube: P by M by K tensor of focused channel data (points by elements by kernel samples), read in place if float32
+    lags: maximum lag Q to integrate lags 1 through Q, or a list of lag indices
+    out: optional caller-owned float32 vector of length P to write into
+
+    Returns:
+    ----
+    slsc: float32 vector of length P, the sum of the normalized correlation over the lags at each point
+    """
+
+    if np.ndim(cube) != 3:
+        raise ValueError("Input array must be 3D (points by elements by kernel)")
+    
+    cube = asfloat32(cube)
+    P, M, K = cube.shape
+    sp, sm, sk = estrides(cube)
+    lags = _shortlags(lags, M)
+    out = outbuf(out, P)
+
+    __rho__.slscPoints(fptr(cube), P, M, K, sp, sm, sk, iptr(lags), ct.c_int(lags.size), fptr(out))
+
+    return out
+
+@staged('slscSliding')
+@kernel('slscSliding')
+def slscSliding(arr, nkernel:int, lags=1, out=None):
+    """calculate a short-lag spatial coherence image from depth-sorted channel data with a sliding axial kernel
+
+    The window sums are updated from cumulative sums, so the cost per pixel does not depend on nkernel.
+    
+    Parameters:
+    ----
+    arr: Q by M by N tensor (scan lines by elements by depth samples), or a single M by N scan line, read in place if 
+        float32, int16 or float16
+    nkernel: the length of the axial kernel in samples, centered on each output sample
+    lags: maximum lag Q to integrate lags 1 through Q, or a list of lag indices
+    out: optional caller-owned float32 array of shape (Q, N), or (N,) for a single line, to write into
+
+    Returns:
+    ----
+    slsc: float32 image holding the sum of the normalized correlation over the lags at each sample
+    """
+
+    if np.ndim(arr) not in (2, 3):
+        raise ValueError("Input array must be 2D (elements by samples) or 3D (lines by elements by samples)")
+    if nkernel < 1: raise ValueError("nkernel must be at least 1")
+
+    arr, fmt = asrf(arr)
+    single = arr.ndim == 2
+    if single: arr = arr[np.newaxis]
+    Q, M, N = arr.shape
+    sq, sm, sn = estrides(arr)
+    lags = _shortlags(lags, M)
+    out = outbuf(out, (N,) if single else (Q, N))
+
+    __rho__.slscSliding(vptr(arr), fmt, Q, M, N, sq, sm, sn, ct.c_int(nkernel), iptr(lags), ct.c_int(lags.size), fptr(out))
+
+    return out
+
+# apodization windows across the active aperture, matching the APOD_* codes in rho.h
+APODIZATIONS = {None: 0, 'rect': 0, 'hann': 1, 'hamming': 2}
+
+def _asdelaymodel(delays):
+    """wrap a table in a delay model, passing delay models through"""
+    if isinstance(delays, DelayModel): return delays
+    return tabledelays(delays)
+
+def _txgroups(txgroups, Ntx:int):
+    """(order, start) int32 vectors of the transmits of each group and the offset of each group into order, 
+    (None, None) to compound every transmit into a single group"""
+    if txgroups is None: return None, None
+    groups = [np.array(group, dtype=np.int32).flatten() for group in txgroups]
+    if len(groups) == 0: raise ValueError("txgroups must hold at least one group")
+    if any(group.size == 0 for group in groups): raise ValueError("every group of txgroups must hold at least one transmit")
+    order = np.concatenate(groups)
+    if np.any(order < 0) or np.any(order >= Ntx): raise ValueError("txgroups must only hold transmits between 0 and Ntx-1")
+    start = np.cumsum([0] + [group.size for group in groups]).astype(np.int32)
+    return order, start
+
+def _modelpoints(tx, rx, points):
+    """the number of points P shared by two delay models and optional points, with the point pointer and strides"""
+    # the number of points comes from the points, or from the tables if every delay is stored
+    Ps = [model.P for model in (tx, rx) if model.P is not None]
+    if points is not None:
+        if (np.ndim(points) != 2) or (np.shape(points)[1] != 3): raise ValueError("points must be P by 3")
+        points = asfloat32(points)
+        Ps.append(points.shape[0])
+        sp, sd = estrides(points)
+        ppoints = fptr(points)
+    elif len(Ps) < 2:
+        raise ValueError("points are required when delays are recomputed from geometry")
     else:
-        c_arr, M, N = cnp.copy2c(arr)
-        nele = arr.shape[0]
+        sp, sd = ct.c_ssize_t(0), ct.c_ssize_t(0)
+        ppoints = ct.POINTER(ct.c_float)()
+    if any(P != Ps[0] for P in Ps): raise ValueError("tx, rx, and points must all describe the same number of points")
+    return Ps[0], points, ppoints, sp, sd
 
-    # make a buffer
-    rhos = np.zeros(nele-1)
+def _fusedinputs(data, tx, rx, nkernel:int, lags, points, aperture, apod, fc, txgroups=None, order=None, tile:int=0):
+    """validate the inputs shared by the fused kernels and convert them to what the kernels read
 
-    for lag in range(nele-1):
-        # calculate the lag
-        rho = __rho__.lagNRho(ct.byref(c_arr), M, N, ct.c_int(lag))
-        rhos[lag] = float(rho)
-    cnp.free(c_arr, M, N)
+    Returns:
+    ----
+    inputs: dict of the data and its format, shape and strides, the delay models, the transmit groups, the number 
+        of points P, the point pointer and strides, the lags, the aperture pointers, and the point order and tile 
+        size, holding every array the pointers refer to
+    """
+    if np.ndim(data) != 3: raise ValueError("Input data must be 3D (Ntx by Nrx by Nsamp)")
+    if nkernel < 1: raise ValueError("nkernel must be at least 1")
 
-    # return the python-friendly value
-    return rhos
\ No newline at end of file
+    iq = np.iscomplexobj(data)
+    if iq and (fc is None): raise ValueError("fc is required for complex IQ data")
+    data, fmt = (ascomplex64(data), None) if iq else asrf(data)
+    Ntx, Nrx, Ns = data.shape
+    tx = _asdelaymodel(tx)
+    rx = _asdelaymodel(rx)
+    if tx.N != Ntx: raise ValueError("tx must describe Ntx transmits")
+    if rx.N != Nrx: raise ValueError("rx must describe Nrx receive channels")
+    P, points, ppoints, sp, sd = _modelpoints(tx, rx, points)
+
+    # active receive aperture of each point
+    if apod not in APODIZATIONS: raise ValueError(f"apod must be one of {list(APODIZATIONS)}")
+    if aperture is None:
+        lo = hi = None
+        aplo, aphi = ct.POINTER(ct.c_int)(), ct.POINTER(ct.c_int)()
+    else:
+        lo, hi = (np.ascontiguousarray(ap, dtype=np.int32).ravel() for ap in aperture)
+        if (lo.size != P) or (hi.size != P): raise ValueError("aperture must hold one range per point")
+        if np.any(lo < 0) or np.any(hi > Nrx) or np.any(hi < lo): raise ValueError("aperture ranges must lie within 0 and Nrx")
+        aplo, aphi = iptr(lo), iptr(hi)
+
+    # transmits compounded together before the coherence is taken
+    txorder, txstart = _txgroups(txgroups, Ntx)
+    if txorder is None:
+        ptxorder, ptxstart, G = ct.POINTER(ct.c_int)(), ct.POINTER(ct.c_int)(), 1
+    else:
+        ptxorder, ptxstart, G = iptr(txorder), iptr(txstart), txstart.size - 1
+
+    # order the points are visited in, outputs are written in the caller's order regardless
+    if tile < 0: raise ValueError("tile must be non-negative")
+    if order is None:
+        porder = ct.POINTER(ct.c_int)()
+    else:
+        order = np.ascontiguousarray(order, dtype=np.int32).ravel()
+        if order.size != P: raise ValueError("order must hold one index per point")
+        if np.any(order < 0) or np.any(order >= P): raise ValueError("order must only hold points between 0 and P-1")
+        if np.bincount(order, minlength=P).max() != 1: raise ValueError("order must be a permutation of the points, visiting each once")
+        porder = iptr(order)
+
+    return dict(data=data, fmt=fmt, iq=iq, shape=(Ntx, Nrx, Ns), strides=estrides(data), tx=tx, rx=rx, P=P, 
+                points=points, ppoints=ppoints, sp=sp, sd=sd, lags=_shortlags(lags, Nrx), lo=lo, hi=hi, aplo=aplo, aphi=aphi,
+                txorder=txorder, txstart=txstart, ptxorder=ptxorder, ptxstart=ptxstart, G=G, order=order, porder=porder, tile=int(tile))
+
+def _worksize(shape, nkernel:int, iq:bool, sweep:bool=False):
+    """floats of scratch the fused kernel, or the sweep kernel, works in at the current thread count"""
+    Ntx, Nrx = shape[0], shape[1]
+    perthread = int(__rho__.fusedWork(Ntx, Nrx, int(nkernel), int(iq))) + (Ntx + Nrx if sweep else 0)
+    return perthread * int(__rho__.getRhoThreads())
+
+def _workptr(work, shape, nkernel:int, iq:bool, sweep:bool=False):
+    """float pointer to a validated work buffer, NULL for None"""
+    if work is None: return ct.POINTER(ct.c_float)()
+    if (not isinstance(work, np.ndarray)) or (work.dtype != np.float32) or (not work.flags.c_contiguous) or (work.size < _worksize(shape, nkernel, iq, sweep)):
+        raise ValueError(f"work must be a C-contiguous float32 array of at least fusedworksize(data.shape, nkernel, {'sweep=True' if sweep else 'iq'}) values")
+    return fptr(work)
+
+@kernel('fusedworksize')
+def fusedworksize(shape, nkernel:int=5, iq:bool=False, sweep:bool=False):
+    """the number of floats of the work buffer slscFused and slscSums, or slscSweep, can reuse across calls
+    
+    The size scales with the number of threads, so it is to be taken again after set_num_threads.
+
+    Parameters:
+    ----
+    shape: the shape (Ntx, Nrx, Nsamp) of the data
+    nkernel: the length of the axial kernel in samples
+    iq: whether the data is complex IQ data
+    sweep: whether the buffer is for slscSweep, which also holds the delays of a point per thread
+
+    Returns:
+    ----
+    nwork: the number of float32 values, 0 if the backend needs no work buffer
+    """
+    return _worksize(shape, nkernel, iq, sweep)
+
+def _runfused(f:dict, fs:float, tstart:float, nkernel:int, apod, out, fc=None, part:str='real', rhos=None, Q:int=0, spec=None, energy=None,
+              work=None):
+    """call the fused kernel of the data type on inputs from _fusedinputs, with optional accumulator outputs and work buffer"""
+    Ntx, Nrx, Ns = f['shape']
+    st, sr, ss = f['strides']
+    lags = f['lags']
+    null = ct.POINTER(ct.c_float)()
+    pwork = _workptr(work, f['shape'], nkernel, f['iq'])
+    if f['iq']:
+        __rho__.slscFusedIQ(
+            fptr(f['data']), Ntx, Nrx, Ns, st, sr, ss, ct.c_float(fs), ct.c_float(fc), ct.c_float(tstart), 
+            f['P'], f['ppoints'], f['sp'], f['sd'], ct.byref(f['tx']), ct.byref(f['rx']), 
+            f['ptxorder'], f['ptxstart'], ct.c_int(f['G']), f['aplo'], f['aphi'], ct.c_int(APODIZATIONS[apod]),
+            ct.c_int(nkernel), iptr(lags), ct.c_int(lags.size), _iqpart(part), fptr(out), pwork, f['porder'], ct.c_int(f['tile'])
+        )
+        return out
+
+    __rho__.slscFused(
+        vptr(f['data']), f['fmt'], Ntx, Nrx, Ns, st, sr, ss, ct.c_float(fs), ct.c_float(tstart), 
+        f['P'], f['ppoints'], f['sp'], f['sd'], ct.byref(f['tx']), ct.byref(f['rx']), 
+        f['ptxorder'], f['ptxstart'], ct.c_int(f['G']), f['aplo'], f['aphi'], ct.c_int(APODIZATIONS[apod]),
+        ct.c_int(nkernel), iptr(lags), ct.c_int(lags.size), fptr(out),
+        null if rhos is None else fptr(rhos), ct.c_int(Q), null if spec is None else fptr(spec), null if energy is None else fptr(energy),
+        pwork, f['porder'], ct.c_int(f['tile'])
+    )
+    return out
+
+@staged('slscFused')
+@kernel('slscFused')
+def slscFused(data, tx, rx, fs:float, tstart:float=0, nkernel:int=5, lags=1, points=None, aperture=None, apod:str|None=None, out=None,
+              fc:float|None=None, part:str='real', work=None, txgroups=None, order=None, tile:int=0):
+    """delay, interpolate, and take the short-lag spatial coherence of raw RF data in a single pass
+
+    Transmits are delayed and summed into one kernel per point, which is the only channel buffer held in 
+    memory, so no points by elements by kernel cube is formed. With txgroups, each group of transmits, e.g. a 
+    subset of plane wave angles, is compounded into that kernel in turn and the coherence averaged over the groups,
+    so the memory does not grow with the number of transmits or groups. Complex IQ data is delayed by a coarse shift of 
+    the baseband samples plus a rotation of the carrier phase, so it can be sampled at 1-2 samples per cycle.
+    
+    Parameters:
+    ----
+    data: Ntx by Nrx by Nsamp tensor of RF data, read in place if float32, int16 or float16, or of complex IQ data 
+        from demodIQ, read in place if complex64
+    tx: Ntx by P matrix of transmit delays in s, or a DelayModel of the transmits
+    rx: Nrx by P matrix of receive delays in s, or a DelayModel of the receive channels
+    fs: sampling frequency of data in Hz, the decimated rate for IQ data
+    tstart: time of the first sample in s
+    nkernel: the length of the axial kernel in samples of data, centered on each point
+    lags: maximum lag Q to integrate lags 1 through Q, or a list of lag indices
+    points: P by 3 matrix of points, required if either model recomputes delays from geometry
+    aperture: optional (lo, hi) pair of length P vectors of the first and one past the last active receive channel 
+        of each point, e.g. from pyrho.trig.getaperture. Channels and pairs outside of it are skipped, and so are the 
+        lags of hi-lo or more, which contribute 0, so points with narrower apertures sum fewer lags
+    apod: None or 'rect' (default) for uniform weights, or 'hann' or 'hamming' to weight the pairs of each 
+        point's active channels by a window across them
+    out: optional caller-owned float32 vector of length P to write into
+    fc: demodulation frequency of IQ data in Hz, required for complex data
+    part: for complex IQ data, 'real' (default) or 'abs' to keep the real part or the magnitude of each pair's 
+        normalized complex correlation
+    work: optional caller-owned float32 scratch buffer of at least fusedworksize(data.shape, nkernel, iq) values, 
+        reused across calls instead of allocating the scratch of each thread per call
+    txgroups: optional sequence of groups of transmit indices. The transmits of each group are compounded 
+        coherently and the coherence is averaged over the groups, e.g. [[i] for i in range(Ntx)] to average the 
+        coherence of each transmit. Transmits in no group are skipped. If None (default), every transmit is 
+        compounded before the coherence is taken
+    order: optional permutation of the points to visit them in, e.g. from pyrho.processors.tileorder, so that 
+        consecutive points share their RF samples in cache. The outputs are in the order of the points regardless
+    tile: the number of consecutive points of order each thread takes at a time, 0 (default) for 64
+
+    Returns:
+    ----
+    slsc: float32 vector of length P, the sum of the normalized correlation over the lags at each point
+    """
+
+    f = _fusedinputs(data, tx, rx, nkernel, lags, points, aperture, apod, fc, txgroups, order, tile)
+    out = outbuf(out, f['P'])
+    return _runfused(f, fs, tstart, nkernel, apod, out, fc, part, work=work)
+
+# coherence metrics that coherencemetrics derives from the accumulators of slscSums
+METRICS = ('slsc', 'cf', 'gcf', 'lwslsc')
+
+def _sumsbufs(out, P:int, L:int, m0:int):
+    """the accumulator arrays of slscSums, taken from a dict of caller-owned arrays where given"""
+    if out is None: out = {}
+    shapes = dict(slsc=P, rhos=(P, L), spectrum=(P, m0+1), energy=P)
+    unknown = [key for key in out if key not in shapes]
+    if unknown: raise ValueError(f"out may only hold {list(shapes)}")
+    return {key: outbuf(out.get(key), shape) for key, shape in shapes.items()}
+
+@staged('slscSums')
+@kernel('slscSums')
+def slscSums(data, tx, rx, fs:float, tstart:float=0, nkernel:int=5, lags=1, points=None, aperture=None, apod:str|None=None, m0:int=0,
+             out=None, work=None, txgroups=None, order=None, tile:int=0):
+    """delay and interpolate raw RF data once and accumulate everything the coherence metrics are derived from
+
+    The same single pass as slscFused. Besides the SLSC sum, each point's per-lag coherence and the energy of the
+    lowest spatial frequencies of its channel kernel (the coherent sum at frequency 0) and its incoherent energy 
+    are kept, so SLSC, the coherence factor, the generalized coherence factor and lag-weighted SLSC all follow 
+    from one pass, see coherencemetrics. Only real RF data is supported. With txgroups, every accumulator is the 
+    average over the groups.
+
+    Parameters:
+    ----
+    data, tx, rx, fs, tstart, nkernel, lags, points, aperture, apod, work, txgroups, order, tile: as in slscFused
+    m0: the highest spatial frequency index kept for the generalized coherence factor, 0 for the coherence factor only
+    out: optional dict of caller-owned float32 arrays to write any of 'slsc', 'rhos', 'spectrum' and 'energy' into
+
+    Returns:
+    ----
+    sums: dict of float32 arrays
+        'slsc': length P vector of the sum of the lag coherences
+        'rhos': P by L matrix of the coherence of each lag
+        'spectrum': P by m0+1 matrix of the energy at spatial frequencies 0 through m0, both signs counted
+        'energy': length P vector of the incoherent energy, sum of x^2 over the active channels and kernel samples
+        'nchan': length P int32 vector of the number of active channels
+        'lags': the lag indices of the columns of 'rhos'
+    """
+
+    if np.iscomplexobj(data): raise ValueError("slscSums only supports real RF data")
+    if m0 < 0: raise ValueError("m0 must be non-negative")
+    f = _fusedinputs(data, tx, rx, nkernel, lags, points, aperture, apod, None, txgroups, order, tile)
+    P, L = f['P'], f['lags'].size
+
+    sums = _sumsbufs(out, P, L, m0)
+    _runfused(f, fs, tstart, nkernel, apod, sums['slsc'], rhos=sums['rhos'], Q=int(m0), spec=sums['spectrum'], energy=sums['energy'],
+              work=work)
+
+    Nrx = f['shape'][1]
+    sums['nchan'] = np.full(P, Nrx, dtype=np.int32) if f['lo'] is None else f['hi'] - f['lo']
+    sums['lags'] = f['lags']
+    return sums
+
+def _sweepinputs(speeds, c, txoff, rxoff, Ntx:int, Nrx:int):
+    """float32 slowness of each speed of sound, the reference speeds (txc, rxc), and the fixed transmit and receive 
+    delays of slscSweep, None for 0"""
+    speeds = np.asarray(speeds, dtype=np.float64).ravel()
+    if speeds.size == 0: raise ValueError("speeds must hold at least one speed of sound")
+    if np.any(~np.isfinite(speeds)) or np.any(speeds <= 0): raise ValueError("speeds must be positive")
+    refs = np.broadcast_to(np.asarray(c, dtype=np.float64), (2,)) if np.size(c) in (1, 2) else None
+    if (refs is None) or np.any(~np.isfinite(refs)) or np.any(refs <= 0): raise ValueError("c must be a positive speed of sound or a (txc, rxc) pair")
+    offs = []
+    for off, N, name, per in ((txoff, Ntx, 'txoff', 'transmit'), (rxoff, Nrx, 'rxoff', 'receive channel')):
+        if off is not None:
+            off = np.ascontiguousarray(off, dtype=np.float32).ravel()
+            if off.size != N: raise ValueError(f"{name} must hold one delay per {per}")
+        offs.append(off)
+    return (1/speeds).astype(np.float32), (float(refs[0]), float(refs[1])), offs[0], offs[1]
+
+@staged('slscSweep')
+@kernel('slscSweep')
+def slscSweep(data, tx, rx, fs:float, speeds, tstart:float=0, nkernel:int=5, lags=1, points=None, aperture=None, apod:str|None=None,
+              txoff=None, rxoff=None, out=None, txgroups=None, order=None, tile:int=0, c=1540, work=None):
+    """short-lag spatial coherence of raw RF data for a vector of speeds of sound, in a single pass
+
+    Geometric delays are path lengths divided by the speed of sound, so the delays tx and rx, taken at the speed of
+    sound c, are rescaled to each speed past txoff and rxoff, the delays that do not scale with it such as plane wave 
+    reference delays: txoff + (tx - txoff) * c / speed. The delays of each point are read once, from the same tables 
+    or geometry slscFused uses, and rescaled for every speed while the point's RF is in cache, so no table beyond 
+    those is built and no full reconstruction is taken per speed.
+
+    Parameters:
+    ----
+    data: Ntx by Nrx by Nsamp tensor of RF data, read in place if float32, int16 or float16
+    tx: Ntx by P matrix of transmit delays in s at the speed of sound c, or a DelayModel of them, e.g. PWTX.delays()
+    rx: Nrx by P matrix of receive delays in s at the speed of sound c, or a DelayModel of them, e.g. FullRX.delays()
+    fs: sampling frequency of data in Hz
+    speeds: vector of the Nc speeds of sound in m/s
+    tstart, nkernel, lags, points, aperture, apod, txgroups, order, tile: as in slscFused
+    txoff, rxoff: optional vectors of the parts of the Ntx and Nrx delays in s that do not scale with the speed of 
+        sound, kept at every speed. None for 0
+    out: optional caller-owned float32 Nc by P matrix to write into
+    c: the speed of sound in m/s tx and rx are taken at, or a (txc, rxc) pair if they differ
+    work: optional caller-owned float32 scratch buffer of at least fusedworksize(data.shape, nkernel, sweep=True) 
+        values, reused across calls instead of allocating the scratch of each thread per call
+
+    Returns:
+    ----
+    slsc: float32 Nc by P matrix, the SLSC of each point at each speed of sound
+    """
+
+    if np.iscomplexobj(data): raise ValueError("slscSweep only supports real RF data")
+    f = _fusedinputs(data, tx, rx, nkernel, lags, points, aperture, apod, None, txgroups, order, tile)
+    Ntx, Nrx, Ns = f['shape']
+    st, sr, ss = f['strides']
+    slowness, (txc, rxc), txoff, rxoff = _sweepinputs(speeds, c, txoff, rxoff, Ntx, Nrx)
+    lags = f['lags']
+    out = outbuf(out, (slowness.size, f['P']))
+    null = ct.POINTER(ct.c_float)()
+    pwork = _workptr(work, f['shape'], nkernel, False, sweep=True)
+
+    __rho__.slscSweep(
+        vptr(f['data']), f['fmt'], Ntx, Nrx, Ns, st, sr, ss, ct.c_float(fs), ct.c_float(tstart), 
+        f['P'], f['ppoints'], f['sp'], f['sd'], ct.byref(f['tx']), ct.byref(f['rx']), 
+        null if txoff is None else fptr(txoff), null if rxoff is None else fptr(rxoff), ct.c_float(txc), ct.c_float(rxc),
+        f['ptxorder'], f['ptxstart'], ct.c_int(f['G']), f['aplo'], f['aphi'], ct.c_int(APODIZATIONS[apod]),
+        ct.c_int(nkernel), iptr(lags), ct.c_int(lags.size), fptr(slowness), ct.c_int(slowness.size), fptr(out), pwork,
+        f['porder'], ct.c_int(f['tile'])
+    )
+    return out
+
+def coherencemetrics(sums:dict, metrics=METRICS, m0:int|None=None, weights=None, out=None):
+    """derive coherence images from the accumulators of slscSums, without touching the channel data again
+
+    Parameters:
+    ----
+    sums: the accumulators returned by slscSums
+    metrics: names of the images to derive, any of
+        'slsc': short-lag spatial coherence, the sum of the lag coherences
+        'cf': coherence factor, |sum of channels|^2 / (M * sum of |channel|^2) over the kernel
+        'gcf': generalized coherence factor, the fraction of the kernel's energy within spatial frequencies -m0 to m0
+        'lwslsc': lag-weighted SLSC, the lag coherences weighted by weights
+    m0: the highest spatial frequency of the generalized coherence factor. Defaults to every frequency in sums
+    weights: length L vector of lag weights for 'lwslsc'. Defaults to the coherence of each lag averaged over the 
+        image, scaled to sum to L so that uniform coherence reproduces SLSC, or uniform weights if those sum to 0 or less
+    out: optional dict mapping any of the metrics to a caller-owned float32 vector of length P to write into
+
+    Returns:
+    ----
+    images: dict mapping each requested metric to a float32 vector of length P
+    """
+    if isinstance(metrics, str): metrics = (metrics,)
+    unknown = [metric for metric in metrics if metric not in METRICS]
+    if unknown: raise ValueError(f"metrics must be among {METRICS}")
+
+    spectrum = sums['spectrum']
+    if m0 is None: m0 = spectrum.shape[1] - 1
+    if (m0 < 0) or (m0 >= spectrum.shape[1]): raise ValueError("m0 must be between 0 and the m0 the sums were accumulated with")
+
+    if out is None: out = {}
+    P = sums['slsc'].size
+
+    # total energy of all spatial frequencies, by Parseval
+    total = sums['nchan'].astype(np.float32) * sums['energy']
+    def ratio(num, metric):
+        image = outbuf(out.get(metric), P)
+        image[...] = 0
+        return np.divide(num, total, out=image, where=total > 0)
+
+    images = {}
+    for metric in metrics:
+        if metric == 'slsc':
+            if metric in out:
+                images[metric] = outbuf(out[metric], P)
+                images[metric][...] = sums['slsc']
+            else:
+                images[metric] = sums['slsc']
+        elif metric == 'cf':
+            images[metric] = ratio(spectrum[:,0], metric)
+        elif metric == 'gcf':
+            images[metric] = ratio(np.sum(spectrum[:,:m0+1], axis=1), metric)
+        else:
+            rhos = sums['rhos']
+            if weights is None:
+                w = np.mean(rhos, axis=0)
+                w = w * rhos.shape[1] / np.sum(w) if np.sum(w) > 0 else np.ones(rhos.shape[1])
+            else:
+                w = np.asarray(weights, dtype=np.float64).flatten()
+                if w.size != rhos.shape[1]: raise ValueError("weights must hold one weight per lag")
+            images[metric] = outbuf(out.get(metric), P)
+            images[metric][...] = rhos @ w
+    return images
+
+# interpolation kernels of the fractional delay tables, matching the INTERP_* codes in rho.h
+INTERPKINDS = {'nearest': 0, 'linear': 1, 'cubic': 2, 'sinc': 3}
+
+def interpwidth(kind:str='linear', taps:int=8):
+    """the number of samples W each delay of an interpolation table reads, 1, 2, 4, or taps for 'sinc'"""
+    if kind not in INTERPKINDS: raise ValueError(f"kind must be one of {list(INTERPKINDS)}")
+    if kind != 'sinc': return {'nearest': 1, 'linear': 2, 'cubic': 4}[kind]
+    if (taps < 2) or (taps % 2): raise ValueError("taps must be an even number of at least 2")
+    return int(taps)
+
+class InterpTable():
+    def __init__(self, index, weights, kind:str, nsamp:int):
+        """Precomputed fractional delays of one geometry, applied to every frame by interpgather
+
+        Parameters:
+        ----
+        index: Ntx by Nrx by P int32 tensor of the first of the W samples each delay reads
+        weights: Ntx by Nrx by P by W float32 or float16 tensor of the weights of those samples
+        kind: the interpolation kernel the weights were taken from
+        nsamp: the number of samples per trace the table applies to
+        """
+        if np.ndim(index) != 3: raise ValueError("index must be Ntx by Nrx by P")
+        if (np.ndim(weights) != 4) or (np.shape(weights)[:3] != np.shape(index)): raise ValueError("weights must be Ntx by Nrx by P by W")
+        if np.dtype(weights.dtype) not in (np.float32, np.float16): raise ValueError("weights must be float32 or float16")
+        self.index = np.ascontiguousarray(index, dtype=np.int32)
+        self.weights = np.ascontiguousarray(weights)
+        self.kind = kind
+        self.nsamp = int(nsamp)
+        self.shape = self.index.shape
+        self.width = self.weights.shape[3]
+
+    @property
+    def nbytes(self):
+        """bytes held by the index and weight tables"""
+        return self.index.nbytes + self.weights.nbytes
+
+@staged('interptable')
+@kernel('interptable')
+def interptable(tx, rx, nsamp:int, fs:float, tstart:float=0, points=None, kind:str='linear', taps:int=8, dtype=np.float32):
+    """convert every transmit, receive channel and point's delay into sample indices and interpolation weights, once
+
+    The delay of each triple, the sum of its transmit and receive delays, becomes the first of W consecutive samples 
+    and their weights. The first sample is clamped so the W samples lie within the trace, with zero weights for the
+    samples the kernel does not reach, so applying the table to a frame with interpgather is a gather and 
+    multiply-add with no index arithmetic or bounds checks. Build it once per geometry and reuse it across frames.
+
+    Parameters:
+    ----
+    tx: Ntx by P matrix of transmit delays in s, or a DelayModel of the transmits
+    rx: Nrx by P matrix of receive delays in s, or a DelayModel of the receive channels
+    nsamp: the number of samples of each trace of the frames the table is applied to
+    fs: sampling frequency in Hz
+    tstart: time of the first sample in s
+    points: P by 3 matrix of points, required if either model recomputes delays from geometry
+    kind: the interpolation kernel, 'nearest', 'linear' (default), 'cubic' for Catmull-Rom, or 'sinc' for a 
+        Hann-windowed sinc normalized to unit DC gain
+    taps: the number of taps of the 'sinc' kernel, an even number
+    dtype: np.float32 (default) or np.float16 to store the weights at half the size, written as half floats by the kernel
+
+    Returns:
+    ----
+    table: an InterpTable of Ntx by Nrx by P int32 indices and Ntx by Nrx by P by W weights
+    """
+    W = interpwidth(kind, taps)
+    if np.dtype(dtype) not in (np.float32, np.float16): raise ValueError("dtype must be np.float32 or np.float16")
+    if nsamp < W: raise ValueError(f"nsamp must be at least the {W} samples of the kernel")
+    tx = _asdelaymodel(tx)
+    rx = _asdelaymodel(rx)
+    P, points, ppoints, sp, sd = _modelpoints(tx, rx, points)
+
+    index = np.empty((tx.N, rx.N, P), dtype=np.int32)
+    weights = np.empty((tx.N, rx.N, P, W), dtype=dtype)
+    __rho__.interpTable(tx.N, rx.N, int(nsamp), ct.c_float(fs), ct.c_float(tstart), P, ppoints, sp, sd, ct.byref(tx), ct.byref(rx),
+                        ct.c_int(INTERPKINDS[kind]), ct.c_int(W), iptr(index), vptr(weights), ct.c_int(weights.dtype == np.float16))
+    return InterpTable(index, weights, kind, nsamp)
+
+@staged('interpgather')
+@kernel('interpgather')
+def interpgather(data, table:InterpTable, compound:bool=False, out=None):
+    """apply a precomputed interpolation table to a frame of RF data
+
+    Parameters:
+    ----
+    data: Ntx by Nrx by Nsamp tensor of RF data, read in place if float32, int16 or float16
+    table: InterpTable from interptable, built for the same Ntx, Nrx and Nsamp
+    compound: whether to sum the delayed data over transmits
+    out: optional caller-owned float32 array to write into
+
+    Returns:
+    ----
+    delayed: float32 Ntx by Nrx by P tensor of the data interpolated at every delay, or Nrx by P if compounded
+    """
+    if np.ndim(data) != 3: raise ValueError("Input data must be 3D (Ntx by Nrx by Nsamp)")
+    if not isinstance(table, InterpTable): raise ValueError("table must be an InterpTable from interptable")
+    data, fmt = asrf(data)
+    Ntx, Nrx, Ns = data.shape
+    if (Ntx, Nrx) != table.shape[:2]: raise ValueError("data must have the Ntx transmits and Nrx channels of the table")
+    if Ns != table.nsamp: raise ValueError("data must have the nsamp samples per trace the table was built for")
+    P = table.shape[2]
+    out = outbuf(out, (Nrx, P) if compound else (Ntx, Nrx, P))
+
+    st, sr, ss = estrides(data)
+    __rho__.interpGather(vptr(data), fmt, Ntx, Nrx, st, sr, ss, P, table.width, iptr(table.index), vptr(table.weights),
+                         ct.c_int(table.weights.dtype == np.float16), ct.c_int(bool(compound)), fptr(out))
+    return out
+
+def lowpass(ntaps:int, cutoff:float):
+    """Hamming-windowed sinc low-pass filter with unit DC gain
+
+    Parameters:
+    ----
+    ntaps: the number of taps, made odd so the filter is centered on a tap
+    cutoff: the cutoff frequency as a fraction of the sampling frequency, between 0 and 0.5
+
+    Returns:
+    ----
+    taps: float32 vector of filter taps
+    """
+    ntaps = int(ntaps) | 1
+    n = np.arange(ntaps) - (ntaps-1)/2
+    taps = 2*cutoff*np.sinc(2*cutoff*n) * np.hamming(ntaps)
+    return (taps/np.sum(taps)).astype(np.float32)
+
+@staged('demodIQ')
+@kernel('demodIQ')
+def demodIQ(data, fs:float, fc:float, decim:int=2, tstart:float=0, taps=None, axis:int=-1, out=None):
+    """mix RF data down to baseband, low-pass filter it, and decimate it into complex IQ data
+
+    The phase of the IQ data is referenced to absolute time, so the IQ kernels restore the carrier phase of any 
+    delay by a rotation. Decimating fs = 4*fc RF by 2 to 4 leaves 1-2 IQ samples per cycle, cutting the data and 
+    the cost of the coherence kernels by as much.
+
+    Parameters:
+    ----
+    data: RF data of any shape, read in place if float32, int16 or float16
+    fs: RF sampling frequency in Hz
+    fc: demodulation frequency in Hz, usually the center frequency of the transducer
+    decim: decimation factor, the IQ data is sampled at fs/decim
+    tstart: time of the first sample in s, which is also the time of the first IQ sample
+    taps: low-pass filter taps applied at fs before decimating. Defaults to lowpass(8*decim+1, 0.5/decim)
+    axis: the time axis of data
+    out: optional caller-owned C-contiguous complex64 array of the shape of data with ceil(Nsamp/decim) samples 
+        along axis, where axis is the last axis, to write into
+
+    Returns:
+    ----
+    iq: complex64 IQ data with ceil(Nsamp/decim) samples along axis
+    """
+    if decim < 1: raise ValueError("decim must be at least 1")
+    if taps is None: taps = lowpass(8*decim+1, 0.5/decim)
+    taps = np.ascontiguousarray(taps, dtype=np.float32).flatten()
+    if taps.size < 1: raise ValueError("taps must hold at least one tap")
+
+    # traces along the last axis, a reshape only copies when the other axes cannot be merged
+    arr, fmt = asrf(data)
+    arr = np.moveaxis(arr, axis, -1)
+    shape = arr.shape
+    arr = arr.reshape(-1, shape[-1])
+    T, Ns = arr.shape
+    st, ss = estrides(arr)
+    Nout = -(-Ns // decim)
+
+    if (out is not None) and ((axis % len(shape)) != len(shape)-1): raise ValueError("out requires axis to be the last axis")
+    out = outbuf(out, shape[:-1] + (Nout,), np.complex64)
+    __rho__.demodIQ(
+        vptr(arr), fmt, T, Ns, st, ss, ct.c_float(fs), ct.c_float(fc), ct.c_float(tstart), 
+        fptr(taps), ct.c_int(taps.size), ct.c_int(decim), ct.c_int(Nout), fptr(out)
+    )
+
+    return np.moveaxis(out, -1, axis)
@@ -1,69 +1,292 @@
 #include "rho.h"
 
+// number of threads requested for the kernels of this library, 0 defers to the OpenMP default (OMP_NUM_THREADS)
+static int rhothreads = 0;
+
 /**
- * lagnrho: calculate the nth lag
+ * setRhoThreads: set the number of threads used by the coherence kernels
+ * 
+ * Parameters:
+ * n: the number of threads, 0 or less to use the OpenMP default
+*/
+void setRhoThreads(int n)
+{
+    rhothreads = (n > 0) ? n : 0;
+}
+
+/**
+ * getRhoThreads: the number of threads the coherence kernels will use
+*/
+int getRhoThreads(void)
+{
+#ifdef _OPENMP
+    return (rhothreads > 0) ? rhothreads : omp_get_max_threads();
+#else
+    return 1;
+#endif
+}
+
+// instrumentation counters of each RHOSTAT_* stage, only updated while rhostats is nonzero
+static int rhostats = 0;
+static double statseconds[RHOSTAT_N];
+static long long statcalls[RHOSTAT_N];
+static long long statbytes[RHOSTAT_N];
+static long long statitems[RHOSTAT_N];
+
+/**
+ * setRhoStats: turn the instrumentation counters on (nonzero) or off (0)
+*/
+void setRhoStats(int on)
+{
+    rhostats = (0 != on);
+}
+
+/**
+ * getRhoStats: whether the instrumentation counters are being updated
+*/
+int getRhoStats(void)
+{
+    return rhostats;
+}
+
+/**
+ * resetRhoStats: zero every instrumentation counter
+*/
+void resetRhoStats(void)
+{
+    for (int i=0; i<RHOSTAT_N; ++i)
+    {
+        statseconds[i] = 0.0;
+        statcalls[i] = 0;
+        statbytes[i] = 0;
+        statitems[i] = 0;
+    }
+}
+
+/**
+ * readRhoStats: copy out the instrumentation counters of every stage
+ * 
+ * Parameters:
+ * seconds: length RHOSTAT_N vector of wall time of each kernel, or thread time summed over threads for the phases of slscFused [s]
+ * calls: length RHOSTAT_N vector of the number of kernel calls, or of points processed for the phases of slscFused
+ * bytes: length RHOSTAT_N vector of bytes of workspace allocated
+ * items: length RHOSTAT_N vector of units of work: channel-samples read by lagNRho, lagNSums, lagSums, multiLagRho and slscSliding, points 
+ *        by slscPoints and slscFused, channel-samples interpolated, channels normalized, and lags summed by the phases of slscFused,
+ *        delays converted by interpTable, taps applied by interpGather, points times speeds by slscSweep, and channel-samples
+ *        read by multiLagRho2D
+*/
+void readRhoStats(double * seconds, long long * calls, long long * bytes, long long * items)
+{
+    for (int i=0; i<RHOSTAT_N; ++i)
+    {
+        seconds[i] = statseconds[i];
+        calls[i] = statcalls[i];
+        bytes[i] = statbytes[i];
+        items[i] = statitems[i];
+    }
+}
+
+/**
+ * rhoclock: wall clock in s, CPU time when built without OpenMP
+*/
+double rhoclock(void)
+{
+#ifdef _OPENMP
+    return omp_get_wtime();
+#else
+    return (double) clock() / (double) CLOCKS_PER_SEC;
+#endif
+}
+
+/**
+ * rhostat: add to the counters of one stage, safe to call from several threads
+*/
+void rhostat(int stage, double seconds, long long calls, long long bytes, long long items)
+{
+    #pragma omp atomic
+    statseconds[stage] += seconds;
+    #pragma omp atomic
+    statcalls[stage] += calls;
+    #pragma omp atomic
+    statbytes[stage] += bytes;
+    #pragma omp atomic
+    statitems[stage] += items;
+}
+
+/**
+ * chanstats: calculate the mean and inverse root energy of each channel
  * 
  * Parameters:
- * input: pointer to pointer-of-pointers-of-floats (2D matrix) of size M by N. m = channel index, n = sample index
+ * input: pointer to the first sample of an M by N strided matrix. m = channel index, n = sample index
  * M: the number of vectors in the matrix
  * N: the number of samples in each vector
- * lag: the lag index to form pairs over
- * 
- * Returns:
- *  output: a float containing the lag(lag) coherence
+ * sm, sn: the strides, in floats, between channels and between samples
+ * avg: vector of length M to write the mean of each channel into
+ * gain: vector of length M to write 1/sqrt(energy) of each mean-subtracted channel into, 0 if the channel is empty
 */
-float lagNRho(float *** input, int M, int N, int lag)
+void chanstats(const float * input, int M, int N, ptrdiff_t sm, ptrdiff_t sn, float * avg, float * gain)
 {
-    float * vec1;
-    float * vec2;
-    float cross, self1, self2, output;
+    const float * vec;
+    float mu, energy, val;
     int m, n;
 
-    // calculate and subtract the mean of each element
-    if (PYUSEL_DEBUG) printf("Subtracting avg:\n");
-    for(m=0; m<(M-lag); ++m)
+    for (m=0; m<M; ++m)
     {
-        // get the signals of the elements m and m+lag
-        vec1 = (*input)[m];
-
-        // initialize counting variable
-        cross = 0;
+        vec = input + m*sm;
 
         // Calculate the mean
-        for (n=0; n<N; ++n) cross += vec1[n];
-        if (PYUSEL_DEBUG) printf("  vector sum: %e\n", cross);
-        cross /= (float) N;
-        if (PYUSEL_DEBUG) printf("  vector avg: %e\n", cross);
+        mu = 0.0f;
+        for (n=0; n<N; ++n) mu += vec[n*sn];
+        mu /= (float) N;
+        if (PYUSEL_DEBUG) printf("  vector avg: %e\n", mu);
+
+        // Calculate the energy about the mean
+        energy = 0.0f;
+        for (n=0; n<N; ++n)
+        {
+            val = vec[n*sn] - mu;
+            energy += val * val;
+        }
+
+        avg[m] = mu;
+        gain[m] = (energy > 0.0f) ? 1.0f/sqrtf(energy) : 0.0f;
+    }
+}
+
+/**
+ * rfspan: n consecutive samples of one trace of raw channel data, widened to float32
+ * 
+ * Samples outside of the trace are 0. Contiguous float32 spans that lie within the trace are read in place,
+ * every other span is widened into buf, so int16 and float16 data are never converted as a whole.
+ * 
+ * Parameters:
+ * trace: pointer to the first sample of the trace, in the given format
+ * fmt: RF_FLOAT32, RF_INT16, or RF_FLOAT16
+ * ss: the stride, in samples, between samples of the trace
+ * Ns: the number of samples in the trace
+ * lo: the index of the first sample of the span, may be negative
+ * n: the number of samples in the span
+ * buf: vector of length n to widen the span into
+ * 
+ * Returns:
+ *  span: pointer to the n widened samples, either into the trace or buf
+*/
+const float * rfspan(const void * trace, int fmt, ptrdiff_t ss, int Ns, int lo, int n, float * buf)
+{
+    const short * s16;
+    const unsigned short * h16;
+    const float * f32;
+    int k, kbeg, kend;
+
+    if ((RF_FLOAT32 == fmt) && (1 == ss) && (lo >= 0) && (lo + n <= Ns)) return (const float *) trace + lo;
 
-        // subtract the mean
-        for (n=0; n<N; ++n) vec1[n] -= cross;
+    // only the part of the span within the trace is read
+    kbeg = (lo < 0) ? -lo : 0;
+    kend = (lo + n > Ns) ? Ns - lo : n;
+    if (kend < kbeg) kend = kbeg;
+    for (k=0; k<kbeg; ++k) buf[k] = 0.0f;
+    for (k=kend; k<n; ++k) buf[k] = 0.0f;
+
+    switch (fmt)
+    {
+        case RF_INT16:
+            s16 = (const short *) trace;
+            for (k=kbeg; k<kend; ++k) buf[k] = (float) s16[(lo+k)*ss];
+            break;
+        case RF_FLOAT16:
+            h16 = (const unsigned short *) trace;
+            for (k=kbeg; k<kend; ++k) buf[k] = halftofloat(h16[(lo+k)*ss]);
+            break;
+        default:
+            f32 = (const float *) trace;
+            for (k=kbeg; k<kend; ++k) buf[k] = f32[(lo+k)*ss];
+    }
+    return buf;
+}
+
+/**
+ * rawstats: chanstats of an M by N strided matrix of raw channel data in any format
+ * 
+ * Parameters:
+ * input: pointer to the first sample of the matrix, in the given format
+ * fmt: RF_FLOAT32, RF_INT16, or RF_FLOAT16
+ * M, N, sm, sn, avg, gain: as in chanstats
+ * buf: vector of length N to widen each channel into
+*/
+static void rawstats(const void * input, int fmt, int M, int N, ptrdiff_t sm, ptrdiff_t sn, float * avg, float * gain, float * buf)
+{
+    const float * vec;
+    int m;
+
+    for (m=0; m<M; ++m)
+    {
+        vec = rfspan(rfoffset(input, fmt, m*sm), fmt, sn, N, 0, N, buf);
+        chanstats(vec, 1, N, N, 1, avg + m, gain + m);
     }
+}
+
+/**
+ * lagnrho: calculate the nth lag
+ * 
+ * The input is only read, int16 and float16 samples are widened a channel at a time and the mean of 
+ * each channel is subtracted on the fly.
+ * 
+ * Parameters:
+ * input: pointer to the first sample of an M by N strided matrix. m = channel index, n = sample index
+ * fmt: the sample format of input, RF_FLOAT32, RF_INT16, or RF_FLOAT16
+ * M: the number of vectors in the matrix
+ * N: the number of samples in each vector
+ * sm, sn: the strides, in samples, between channels and between samples
+ * lag: the lag index to form pairs over
+ * 
+ * Returns:
+ *  output: a float containing the lag(lag) coherence
+*/
+float lagNRho(const void * input, int fmt, int M, int N, ptrdiff_t sm, ptrdiff_t sn, int lag)
+{
+    float * avg;
+    float * gain;
+    float output;
+    int m;
+    int nthreads = getRhoThreads();
+    double t0 = rhostats ? rhoclock() : 0.0;
+
+    // calculate the mean and energy of each element once
+    if (PYUSEL_DEBUG) printf("Calculating channel stats:\n");
+    avg = (float *) malloc(sizeof(float) * M);
+    gain = (float *) malloc(sizeof(float) * (M + N));
+    rawstats(input, fmt, M, N, sm, sn, avg, gain, gain + M);
 
     // Calculate and sum the normalized cross correlation for all element pairs
     if (PYUSEL_DEBUG) printf("Calculating norm x-corr:\n");
     output = 0.0f;
-    for(m=0; m<(M-lag); ++m)
-    {
-        // get the signals of the elements m and m+lag
-        vec1 = (*input)[m];
-        vec2 = (*input)[m+lag];
-        
-        // clear the cross and self correlation terms for this element pair
-        cross = 0.0f;
-        self1 = 0.0f;
-        self2 = 0.0f;
-
-        // for each sample
-        for (n=0; n<N; ++n)
+    #pragma omp parallel num_threads(nthreads) reduction(+:output)
+    {
+        float * buf1 = (float *) malloc(sizeof(float) * N);
+        float * buf2 = (float *) malloc(sizeof(float) * N);
+        const float * vec1;
+        const float * vec2;
+        float cross;
+        int n;
+
+        #pragma omp for schedule(static)
+        for(m=0; m<(M-lag); ++m)
         {
-            self1 += vec1[n] * vec1[n]; // variance of vec1
-            cross += vec1[n] * vec2[n]; // covariance of vec1 x vec2
-            self2 += vec2[n] * vec2[n]; // variance of vec2
+            // get the signals of the elements m and m+lag
+            vec1 = rfspan(rfoffset(input, fmt, m*sm), fmt, sn, N, 0, N, buf1);
+            vec2 = rfspan(rfoffset(input, fmt, (m+lag)*sm), fmt, sn, N, 0, N, buf2);
+
+            // covariance of vec1 x vec2
+            cross = 0.0f;
+            for (n=0; n<N; ++n) cross += (vec1[n] - avg[m]) * (vec2[n] - avg[m+lag]);
+
+            // calculate normalized cross correllation and sum with previous
+            output += cross * gain[m] * gain[m+lag];
+            if (PYUSEL_DEBUG) printf("  This covariance is: %e\n", cross * gain[m] * gain[m+lag]);
         }
 
-        // calculate normalized cross correllation and sum with previous
-        output += cross/sqrtf(self1*self2);
-        if (PYUSEL_DEBUG) printf("  This covariance is: %e\n", cross/sqrtf(self1*self2));
+        free(buf1);
+        free(buf2);
     }
 
     if (PYUSEL_DEBUG) printf("Pre-division: %e\n", output);
@@ -72,6 +295,601 @@ float lagNRho(float *** input, int M, int N, int lag)
     output /= (float)(M-lag);
 
     if (PYUSEL_DEBUG) printf("Post division: %e\n", output);
-    if (PYUSEL_DEBUG) printf("Post division: %p\n", (void*) &output);
+
+    free(avg);
+    free(gain);
+    if (rhostats) rhostat(RHOSTAT_LAGNRHO, rhoclock() - t0, 1, sizeof(float)*(2*M + N + 2*N*(long long) nthreads), (long long) M*N);
     return output;
-}
\ No newline at end of file
+}
+
+/**
+ * lagNSums: the accumulators behind the lag coherence, so several metrics follow from one pass over the data
+ * 
+ * The lag coherence is the mean over pairs of cross[m] / sqrt(self[m] * self[m+lag]), and the coherence 
+ * factor is sums[0] / (M * sums[1]). int16 and float16 samples are widened a channel at a time.
+ * 
+ * Parameters:
+ * input: pointer to the first sample of an M by N strided matrix. m = channel index, n = sample index
+ * fmt: the sample format of input, RF_FLOAT32, RF_INT16, or RF_FLOAT16
+ * M: the number of vectors in the matrix
+ * N: the number of samples in each vector
+ * sm, sn: the strides, in samples, between channels and between samples
+ * lag: the lag index to form pairs over
+ * cross: vector of length M-lag to write the covariance of each pair (m, m+lag) into
+ * self: vector of length M to write the energy of each channel about its mean into
+ * sums: vector of length 2 to write the energy of the coherent sum of the channels and the incoherent energy, 
+ *       the sum of x^2 over channels and samples, into
+*/
+void lagNSums(const void * input, int fmt, int M, int N, ptrdiff_t sm, ptrdiff_t sn, int lag, float * cross, float * self, double * sums)
+{
+    float * avg;
+    float * buf;
+    double * coherent;
+    const float * vec;
+    double incoherent, total;
+    float energy, val;
+    int m, n;
+    int nthreads = getRhoThreads();
+    double t0 = rhostats ? rhoclock() : 0.0;
+
+    avg = (float *) malloc(sizeof(float) * M);
+    buf = (float *) malloc(sizeof(float) * N);
+    coherent = (double *) calloc(N, sizeof(double));
+
+    // mean and energy of every channel, and the coherent and incoherent sums, in one sweep over the channels
+    incoherent = 0.0;
+    for (m=0; m<M; ++m)
+    {
+        vec = rfspan(rfoffset(input, fmt, m*sm), fmt, sn, N, 0, N, buf);
+        avg[m] = 0.0f;
+        for (n=0; n<N; ++n)
+        {
+            avg[m] += vec[n];
+            coherent[n] += (double) vec[n];
+            incoherent += (double) vec[n] * (double) vec[n];
+        }
+        avg[m] /= (float) N;
+
+        energy = 0.0f;
+        for (n=0; n<N; ++n)
+        {
+            val = vec[n] - avg[m];
+            energy += val * val;
+        }
+        self[m] = energy;
+    }
+
+    total = 0.0;
+    for (n=0; n<N; ++n) total += coherent[n] * coherent[n];
+    sums[0] = total;
+    sums[1] = incoherent;
+
+    // covariance of every pair at this lag
+    #pragma omp parallel num_threads(nthreads)
+    {
+        float * buf1 = (float *) malloc(sizeof(float) * N);
+        float * buf2 = (float *) malloc(sizeof(float) * N);
+        const float * vec1;
+        const float * vec2;
+        float sum;
+        int k;
+
+        #pragma omp for schedule(static)
+        for (m=0; m<(M-lag); ++m)
+        {
+            vec1 = rfspan(rfoffset(input, fmt, m*sm), fmt, sn, N, 0, N, buf1);
+            vec2 = rfspan(rfoffset(input, fmt, (m+lag)*sm), fmt, sn, N, 0, N, buf2);
+            sum = 0.0f;
+            for (k=0; k<N; ++k) sum += (vec1[k] - avg[m]) * (vec2[k] - avg[m+lag]);
+            cross[m] = sum;
+        }
+
+        free(buf1);
+        free(buf2);
+    }
+
+    free(avg);
+    free(buf);
+    free(coherent);
+    if (rhostats) rhostat(RHOSTAT_LAGNSUMS, rhoclock() - t0, 1, sizeof(float)*(M + N + 2*N*(long long) nthreads) + sizeof(double)*N, (long long) M*N);
+}
+
+/**
+ * lagSums: the per-pair cross sums and per-channel self sums of several lags, for points or frames to be pooled
+ * 
+ * The coherence of lag l pooled over any set of calls is the mean over the pairs (m, m+l) of the summed cross sums
+ * divided by sqrt of the product of the summed self sums, so ensembles can be updated one frame at a time.
+ * Each channel's mean is removed per point and call. int16 and float16 samples are widened as they are read.
+ * 
+ * Parameters:
+ * input: pointer to the first sample of a P by M by K strided tensor. p = point, m = channel, k = sample
+ * fmt: the sample format of input, RF_FLOAT32, RF_INT16, or RF_FLOAT16
+ * P: the number of points, parallelized over when more than 1, otherwise the pairs are
+ * M: the number of channels
+ * K: the number of samples of each channel
+ * sp, sm, sk: the strides, in samples, between points, channels and samples
+ * lags: vector of L lag indices, each between 0 and M-1
+ * L: the number of lags
+ * cross: P by Npairs C-contiguous matrix to write the cross sums into, Npairs = sum over l of M-lags[l], with the 
+ *        pairs (m, m+lags[l]) of each lag in order of l, then m
+ * self: P by M C-contiguous matrix to write the energy of each channel about its mean into
+*/
+void lagSums(const void * input, int fmt, int P, int M, int K, ptrdiff_t sp, ptrdiff_t sm, ptrdiff_t sk, const int * lags, int L, double * cross, double * self)
+{
+    int * pairs;
+    int Npairs, l, m, p;
+    int nthreads = getRhoThreads();
+    double t0 = rhostats ? rhoclock() : 0.0;
+
+    // flatten the (channel, lag) pairs in output order
+    Npairs = 0;
+    for (l=0; l<L; ++l) Npairs += M - lags[l];
+    pairs = (int *) malloc(sizeof(int) * 2 * Npairs);
+    Npairs = 0;
+    for (l=0; l<L; ++l)
+    {
+        for (m=0; m<(M-lags[l]); ++m)
+        {
+            pairs[2*Npairs] = m;
+            pairs[2*Npairs+1] = m + lags[l];
+            ++Npairs;
+        }
+    }
+
+    // many points share the threads point by point, a single point shares them pair by pair
+    #pragma omp parallel num_threads((P > 1) ? nthreads : 1) private(m)
+    {
+        float * buf = (float *) malloc(sizeof(float) * M * K);
+        float * avg = (float *) malloc(sizeof(float) * M);
+        const float * vec;
+        double energy, val;
+        int k;
+
+        #pragma omp for schedule(static)
+        for (p=0; p<P; ++p)
+        {
+            // widen every channel of this point once, then remove its mean
+            for (m=0; m<M; ++m)
+            {
+                vec = rfspan(rfoffset(input, fmt, p*sp + m*sm), fmt, sk, K, 0, K, buf + (ptrdiff_t) m*K);
+                if (vec != buf + (ptrdiff_t) m*K) for (k=0; k<K; ++k) buf[(ptrdiff_t) m*K + k] = vec[k];
+                avg[m] = 0.0f;
+                for (k=0; k<K; ++k) avg[m] += buf[(ptrdiff_t) m*K + k];
+                avg[m] /= (float) K;
+                energy = 0.0;
+                for (k=0; k<K; ++k)
+                {
+                    buf[(ptrdiff_t) m*K + k] -= avg[m];
+                    val = buf[(ptrdiff_t) m*K + k];
+                    energy += val * val;
+                }
+                self[(ptrdiff_t) p*M + m] = energy;
+            }
+
+            #pragma omp parallel for num_threads((P > 1) ? 1 : nthreads) schedule(static)
+            for (int ip=0; ip<Npairs; ++ip)
+            {
+                const float * vec1 = buf + (ptrdiff_t) pairs[2*ip]*K;
+                const float * vec2 = buf + (ptrdiff_t) pairs[2*ip+1]*K;
+                double sum = 0.0;
+                for (int n=0; n<K; ++n) sum += (double) (vec1[n] * vec2[n]);
+                cross[(ptrdiff_t) p*Npairs + ip] = sum;
+            }
+        }
+
+        free(buf);
+        free(avg);
+    }
+
+    free(pairs);
+    if (rhostats) rhostat(RHOSTAT_LAGSUMS, rhoclock() - t0, 1, sizeof(int)*2*Npairs + sizeof(float)*(M*(long long) K + M)*nthreads, (long long) P*M*K);
+}
+
+/**
+ * fftpow2: in-place iterative radix-2 complex FFT
+ * 
+ * Parameters:
+ * re, im: real and imaginary parts of the length K signal
+ * K: the transform length, must be a power of 2
+ * cosv, sinv: length K/2 twiddle tables, cos(2 pi k/K) and sin(2 pi k/K)
+ * inverse: nonzero for the (unscaled) inverse transform
+*/
+static void fftpow2(float * re, float * im, int K, const float * cosv, const float * sinv, int inverse)
+{
+    int i, j, k, len, half, step;
+    float tr, ti, wr, wi;
+
+    // bit reversal permutation
+    for (i=1, j=0; i<K; ++i)
+    {
+        for (k=K>>1; j&k; k>>=1) j ^= k;
+        j ^= k;
+        if (i < j)
+        {
+            tr = re[i]; re[i] = re[j]; re[j] = tr;
+            ti = im[i]; im[i] = im[j]; im[j] = ti;
+        }
+    }
+
+    // butterflies
+    for (len=2; len<=K; len<<=1)
+    {
+        half = len>>1;
+        step = K/len;
+        for (i=0; i<K; i+=len)
+        {
+            for (k=0; k<half; ++k)
+            {
+                wr = cosv[k*step];
+                wi = inverse ? sinv[k*step] : -sinv[k*step];
+                tr = wr*re[i+k+half] - wi*im[i+k+half];
+                ti = wr*im[i+k+half] + wi*re[i+k+half];
+                re[i+k+half] = re[i+k] - tr;
+                im[i+k+half] = im[i+k] - ti;
+                re[i+k] += tr;
+                im[i+k] += ti;
+            }
+        }
+    }
+}
+
+/**
+ * multiLagRho: calculate the coherence at several lags in a single sweep
+ * 
+ * Each channel is mean-subtracted and normalized to unit energy once, after which
+ * the lag-m coherence is the element-axis autocorrelation at m summed over samples
+ * and divided by the number of pairs (M-m). Channels with zero energy contribute 0.
+ * The input is only read, int16 and float16 samples are widened as they are read.
+ * 
+ * Parameters:
+ * input: pointer to the first sample of an M by N strided matrix. m = channel index, n = sample index
+ * fmt: the sample format of input, RF_FLOAT32, RF_INT16, or RF_FLOAT16
+ * M: the number of vectors in the matrix
+ * N: the number of samples in each vector
+ * sm, sn: the strides, in samples, between channels and between samples
+ * lags: vector of L lag indices, each between 0 and M-1
+ * L: the number of lags
+ * usefft: nonzero to form the autocorrelation with an FFT along the element axis, O(M log M) per sample,
+ *         otherwise the pairs of each requested lag are summed directly, O(M L) per sample
+ * output: vector of length L to write the coherence of each lag into
+*/
+void multiLagRho(const void * input, int fmt, int M, int N, ptrdiff_t sm, ptrdiff_t sn, const int * lags, int L, int usefft, float * output)
+{
+    float * avg;
+    float * gain;
+    float * acc;
+    float * zero;
+    float * cosv;
+    float * sinv;
+    float sum;
+    int m, n, l, k, K;
+    int nthreads = getRhoThreads();
+    double t0 = rhostats ? rhoclock() : 0.0;
+
+    // calculate the mean and energy of each channel exactly once
+    avg = (float *) malloc(sizeof(float) * M);
+    gain = (float *) malloc(sizeof(float) * (M + N));
+    rawstats(input, fmt, M, N, sm, sn, avg, gain, gain + M);
+
+    if (0 == usefft)
+    {
+        // sum the normalized cross products of only the requested lags
+        for (l=0; l<L; ++l)
+        {
+            sum = 0.0f;
+            #pragma omp parallel num_threads(nthreads) private(n) reduction(+:sum)
+            {
+                float * buf1 = (float *) malloc(sizeof(float) * N);
+                float * buf2 = (float *) malloc(sizeof(float) * N);
+                const float * vec1;
+                const float * vec2;
+                float cross;
+
+                #pragma omp for schedule(static)
+                for (m=0; m<(M-lags[l]); ++m)
+                {
+                    vec1 = rfspan(rfoffset(input, fmt, m*sm), fmt, sn, N, 0, N, buf1);
+                    vec2 = rfspan(rfoffset(input, fmt, (m+lags[l])*sm), fmt, sn, N, 0, N, buf2);
+                    cross = 0.0f;
+                    for (n=0; n<N; ++n) cross += (vec1[n] - avg[m]) * (vec2[n] - avg[m+lags[l]]);
+                    sum += cross * gain[m] * gain[m+lags[l]];
+                }
+
+                free(buf1);
+                free(buf2);
+            }
+            output[l] = sum / (float)(M-lags[l]);
+        }
+        free(avg);
+        free(gain);
+        if (rhostats) rhostat(RHOSTAT_MULTILAG, rhoclock() - t0, 1, sizeof(float)*(2*M + N + 2*N*(long long) nthreads), (long long) M*N);
+        return;
+    }
+
+    // zero-padded transform length so that circular correlation is linear for all lags
+    for (K=1; K<(2*M-1); K<<=1);
+
+    acc = (float *) calloc(K, sizeof(float));
+    cosv = (float *) malloc(sizeof(float) * (K/2 + 1));
+    sinv = (float *) malloc(sizeof(float) * (K/2 + 1));
+
+    for (k=0; k<=K/2; ++k)
+    {
+        cosv[k] = cosf(2.0f * (float) M_PI * (float) k / (float) K);
+        sinv[k] = sinf(2.0f * (float) M_PI * (float) k / (float) K);
+    }
+
+    // each thread transforms its share of the sample pairs and keeps a private power spectrum
+    #pragma omp parallel num_threads(nthreads) private(m, n, k)
+    {
+        float * re = (float *) malloc(sizeof(float) * K);
+        float * im = (float *) malloc(sizeof(float) * K);
+        float * part = (float *) calloc(K, sizeof(float));
+        int n2;
+
+        // pack two real samples per complex transform and accumulate the power spectrum
+        #pragma omp for schedule(static)
+        for (n2=0; n2<(N+1)/2; ++n2)
+        {
+            n = 2*n2;
+            for (m=0; m<M; ++m)
+            {
+                re[m] = (rfload(input, fmt, m*sm + n*sn) - avg[m]) * gain[m];
+                im[m] = (n+1 < N) ? (rfload(input, fmt, m*sm + (n+1)*sn) - avg[m]) * gain[m] : 0.0f;
+            }
+            for (m=M; m<K; ++m)
+            {
+                re[m] = 0.0f;
+                im[m] = 0.0f;
+            }
+
+            fftpow2(re, im, K, cosv, sinv, 0);
+            for (k=0; k<K; ++k) part[k] += re[k]*re[k] + im[k]*im[k];
+        }
+
+        #pragma omp critical
+        for (k=0; k<K; ++k) acc[k] += part[k];
+
+        free(re);
+        free(im);
+        free(part);
+    }
+
+    // |A_k|^2 + |B_k|^2 = (|Z_k|^2 + |Z_{K-k}|^2)/2 separates the two packed real signals
+    for (k=1; k<K/2; ++k)
+    {
+        sum = 0.5f * (acc[k] + acc[K-k]);
+        acc[k] = sum;
+        acc[K-k] = sum;
+    }
+
+    // the inverse transform of the summed power spectrum is the summed autocorrelation
+    zero = (float *) calloc(K, sizeof(float));
+    fftpow2(acc, zero, K, cosv, sinv, 1);
+    for (l=0; l<L; ++l) output[l] = acc[lags[l]] / ((float) K * (float)(M-lags[l]));
+
+    free(avg);
+    free(gain);
+    free(acc);
+    free(zero);
+    free(cosv);
+    free(sinv);
+    if (rhostats) rhostat(RHOSTAT_MULTILAG, rhoclock() - t0, 1, sizeof(float)*(2*M + N + 2*K + K+2 + 3*K*(long long) nthreads), (long long) M*N);
+}
+
+/**
+ * twiddles: cos(2 pi k/K) and sin(2 pi k/K) for k = 0 to K/2, the twiddle tables of fftpow2
+*/
+static void twiddles(int K, float * cosv, float * sinv)
+{
+    for (int k=0; k<=K/2; ++k)
+    {
+        cosv[k] = cosf(2.0f * (float) M_PI * (float) k / (float) K);
+        sinv[k] = sinf(2.0f * (float) M_PI * (float) k / (float) K);
+    }
+}
+
+/**
+ * fft2pow2: in-place 2D complex FFT of a Kx by Ky C-contiguous signal, rows then columns
+ * 
+ * Parameters:
+ * re, im: real and imaginary parts of the signal
+ * Kx, Ky: the transform sizes along the slow and fast axes, powers of 2
+ * cosx, sinx, cosy, siny: twiddle tables of lengths Kx and Ky, see twiddles
+ * colre, colim: vectors of length Kx each column is transformed in
+ * inverse: nonzero for the (unscaled) inverse transform
+*/
+static void fft2pow2(float * re, float * im, int Kx, int Ky, const float * cosx, const float * sinx, const float * cosy, const float * siny,
+                     float * colre, float * colim, int inverse)
+{
+    int kx, ky;
+
+    for (kx=0; kx<Kx; ++kx) fftpow2(re + (ptrdiff_t) kx*Ky, im + (ptrdiff_t) kx*Ky, Ky, cosy, siny, inverse);
+    for (ky=0; ky<Ky; ++ky)
+    {
+        for (kx=0; kx<Kx; ++kx)
+        {
+            colre[kx] = re[(ptrdiff_t) kx*Ky + ky];
+            colim[kx] = im[(ptrdiff_t) kx*Ky + ky];
+        }
+        fftpow2(colre, colim, Kx, cosx, sinx, inverse);
+        for (kx=0; kx<Kx; ++kx)
+        {
+            re[(ptrdiff_t) kx*Ky + ky] = colre[kx];
+            im[(ptrdiff_t) kx*Ky + ky] = colim[kx];
+        }
+    }
+}
+
+/**
+ * multiLagRho2D: calculate the coherence at several 2D lags of the elements of a lattice in a single sweep
+ * 
+ * The M = Mx*My channels are the elements of an Mx by My lattice in C order, element (ix, iy) is channel ix*My + iy,
+ * e.g. a matrix probe. The coherence at lag (dx, dy) is the normalized correlation averaged over every pair of
+ * elements (ix, iy) and (ix+dx, iy+dy) within the lattice, so (dx, dy) and (-dx, -dy) are the same lag. Each 
+ * channel is mean-subtracted and normalized to unit energy once. The direct method sums the pairs of each requested
+ * lag, O(M L) per sample. The FFT method forms the 2D autocorrelation of the lattice, which holds every lag at once,
+ * O(M log M) per sample, so it is the only practical choice when many lags are wanted, e.g. for radial lag bins.
+ * 
+ * Parameters:
+ * input: pointer to the first sample of an M by N strided matrix. m = channel index, n = sample index
+ * fmt: the sample format of input, RF_FLOAT32, RF_INT16, or RF_FLOAT16
+ * Mx, My: the number of elements along the slow and fast axes of the lattice
+ * N: the number of samples in each vector
+ * sm, sn: the strides, in samples, between channels and between samples
+ * lagx, lagy: vectors of the L lags along each axis, |lagx| < Mx and |lagy| < My
+ * L: the number of lags
+ * usefft: nonzero to form the 2D autocorrelation with an FFT, otherwise the pairs of each lag are summed directly
+ * output: vector of length L to write the coherence of each lag into
+*/
+void multiLagRho2D(const void * input, int fmt, int Mx, int My, int N, ptrdiff_t sm, ptrdiff_t sn, const int * lagx, const int * lagy, int L,
+                   int usefft, float * output)
+{
+    float * avg;
+    float * gain;
+    float * acc;
+    float * pow2;
+    float * zero;
+    float * tw;
+    float sum;
+    int M = Mx * My;
+    int l, k, Kx, Ky;
+    ptrdiff_t K, kk, kneg;
+    int nthreads = getRhoThreads();
+    double t0 = rhostats ? rhoclock() : 0.0;
+
+    // calculate the mean and energy of each channel exactly once
+    avg = (float *) malloc(sizeof(float) * M);
+    gain = (float *) malloc(sizeof(float) * (M + N));
+    rawstats(input, fmt, M, N, sm, sn, avg, gain, gain + M);
+
+    if (0 == usefft)
+    {
+        // sum the normalized cross products of the pairs of each requested lag, rows of the lattice split over threads
+        for (l=0; l<L; ++l)
+        {
+            int dx = lagx[l], dy = lagy[l];
+            int xlo = (dx < 0) ? -dx : 0, xhi = (dx < 0) ? Mx : Mx - dx;
+            int ylo = (dy < 0) ? -dy : 0, yhi = (dy < 0) ? My : My - dy;
+            int ix;
+
+            sum = 0.0f;
+            #pragma omp parallel num_threads(nthreads) reduction(+:sum)
+            {
+                float * buf1 = (float *) malloc(sizeof(float) * N);
+                float * buf2 = (float *) malloc(sizeof(float) * N);
+                const float * vec1;
+                const float * vec2;
+                float cross;
+                int iy, m1, m2, n;
+
+                #pragma omp for schedule(static)
+                for (ix=xlo; ix<xhi; ++ix)
+                {
+                    for (iy=ylo; iy<yhi; ++iy)
+                    {
+                        m1 = ix*My + iy;
+                        m2 = (ix+dx)*My + iy + dy;
+                        vec1 = rfspan(rfoffset(input, fmt, m1*sm), fmt, sn, N, 0, N, buf1);
+                        vec2 = rfspan(rfoffset(input, fmt, m2*sm), fmt, sn, N, 0, N, buf2);
+                        cross = 0.0f;
+                        for (n=0; n<N; ++n) cross += (vec1[n] - avg[m1]) * (vec2[n] - avg[m2]);
+                        sum += cross * gain[m1] * gain[m2];
+                    }
+                }
+
+                free(buf1);
+                free(buf2);
+            }
+            output[l] = sum / ((float) (xhi - xlo) * (float) (yhi - ylo));
+        }
+        free(avg);
+        free(gain);
+        if (rhostats) rhostat(RHOSTAT_MULTILAG2D, rhoclock() - t0, 1, sizeof(float)*(2*M + N + 2*N*(long long) nthreads), (long long) M*N);
+        return;
+    }
+
+    // zero-padded transform sizes so that circular correlation is linear for all lags along both axes
+    for (Kx=1; Kx<(2*Mx-1); Kx<<=1);
+    for (Ky=1; Ky<(2*My-1); Ky<<=1);
+    K = (ptrdiff_t) Kx * Ky;
+
+    acc = (float *) calloc(K, sizeof(float));
+    tw = (float *) malloc(sizeof(float) * (Kx + Ky + 4));
+    twiddles(Kx, tw, tw + Kx/2 + 1);
+    twiddles(Ky, tw + Kx + 2, tw + Kx + 2 + Ky/2 + 1);
+
+    // each thread transforms its share of the sample pairs and keeps a private power spectrum
+    #pragma omp parallel num_threads(nthreads)
+    {
+        float * re = (float *) malloc(sizeof(float) * (3*K + 2*Kx));
+        float * im = re + K;
+        float * part = im + K;
+        float * colre = part + K;
+        float * colim = colre + Kx;
+        const float * cosx = tw;
+        const float * sinx = tw + Kx/2 + 1;
+        const float * cosy = tw + Kx + 2;
+        const float * siny = cosy + Ky/2 + 1;
+        ptrdiff_t i;
+        int n, n2, ix, iy, m;
+
+        for (i=0; i<K; ++i) part[i] = 0.0f;
+
+        // pack two real samples per complex transform of the zero-padded lattice and accumulate the power spectrum
+        #pragma omp for schedule(static)
+        for (n2=0; n2<(N+1)/2; ++n2)
+        {
+            n = 2*n2;
+            for (i=0; i<K; ++i)
+            {
+                re[i] = 0.0f;
+                im[i] = 0.0f;
+            }
+            for (ix=0; ix<Mx; ++ix)
+            {
+                for (iy=0; iy<My; ++iy)
+                {
+                    m = ix*My + iy;
+                    i = (ptrdiff_t) ix*Ky + iy;
+                    re[i] = (rfload(input, fmt, m*sm + n*sn) - avg[m]) * gain[m];
+                    im[i] = (n+1 < N) ? (rfload(input, fmt, m*sm + (n+1)*sn) - avg[m]) * gain[m] : 0.0f;
+                }
+            }
+
+            fft2pow2(re, im, Kx, Ky, cosx, sinx, cosy, siny, colre, colim, 0);
+            for (i=0; i<K; ++i) part[i] += re[i]*re[i] + im[i]*im[i];
+        }
+
+        #pragma omp critical
+        for (i=0; i<K; ++i) acc[i] += part[i];
+
+        free(re);
+    }
+
+    // |A_k|^2 + |B_k|^2 = (|Z_k|^2 + |Z_-k|^2)/2 separates the two packed real signals, -k taken modulo (Kx, Ky)
+    pow2 = (float *) malloc(sizeof(float) * (2*K + Kx + Kx));
+    zero = pow2 + K;
+    for (kk=0; kk<K; ++kk)
+    {
+        kneg = (ptrdiff_t) ((Kx - kk/Ky) % Kx) * Ky + (Ky - kk%Ky) % Ky;
+        pow2[kk] = 0.5f * (acc[kk] + acc[kneg]);
+        zero[kk] = 0.0f;
+    }
+
+    // the inverse transform of the summed power spectrum is the summed autocorrelation of the lattice
+    fft2pow2(pow2, zero, Kx, Ky, tw, tw + Kx/2 + 1, tw + Kx + 2, tw + Kx + 2 + Ky/2 + 1, zero + K, zero + K + Kx, 1);
+    for (l=0; l<L; ++l)
+    {
+        k = ((lagx[l] % Kx) + Kx) % Kx;
+        kk = (ptrdiff_t) k*Ky + ((lagy[l] % Ky) + Ky) % Ky;
+        output[l] = pow2[kk] / ((float) K * (float) (Mx - abs(lagx[l])) * (float) (My - abs(lagy[l])));
+    }
+
+    free(avg);
+    free(gain);
+    free(acc);
+    free(tw);
+    free(pow2);
+    if (rhostats) rhostat(RHOSTAT_MULTILAG2D, rhoclock() - t0, 1, sizeof(float)*(2*M + N + 3*K + 2*Kx + Kx + Ky + 4 + (3*K + 2*Kx)*(long long) nthreads), (long long) M*N);
+}
@@ -2,9 +2,234 @@
 #define ___pyusel_pyrho_rho___
 #include <stdlib.h>
 #include <stdio.h>
+#include <stddef.h>
 #include <math.h>
+#include <time.h>
+#include <string.h>
 
-extern float lagNRho(float *** input, int M, int N, int lag);
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+#ifndef M_PI
+#define M_PI 3.14159265358979323846
+#endif
+
+// kinds of delay models that the fused kernels can evaluate
+#define DELAY_TABLE 0
+#define DELAY_SPHERICAL 1
+#define DELAY_PLANE 2
+#define DELAY_GRID 3
+
+// apodization windows across the active aperture of the fused kernels
+#define APOD_RECT 0
+#define APOD_HANN 1
+#define APOD_HAMMING 2
+
+// parts of the normalized complex correlation that the IQ kernels keep
+#define IQ_REAL 0
+#define IQ_ABS 1
+
+// sample formats of raw channel data, widened to float32 as it is read
+#define RF_FLOAT32 0
+#define RF_INT16 1
+#define RF_FLOAT16 2
+
+// interpolation kernels of the precomputed fractional delay tables
+#define INTERP_NEAREST 0
+#define INTERP_LINEAR 1
+#define INTERP_CUBIC 2
+#define INTERP_SINC 3
+
+/**
+ * rhothreadnum: the index of the calling thread within its parallel region, 0 without OpenMP
+*/
+static inline int rhothreadnum(void)
+{
+#ifdef _OPENMP
+    return omp_get_thread_num();
+#else
+    return 0;
+#endif
+}
+
+/**
+ * halftofloat: widen the bits of an IEEE 754 half precision float
+*/
+static inline float halftofloat(unsigned short h)
+{
+    unsigned int sign = ((unsigned int) h & 0x8000u) << 16;
+    unsigned int expo = ((unsigned int) h >> 10) & 0x1fu;
+    unsigned int mant = (unsigned int) h & 0x3ffu;
+    unsigned int bits;
+    float val;
+
+    // subnormal halves are normal floats, scale them directly
+    if (0 == expo)
+    {
+        val = (float) mant * 5.9604644775390625e-8f;
+        return sign ? -val : val;
+    }
+    bits = sign | (((31 == expo) ? 255u : expo + 112u) << 23) | (mant << 13);
+    memcpy(&val, &bits, sizeof(float));
+    return val;
+}
+
+/**
+ * floattohalf: narrow a float to the bits of an IEEE 754 half precision float, rounding to nearest even
+*/
+static inline unsigned short floattohalf(float val)
+{
+    unsigned int bits, sign, mant, half, rem, tie;
+    int expo, shift;
+
+    memcpy(&bits, &val, sizeof(float));
+    sign = (bits >> 16) & 0x8000u;
+    expo = (int) ((bits >> 23) & 0xffu) - 112;
+    mant = bits & 0x7fffffu;
+
+    // NaN stays NaN, and floats beyond the half range become infinities
+    if (143 == expo) return (unsigned short) (sign | 0x7c00u | (mant ? 0x200u : 0u));
+    if (expo >= 31) return (unsigned short) (sign | 0x7c00u);
+
+    // below the smallest normal half, the implicit bit shifts into a subnormal mantissa
+    if (expo <= 0)
+    {
+        if (expo < -10) return (unsigned short) sign;
+        mant |= 0x800000u;
+        shift = 14 - expo;
+    }
+    else
+    {
+        mant |= (unsigned int) expo << 23;
+        shift = 13;
+    }
+
+    // a carry out of the mantissa rounds up into the exponent, or into infinity
+    half = mant >> shift;
+    rem = mant & ((1u << shift) - 1u);
+    tie = 1u << (shift - 1);
+    if ((rem > tie) || ((rem == tie) && (half & 1u))) ++half;
+    return (unsigned short) (sign | half);
+}
+
+/**
+ * rfoffset: pointer to sample i of raw channel data in the given format
+*/
+static inline const void * rfoffset(const void * data, int fmt, ptrdiff_t i)
+{
+    switch (fmt)
+    {
+        case RF_INT16: return (const short *) data + i;
+        case RF_FLOAT16: return (const unsigned short *) data + i;
+        default: return (const float *) data + i;
+    }
+}
+
+/**
+ * rfload: sample i of raw channel data, widened to float32
+*/
+static inline float rfload(const void * data, int fmt, ptrdiff_t i)
+{
+    switch (fmt)
+    {
+        case RF_INT16: return (float) ((const short *) data)[i];
+        case RF_FLOAT16: return halftofloat(((const unsigned short *) data)[i]);
+        default: return ((const float *) data)[i];
+    }
+}
+
+// stages of the instrumentation counters, see readRhoStats
+#define RHOSTAT_LAGNRHO 0
+#define RHOSTAT_MULTILAG 1
+#define RHOSTAT_POINTS 2
+#define RHOSTAT_SLIDING 3
+#define RHOSTAT_FUSED 4
+#define RHOSTAT_FUSED_DELAYS 5
+#define RHOSTAT_FUSED_INTERP 6
+#define RHOSTAT_FUSED_STATS 7
+#define RHOSTAT_FUSED_LAGS 8
+#define RHOSTAT_DEMOD 9
+#define RHOSTAT_IQ 10
+#define RHOSTAT_FUSEDIQ 11
+#define RHOSTAT_LAGNSUMS 12
+#define RHOSTAT_LAGSUMS 13
+#define RHOSTAT_INTERPTABLE 14
+#define RHOSTAT_GATHER 15
+#define RHOSTAT_SWEEP 16
+#define RHOSTAT_MULTILAG2D 17
+#define RHOSTAT_N 18
+
+/**
+ * delaymodel: description of N delays to any point, either stored or recomputed on the fly
+ * 
+ * kind: DELAY_TABLE to read an N by P table, DELAY_SPHERICAL for |point - ref|/c, 
+ *       DELAY_PLANE for dot(norm, point - ref)/c + tref, DELAY_GRID for tabs[index[p] + i*step]
+ * N: the number of transmits or receive channels described
+ * tabs: N by P C-contiguous delay table [s] for DELAY_TABLE, or the shared base table [s] for DELAY_GRID
+ * refs: N by 3 C-contiguous reference points [m], geometric kinds only
+ * norms: N by 3 C-contiguous normal vectors, DELAY_PLANE only
+ * trefs: length N reference delays [s], DELAY_PLANE only
+ * c: speed of sound [m/s], geometric kinds only
+ * index: length P vector of the base table entry of each point for the first delay, DELAY_GRID only
+ * step: the offset in the base table between consecutive delays, DELAY_GRID only
+*/
+typedef struct {
+    int kind;
+    int N;
+    const float * tabs;
+    const float * refs;
+    const float * norms;
+    const float * trefs;
+    float c;
+    const int * index;
+    ptrdiff_t step;
+} delaymodel;
+
+extern void setRhoThreads(int n);
+extern int getRhoThreads(void);
+extern void setRhoStats(int on);
+extern int getRhoStats(void);
+extern void resetRhoStats(void);
+extern void readRhoStats(double * seconds, long long * calls, long long * bytes, long long * items);
+extern double rhoclock(void);
+extern void rhostat(int stage, double seconds, long long calls, long long bytes, long long items);
+extern const float * rfspan(const void * trace, int fmt, ptrdiff_t ss, int Ns, int lo, int n, float * buf);
+extern float lagNRho(const void * input, int fmt, int M, int N, ptrdiff_t sm, ptrdiff_t sn, int lag);
+extern void chanstats(const float * input, int M, int N, ptrdiff_t sm, ptrdiff_t sn, float * avg, float * gain);
+extern void multiLagRho(const void * input, int fmt, int M, int N, ptrdiff_t sm, ptrdiff_t sn, const int * lags, int L, int usefft, float * output);
+extern void multiLagRho2D(const void * input, int fmt, int Mx, int My, int N, ptrdiff_t sm, ptrdiff_t sn, const int * lagx, const int * lagy, int L,
+                          int usefft, float * output);
+extern void slscPoints(const float * input, int P, int M, int K, ptrdiff_t sp, ptrdiff_t sm, ptrdiff_t sk, const int * lags, int L, float * output);
+extern void slscSliding(const void * input, int fmt, int Q, int M, int N, ptrdiff_t sq, ptrdiff_t sm, ptrdiff_t sn, int K, const int * lags, int L, float * output);
+extern void delaysat(const delaymodel * model, int P, int p, const float * point, ptrdiff_t sd, float * tau);
+extern void slscFused(const void * data, int fmt, int Ntx, int Nrx, int Ns, ptrdiff_t st, ptrdiff_t sr, ptrdiff_t ss, float fs, float tstart,
+                      int P, const float * points, ptrdiff_t sp, ptrdiff_t sd, const delaymodel * tx, const delaymodel * rx,
+                      const int * txorder, const int * txstart, int G,
+                      const int * aplo, const int * aphi, int apod, int K, const int * lags, int L, float * output,
+                      float * rhos, int Q, float * spec, float * energy, float * work, const int * order, int tile);
+extern void slscSweep(const void * data, int fmt, int Ntx, int Nrx, int Ns, ptrdiff_t st, ptrdiff_t sr, ptrdiff_t ss, float fs, float tstart,
+                      int P, const float * points, ptrdiff_t sp, ptrdiff_t sd, const delaymodel * tx, const delaymodel * rx,
+                      const float * txoff, const float * rxoff, float txc, float rxc, const int * txorder, const int * txstart, int G,
+                      const int * aplo, const int * aphi, int apod, int K, const int * lags, int L, const float * slowness, int C,
+                      float * output, float * work, const int * order, int tile);
+extern ptrdiff_t fusedWork(int Ntx, int Nrx, int K, int iq);
+extern void lagNSums(const void * input, int fmt, int M, int N, ptrdiff_t sm, ptrdiff_t sn, int lag, float * cross, float * self, double * sums);
+extern void lagSums(const void * input, int fmt, int P, int M, int K, ptrdiff_t sp, ptrdiff_t sm, ptrdiff_t sk, const int * lags, int L, double * cross, double * self);
+extern void demodIQ(const void * input, int fmt, int T, int Ns, ptrdiff_t st, ptrdiff_t ss, float fs, float fc, float tstart,
+                    const float * taps, int ntaps, int decim, int Nout, float * output);
+extern void iqstats(const float * input, int M, int N, ptrdiff_t sm, ptrdiff_t sn, float * avg, float * gain);
+extern float iqpair(const float * vec1, const float * vec2, int N, ptrdiff_t sn, const float * avg1, const float * avg2, float gain1, float gain2, int part);
+extern void multiLagRhoIQ(const float * input, int M, int N, ptrdiff_t sm, ptrdiff_t sn, const int * lags, int L, int part, float * output);
+extern void slscFusedIQ(const float * data, int Ntx, int Nrx, int Ns, ptrdiff_t st, ptrdiff_t sr, ptrdiff_t ss, float fs, float fc, float tstart,
+                        int P, const float * points, ptrdiff_t sp, ptrdiff_t sd, const delaymodel * tx, const delaymodel * rx,
+                        const int * txorder, const int * txstart, int G,
+                        const int * aplo, const int * aphi, int apod, int K, const int * lags, int L, int part, float * output, float * work,
+                        const int * order, int tile);
+extern void interpTable(int Ntx, int Nrx, int Ns, float fs, float tstart, int P, const float * points, ptrdiff_t sp, ptrdiff_t sd,
+                        const delaymodel * tx, const delaymodel * rx, int kind, int W, int * index, void * weights, int half);
+extern void interpGather(const void * data, int fmt, int Ntx, int Nrx, ptrdiff_t st, ptrdiff_t sr, ptrdiff_t ss,
+                         int P, int W, const int * index, const void * weights, int half, int compound, float * output);
 
 #endif
 
@@ -0,0 +1,795 @@
+#include "rho.h"
+
+/**
+ * kerncoherence: sum of the lag coherences of one point's channel kernels
+ * 
+ * Parameters:
+ * point: pointer to the first sample of an M by K strided matrix. m = channel, k = kernel sample
+ * M: the number of channels
+ * K: the number of samples in the kernel
+ * sm, sk: the strides, in floats, between channels and kernel samples
+ * lags: vector of L lag indices, lags of M or more have no pairs and are skipped, adding 0 to the sum. With a dynamic
+ *       aperture, points whose active aperture is narrower than a lag therefore sum fewer lags
+ * L: the number of lags
+ * apod: length M vector of channel weights, pairs are weighted by the product of their weights. NULL for uniform weights
+ * avg, gain: length M vectors of the mean and inverse root energy of each channel, from chanstats
+ * scale: factor the coherence of each lag is multiplied by before it is added to perlag
+ * perlag: vector of length L the scaled coherence of each lag is added to, nothing for skipped lags. NULL to only return the sum
+ * 
+ * Returns:
+ *  output: the sum over the lags of the (weighted) mean normalized correlation of all pairs at that lag
+*/
+static float kerncoherence(const float * point, int M, int K, ptrdiff_t sm, ptrdiff_t sk, const int * lags, int L, const float * apod, 
+                           const float * avg, const float * gain, float scale, float * perlag)
+{
+    const float * vec1;
+    const float * vec2;
+    float cross, rho, weight, wsum, output;
+    int m, k, l;
+
+    output = 0.0f;
+    for (l=0; l<L; ++l)
+    {
+        if (lags[l] >= M) continue;
+
+        rho = 0.0f;
+        wsum = 0.0f;
+        for (m=0; m<(M-lags[l]); ++m)
+        {
+            weight = (NULL == apod) ? 1.0f : apod[m] * apod[m+lags[l]];
+            if (weight == 0.0f) continue;
+
+            vec1 = point + m*sm;
+            vec2 = point + (m+lags[l])*sm;
+            cross = 0.0f;
+            for (k=0; k<K; ++k) cross += (vec1[k*sk] - avg[m]) * (vec2[k*sk] - avg[m+lags[l]]);
+            rho += weight * cross * gain[m] * gain[m+lags[l]];
+            wsum += weight;
+        }
+        if (wsum > 0.0f) output += rho / wsum;
+        if ((NULL != perlag) && (wsum > 0.0f)) perlag[l] += scale * rho / wsum;
+    }
+
+    return output;
+}
+
+/**
+ * kernspectrum: energy of the lowest spatial frequencies of one point's channel kernels, and their total energy
+ * 
+ * spec[q] is the sum over kernel samples of |sum_m x[m] exp(-j 2 pi q m/M)|^2, doubled for 0 < q < M/2 to count the 
+ * mirrored frequency -q of the real channel data, and 0 for q > M/2 where the frequencies wrap around. spec[0] is 
+ * the energy of the coherent sum of the channels.
+ * 
+ * Parameters:
+ * point: pointer to the first sample of an M by K strided matrix. m = channel, k = kernel sample
+ * M: the number of channels
+ * K: the number of samples in the kernel
+ * sm, sk: the strides, in floats, between channels and kernel samples
+ * Q: the highest spatial frequency index
+ * cosv, sinv: workspace vectors of length M
+ * scale: factor the energies are multiplied by before they are added to spec and energy
+ * spec: vector of length Q+1 the scaled energy at spatial frequencies 0 through Q is added to
+ * energy: pointer the scaled incoherent energy, the sum of x^2 over channels and kernel samples, is added to. NULL to skip
+*/
+static void kernspectrum(const float * point, int M, int K, ptrdiff_t sm, ptrdiff_t sk, int Q, float * cosv, float * sinv, float scale, 
+                         float * spec, float * energy)
+{
+    float re, im, val, total, power;
+    int q, m, k;
+
+    if (NULL != energy)
+    {
+        total = 0.0f;
+        for (m=0; m<M; ++m)
+        {
+            for (k=0; k<K; ++k)
+            {
+                val = point[m*sm + k*sk];
+                total += val * val;
+            }
+        }
+        *energy += scale * total;
+    }
+
+    for (q=0; q<=Q; ++q)
+    {
+        if (2*q > M) continue;
+        for (m=0; m<M; ++m)
+        {
+            cosv[m] = cosf(2.0f * (float) M_PI * (float) (q*m) / (float) M);
+            sinv[m] = sinf(2.0f * (float) M_PI * (float) (q*m) / (float) M);
+        }
+
+        power = 0.0f;
+        for (k=0; k<K; ++k)
+        {
+            re = 0.0f;
+            im = 0.0f;
+            for (m=0; m<M; ++m)
+            {
+                val = point[m*sm + k*sk];
+                re += val * cosv[m];
+                im -= val * sinv[m];
+            }
+            power += re*re + im*im;
+        }
+        if ((q > 0) && (2*q < M)) power *= 2.0f;
+        spec[q] += scale * power;
+    }
+}
+
+/**
+ * apodwindow: weight of channel m of an M channel aperture
+ * 
+ * Parameters:
+ * apod: APOD_RECT, APOD_HANN, or APOD_HAMMING
+ * m: the index of the channel within the aperture
+ * M: the number of channels in the aperture
+*/
+static float apodwindow(int apod, int m, int M)
+{
+    float x = ((float) m + 0.5f) / (float) M;
+
+    switch (apod)
+    {
+        case APOD_HANN: return 0.5f - 0.5f*cosf(2.0f * (float) M_PI * x);
+        case APOD_HAMMING: return 0.54f - 0.46f*cosf(2.0f * (float) M_PI * x);
+        default: return 1.0f;
+    }
+}
+
+/**
+ * slscPoints: short-lag spatial coherence of pre-delayed channel data, one value per point
+ * 
+ * Parameters:
+ * input: pointer to the first sample of a P by M by K strided tensor. p = point, m = channel, k = kernel sample
+ * P: the number of points
+ * M: the number of channels
+ * K: the number of samples in each point's axial kernel
+ * sp, sm, sk: the strides, in floats, between points, channels and kernel samples
+ * lags: vector of L lag indices, each between 1 and M-1
+ * L: the number of lags
+ * output: vector of length P to write the sum of the lag coherences of each point into
+*/
+void slscPoints(const float * input, int P, int M, int K, ptrdiff_t sp, ptrdiff_t sm, ptrdiff_t sk, const int * lags, int L, float * output)
+{
+    int nthreads = getRhoThreads();
+    double t0 = getRhoStats() ? rhoclock() : 0.0;
+
+    #pragma omp parallel num_threads(nthreads)
+    {
+        float * avg = (float *) malloc(sizeof(float) * M);
+        float * gain = (float *) malloc(sizeof(float) * M);
+        int p;
+
+        #pragma omp for schedule(static)
+        for (p=0; p<P; ++p)
+        {
+            chanstats(input + p*sp, M, K, sm, sk, avg, gain);
+            output[p] = kerncoherence(input + p*sp, M, K, sm, sk, lags, L, NULL, avg, gain, 1.0f, NULL);
+        }
+
+        free(avg);
+        free(gain);
+    }
+
+    if (getRhoStats()) rhostat(RHOSTAT_POINTS, rhoclock() - t0, 1, 2*sizeof(float)*M*(long long) nthreads, P);
+}
+
+// variance of a sliding window, relative to the cumulative energy it is differenced from, below which it is rounding
+#define SLIDE_RTOL 1E-10
+
+/**
+ * slscSliding: short-lag spatial coherence image of depth-sorted channel data with a sliding axial kernel
+ * 
+ * The kernel of output sample n spans samples [n-K/2, n-K/2+K), clipped to the trace. The sums of x, x^2 
+ * and of each pair's cross product are formed as cumulative sums once per channel or pair, so every output 
+ * sample costs O(1) in the kernel length. The mean of each channel is removed within each window, and a channel 
+ * whose variance within a window is below SLIDE_RTOL of its cumulative energy, the rounding of the differenced 
+ * sums, e.g. every channel of a 1 sample kernel, is constant there and pairs with it contribute 0, as in slscPoints.
+ * int16 and float16 traces are widened one trace at a time as they are read.
+ * 
+ * Parameters:
+ * input: pointer to the first sample of a Q by M by N strided tensor. q = scan line, m = channel, n = depth sample
+ * fmt: the sample format of input, RF_FLOAT32, RF_INT16, or RF_FLOAT16
+ * Q: the number of scan lines
+ * M: the number of channels
+ * N: the number of depth samples in each trace
+ * sq, sm, sn: the strides, in samples, between scan lines, channels and depth samples
+ * K: the length of the axial kernel in samples
+ * lags: vector of L lag indices, each between 1 and M-1
+ * L: the number of lags
+ * output: Q by N C-contiguous matrix to write the sum of the lag coherences of each sample into
+*/
+void slscSliding(const void * input, int fmt, int Q, int M, int N, ptrdiff_t sq, ptrdiff_t sm, ptrdiff_t sn, int K, const int * lags, int L, float * output)
+{
+    const void * line;
+    double * sum;
+    double * sqr;
+    int * pairs;
+    float * out;
+    int q, m, n, l, Npairs;
+    int nthreads = getRhoThreads();
+    double t0 = getRhoStats() ? rhoclock() : 0.0;
+
+    // cumulative sums with a leading zero, sum[m*(N+1) + n] is the sum of the first n samples
+    sum = (double *) malloc(sizeof(double) * M * (N+1));
+    sqr = (double *) malloc(sizeof(double) * M * (N+1));
+
+    // flatten the (lag, channel) pairs so they can be shared among threads
+    Npairs = 0;
+    for (l=0; l<L; ++l) Npairs += M - lags[l];
+    pairs = (int *) malloc(sizeof(int) * 2 * Npairs);
+    Npairs = 0;
+    for (l=0; l<L; ++l)
+    {
+        for (m=0; m<(M-lags[l]); ++m)
+        {
+            pairs[2*Npairs] = m;
+            pairs[2*Npairs+1] = lags[l];
+            ++Npairs;
+        }
+    }
+
+    for (q=0; q<Q; ++q)
+    {
+        line = rfoffset(input, fmt, q*sq);
+        out = output + (ptrdiff_t) q*N;
+        for (n=0; n<N; ++n) out[n] = 0.0f;
+
+        // running sums of every channel
+        #pragma omp parallel num_threads(nthreads) private(n)
+        {
+            float * buf = (float *) malloc(sizeof(float) * N);
+            const float * vec;
+
+            #pragma omp for schedule(static)
+            for (m=0; m<M; ++m)
+            {
+                vec = rfspan(rfoffset(line, fmt, m*sm), fmt, sn, N, 0, N, buf);
+                sum[m*(N+1)] = 0.0;
+                sqr[m*(N+1)] = 0.0;
+                for (n=0; n<N; ++n)
+                {
+                    sum[m*(N+1)+n+1] = sum[m*(N+1)+n] + (double) vec[n];
+                    sqr[m*(N+1)+n+1] = sqr[m*(N+1)+n] + (double) vec[n] * (double) vec[n];
+                }
+            }
+
+            free(buf);
+        }
+
+        // each thread accumulates its pairs into a private line and adds it to the output once
+        #pragma omp parallel num_threads(nthreads)
+        {
+            double * cross = (double *) malloc(sizeof(double) * (N+1));
+            float * part = (float *) calloc(N, sizeof(float));
+            float * buf1 = (float *) malloc(sizeof(float) * N);
+            float * buf2 = (float *) malloc(sizeof(float) * N);
+            const float * vec1;
+            const float * vec2;
+            double s1, s2, v1, v2, cov, count;
+            int ip, i, j, lag, lo, hi, k;
+
+            #pragma omp for schedule(dynamic, 1)
+            for (ip=0; ip<Npairs; ++ip)
+            {
+                i = pairs[2*ip];
+                lag = pairs[2*ip+1];
+                j = i + lag;
+
+                // running sum of this pair's cross product
+                vec1 = rfspan(rfoffset(line, fmt, i*sm), fmt, sn, N, 0, N, buf1);
+                vec2 = rfspan(rfoffset(line, fmt, j*sm), fmt, sn, N, 0, N, buf2);
+                cross[0] = 0.0;
+                for (k=0; k<N; ++k) cross[k+1] = cross[k] + (double) vec1[k] * (double) vec2[k];
+
+                // slide the kernel, each window is a difference of cumulative sums
+                for (k=0; k<N; ++k)
+                {
+                    lo = k - K/2;
+                    hi = lo + K;
+                    if (lo < 0) lo = 0;
+                    if (hi > N) hi = N;
+                    count = (double) (hi - lo);
+
+                    s1 = sum[i*(N+1)+hi] - sum[i*(N+1)+lo];
+                    s2 = sum[j*(N+1)+hi] - sum[j*(N+1)+lo];
+                    v1 = sqr[i*(N+1)+hi] - sqr[i*(N+1)+lo] - s1*s1/count;
+                    v2 = sqr[j*(N+1)+hi] - sqr[j*(N+1)+lo] - s2*s2/count;
+                    cov = cross[hi] - cross[lo] - s1*s2/count;
+
+                    if ((v1 > SLIDE_RTOL * sqr[i*(N+1)+hi]) && (v2 > SLIDE_RTOL * sqr[j*(N+1)+hi])) 
+                        part[k] += (float) (cov / sqrt(v1*v2) / (double)(M-lag));
+                }
+            }
+
+            #pragma omp critical
+            for (k=0; k<N; ++k) out[k] += part[k];
+
+            free(cross);
+            free(part);
+            free(buf1);
+            free(buf2);
+        }
+    }
+
+    free(sum);
+    free(sqr);
+    free(pairs);
+    if (getRhoStats())
+    {
+        rhostat(RHOSTAT_SLIDING, rhoclock() - t0, 1, 2*sizeof(double)*M*(N+1) + 2*sizeof(int)*Npairs 
+                + (sizeof(double)*(N+1) + 4*sizeof(float)*N) * (long long) Q*nthreads, (long long) Q*M*N);
+    }
+}
+
+/**
+ * fusedWork: the number of floats of scratch each thread of slscFused or slscFusedIQ works in
+ * 
+ * Parameters:
+ * Ntx, Nrx: the number of transmits and receive channels
+ * K: the number of samples in the axial kernel
+ * iq: 0 for slscFused, nonzero for slscFusedIQ
+*/
+ptrdiff_t fusedWork(int Ntx, int Nrx, int K, int iq)
+{
+    if (0 != iq) return 2 * (ptrdiff_t) Nrx * K + 5 * (ptrdiff_t) Nrx + Ntx;
+    return (ptrdiff_t) Nrx * K + K + 1 + 6 * (ptrdiff_t) Nrx + Ntx;
+}
+
+/**
+ * slscFused: delay, interpolate, and take the short-lag spatial coherence of raw RF in a single pass
+ * 
+ * For every point, the RF of each receive channel is delayed by the sum of the transmit and receive delays,
+ * linearly interpolated, and summed over transmits into a single Nrx by K kernel that is reused point to point.
+ * No focused channel cube is ever formed. Transmits can be split into groups, e.g. subsets of plane wave angles, 
+ * each compounded into the same kernel in turn, and the coherence averaged over the groups. Samples outside of the recorded trace are treated as 0. int16 and
+ * float16 data are widened one K+1 sample span at a time, right before they are interpolated.
+ * The delays of each point are read from tables or recomputed from geometry, as described by tx and rx.
+ * When an aperture is given, only the channels in each point's active range are delayed and paired.
+ * Besides the SLSC sum, the per-lag coherences and the spatial spectrum of each point's kernel can be written out, 
+ * from which the coherence factor, generalized coherence factor, and lag-weighted SLSC follow without another pass.
+ * 
+ * Parameters:
+ * data: pointer to the first sample of an Ntx by Nrx by Ns strided tensor of RF data
+ * fmt: the sample format of data, RF_FLOAT32, RF_INT16, or RF_FLOAT16
+ * Ntx, Nrx, Ns: the number of transmits, receive channels, and samples
+ * st, sr, ss: the strides, in samples, between transmits, receive channels, and samples
+ * fs: the sampling frequency [Hz]
+ * tstart: the time of the first sample [s]
+ * P: the number of points
+ * points: pointer to the first coordinate of a strided P by 3 matrix of points, only read by geometric models
+ * sp, sd: the strides, in floats, between points and between coordinates
+ * tx: model of the Ntx transmit delays
+ * rx: model of the Nrx receive delays
+ * txorder: the transmits of every group, group after group. NULL to compound every transmit into a single group
+ * txstart: vector of G+1 offsets into txorder, group g holds transmits txorder[txstart[g]] to txorder[txstart[g+1]-1]
+ * G: the number of transmit groups, each group's coherence outputs are averaged with weight 1/G
+ * aplo, aphi: length P vectors of the first and one past the last active channel of each point. NULL for the full aperture.
+ *             Lags of aphi-aplo or more are skipped, see kerncoherence
+ * apod: APOD_RECT, APOD_HANN, or APOD_HAMMING window across each point's active channels
+ * K: the number of samples in the axial kernel, centered on each point
+ * lags: vector of L lag indices, each between 1 and Nrx-1
+ * L: the number of lags
+ * output: vector of length P to write the sum of the lag coherences of each point into
+ * rhos: P by L C-contiguous matrix to write the coherence of each lag of each point into. NULL to skip
+ * Q: the highest spatial frequency whose energy is accumulated into spec
+ * spec: P by Q+1 C-contiguous matrix to write each point's energy at spatial frequencies 0 through Q into, see 
+ *       kernspectrum. NULL to skip
+ * energy: vector of length P to write the incoherent energy of each point's kernel into. NULL to skip, ignored without spec
+ * work: scratch buffer of getRhoThreads() * fusedWork(Ntx, Nrx, K, 0) floats reused across calls. NULL to allocate 
+ *       the scratch of each thread per call
+ * order: permutation of the P points to visit them in, e.g. spatially compact tiles whose RF windows overlap.
+ *        Outputs are still written at each point's own index. NULL to visit the points in order
+ * tile: the number of consecutive points of order each thread takes at a time, 0 for 64
+*/
+void slscFused(const void * data, int fmt, int Ntx, int Nrx, int Ns, ptrdiff_t st, ptrdiff_t sr, ptrdiff_t ss, float fs, float tstart,
+               int P, const float * points, ptrdiff_t sp, ptrdiff_t sd, const delaymodel * tx, const delaymodel * rx,
+               const int * txorder, const int * txstart, int G,
+               const int * aplo, const int * aphi, int apod, int K, const int * lags, int L, float * output,
+               float * rhos, int Q, float * spec, float * energy, float * work, const int * order, int tile)
+{
+    int nthreads = getRhoThreads();
+    int chunk = (tile > 0) ? tile : 64;
+    ptrdiff_t nwork = fusedWork(Ntx, Nrx, K, 0);
+    int timed = getRhoStats();
+    double t0 = timed ? rhoclock() : 0.0;
+
+    // every thread owns one kernel buffer and works through the points a tile at a time
+    #pragma omp parallel num_threads(nthreads)
+    {
+        const float * span;
+        const float * point;
+        float * scratch = (NULL == work) ? (float *) malloc(sizeof(float) * nwork) : work + (ptrdiff_t) rhothreadnum() * nwork;
+        float * kern = scratch;
+        float * buf = kern + (ptrdiff_t) Nrx * K;
+        float * avg = buf + K + 1;
+        float * gain = avg + Nrx;
+        float * txtau = gain + Nrx;
+        float * rxtau = txtau + Ntx;
+        float * weights = rxtau + Nrx;
+        float * cosv = weights + Nrx;
+        float * sinv = cosv + Nrx;
+        float * chan;
+        float tau, frac;
+        float scale = 1.0f / (float) G;
+        int ip, p, g, j, itx, irx, k, i0, lo, hi;
+        int ntx = (NULL == txstart) ? Ntx : txstart[G];
+
+        // thread time and work of each phase, only measured while the counters are on
+        double tic = 0.0, toc = 0.0, tdelays = 0.0, tinterp = 0.0, tstats = 0.0, tlags = 0.0;
+        long long npoints = 0, ninterp = 0, nchan = 0, nlags = 0;
+
+        #pragma omp for schedule(dynamic, chunk)
+        for (ip=0; ip<P; ++ip)
+        {
+            // every delay of this point is evaluated once, whatever the model
+            if (timed) tic = rhoclock();
+            p = (NULL == order) ? ip : order[ip];
+            point = (NULL == points) ? NULL : points + p*sp;
+            delaysat(tx, P, p, point, sd, txtau);
+            delaysat(rx, P, p, point, sd, rxtau);
+            if (timed)
+            {
+                toc = rhoclock();
+                tdelays += toc - tic;
+                tic = toc;
+                ++npoints;
+            }
+
+            // every output of this point is the average over its groups, so they are accumulated from 0
+            output[p] = 0.0f;
+            if (NULL != rhos) for (k=0; k<L; ++k) rhos[(ptrdiff_t) p*L + k] = 0.0f;
+            if (NULL != spec) for (k=0; k<=Q; ++k) spec[(ptrdiff_t) p*(Q+1) + k] = 0.0f;
+            if ((NULL != spec) && (NULL != energy)) energy[p] = 0.0f;
+
+            // channels outside of the active aperture are never delayed or paired
+            lo = (NULL == aplo) ? 0 : aplo[p];
+            hi = (NULL == aphi) ? Nrx : aphi[p];
+            if (hi - lo < 2) continue;
+            for (irx=lo; irx<hi; ++irx) weights[irx-lo] = apodwindow(apod, irx-lo, hi-lo);
+
+            for (g=0; g<G; ++g)
+            {
+                // the transmits of one group are compounded coherently, every group reuses the same kernel
+                for (irx=lo; irx<hi; ++irx)
+                {
+                    chan = kern + irx*K;
+                    for (k=0; k<K; ++k) chan[k] = 0.0f;
+
+                    for (j=((NULL == txstart) ? 0 : txstart[g]); j<((NULL == txstart) ? Ntx : txstart[g+1]); ++j)
+                    {
+                        // fractional sample of the kernel center, the weights are shared by every kernel sample
+                        itx = (NULL == txorder) ? j : txorder[j];
+                        tau = (txtau[itx] + rxtau[irx] - tstart) * fs;
+                        i0 = (int) floorf(tau);
+                        frac = tau - (float) i0;
+                        i0 -= K/2;
+
+                        // the K+1 samples the kernel interpolates between, zero outside of the trace
+                        span = rfspan(rfoffset(data, fmt, itx*st + irx*sr), fmt, ss, Ns, i0, K+1, buf);
+                        for (k=0; k<K; ++k) chan[k] += (1.0f - frac) * span[k] + frac * span[k+1];
+                    }
+                }
+                if (timed)
+                {
+                    toc = rhoclock();
+                    tinterp += toc - tic;
+                    tic = toc;
+                }
+
+                // mean and energy of each active channel within this point's kernel, then the lag sums
+                chanstats(kern + lo*K, hi-lo, K, K, 1, avg, gain);
+                if (timed)
+                {
+                    toc = rhoclock();
+                    tstats += toc - tic;
+                    tic = toc;
+                    nchan += hi-lo;
+                }
+
+                output[p] += scale * kerncoherence(kern + lo*K, hi-lo, K, K, 1, lags, L, (APOD_RECT == apod) ? NULL : weights, avg, gain, 
+                                                   scale, (NULL == rhos) ? NULL : rhos + (ptrdiff_t) p*L);
+                if (NULL != spec)
+                {
+                    kernspectrum(kern + lo*K, hi-lo, K, K, 1, Q, cosv, sinv, scale, spec + (ptrdiff_t) p*(Q+1), 
+                                 (NULL == energy) ? NULL : energy + p);
+                }
+                if (timed)
+                {
+                    toc = rhoclock();
+                    tlags += toc - tic;
+                    tic = toc;
+                    nlags += L;
+                }
+            }
+            if (timed) ninterp += (long long) (hi-lo) * ntx * K;
+        }
+
+        if (timed)
+        {
+            rhostat(RHOSTAT_FUSED_DELAYS, tdelays, npoints, 0, npoints);
+            rhostat(RHOSTAT_FUSED_INTERP, tinterp, npoints, 0, ninterp);
+            rhostat(RHOSTAT_FUSED_STATS, tstats, npoints, 0, nchan);
+            rhostat(RHOSTAT_FUSED_LAGS, tlags, npoints, 0, nlags);
+        }
+
+        if (NULL == work) free(scratch);
+    }
+
+    if (timed) rhostat(RHOSTAT_FUSED, rhoclock() - t0, 1, (NULL == work) ? sizeof(float) * nwork * nthreads : 0, P);
+}
+
+/**
+ * slscSweep: short-lag spatial coherence of raw RF at every point for each of several speeds of sound, in one pass
+ * 
+ * The delays of geometric beamforming scale with the slowness 1/c, so tx and rx are the delays at reference speeds of 
+ * sound txc and rxc, from the same tables or geometry slscFused reads, and the part of each delay past its fixed 
+ * offset, e.g. the reference delay of a plane wave, is rescaled to every speed: off + (delay - off) * c0 / c. Every 
+ * delay of a point is evaluated once and each speed only rescales them, so the channels of a point are interpolated 
+ * and paired at every speed while its RF windows are still in cache. The kernel, transmit groups, aperture, and 
+ * point order are those of slscFused.
+ * 
+ * Parameters:
+ * data, fmt, Ntx, Nrx, Ns, st, sr, ss, fs, tstart, P, points, sp, sd: as in slscFused
+ * tx: model of the Ntx transmit delays [s] at the speed of sound txc
+ * rx: model of the Nrx receive delays [s] at the speed of sound rxc
+ * txoff, rxoff: vectors of the Ntx and Nrx parts of the delays [s] that do not scale with the speed of sound. NULL for 0
+ * txc, rxc: the speeds of sound [m/s] the transmit and receive delays are taken at
+ * txorder, txstart, G, aplo, aphi, apod, K, lags, L: as in slscFused
+ * slowness: vector of the inverses of the C speeds of sound [s/m]
+ * C: the number of speeds of sound
+ * output: C by P C-contiguous matrix to write the sum of the lag coherences of each point at each speed into
+ * work: scratch buffer of getRhoThreads() * (fusedWork(Ntx, Nrx, K, 0) + Ntx + Nrx) floats reused across calls. NULL 
+ *       to allocate the scratch of each thread per call
+ * order, tile: as in slscFused
+*/
+void slscSweep(const void * data, int fmt, int Ntx, int Nrx, int Ns, ptrdiff_t st, ptrdiff_t sr, ptrdiff_t ss, float fs, float tstart,
+               int P, const float * points, ptrdiff_t sp, ptrdiff_t sd, const delaymodel * tx, const delaymodel * rx,
+               const float * txoff, const float * rxoff, float txc, float rxc, const int * txorder, const int * txstart, int G,
+               const int * aplo, const int * aphi, int apod, int K, const int * lags, int L, const float * slowness, int C,
+               float * output, float * work, const int * order, int tile)
+{
+    int nthreads = getRhoThreads();
+    int chunk = (tile > 0) ? tile : 64;
+    ptrdiff_t nwork = fusedWork(Ntx, Nrx, K, 0) + Ntx + Nrx;
+    double t0 = getRhoStats() ? rhoclock() : 0.0;
+
+    // every thread owns one kernel buffer and the path lengths of its current point, its delays at c = 1 m/s
+    #pragma omp parallel num_threads(nthreads)
+    {
+        const float * span;
+        const float * point;
+        float * scratch = (NULL == work) ? (float *) malloc(sizeof(float) * nwork) : work + (ptrdiff_t) rhothreadnum() * nwork;
+        float * kern = scratch;
+        float * buf = kern + (ptrdiff_t) Nrx * K;
+        float * avg = buf + K + 1;
+        float * gain = avg + Nrx;
+        float * txtau = gain + Nrx;
+        float * rxtau = txtau + Ntx;
+        float * weights = rxtau + Nrx;
+        float * txlen = weights + 3 * (ptrdiff_t) Nrx;
+        float * rxlen = txlen + Ntx;
+        float * out;
+        float * chan;
+        float tau, frac, slow;
+        float scale = 1.0f / (float) G;
+        int ip, p, ic, g, j, itx, irx, k, i0, lo, hi;
+
+        #pragma omp for schedule(dynamic, chunk)
+        for (ip=0; ip<P; ++ip)
+        {
+            // the path lengths and aperture of this point are shared by every speed
+            p = (NULL == order) ? ip : order[ip];
+            point = (NULL == points) ? NULL : points + p*sp;
+            delaysat(tx, P, p, point, sd, txlen);
+            delaysat(rx, P, p, point, sd, rxlen);
+            for (itx=0; itx<Ntx; ++itx) txlen[itx] = (txlen[itx] - ((NULL == txoff) ? 0.0f : txoff[itx])) * txc;
+            for (irx=0; irx<Nrx; ++irx) rxlen[irx] = (rxlen[irx] - ((NULL == rxoff) ? 0.0f : rxoff[irx])) * rxc;
+
+            for (ic=0; ic<C; ++ic) output[(ptrdiff_t) ic*P + p] = 0.0f;
+            lo = (NULL == aplo) ? 0 : aplo[p];
+            hi = (NULL == aphi) ? Nrx : aphi[p];
+            if (hi - lo < 2) continue;
+            for (irx=lo; irx<hi; ++irx) weights[irx-lo] = apodwindow(apod, irx-lo, hi-lo);
+
+            for (ic=0; ic<C; ++ic)
+            {
+                // delays at this speed, in samples from the start of the trace
+                slow = slowness[ic];
+                for (itx=0; itx<Ntx; ++itx) txtau[itx] = txlen[itx]*slow + ((NULL == txoff) ? 0.0f : txoff[itx]);
+                for (irx=lo; irx<hi; ++irx) rxtau[irx] = rxlen[irx]*slow + ((NULL == rxoff) ? 0.0f : rxoff[irx]);
+                out = output + (ptrdiff_t) ic*P + p;
+
+                for (g=0; g<G; ++g)
+                {
+                    for (irx=lo; irx<hi; ++irx)
+                    {
+                        chan = kern + irx*K;
+                        for (k=0; k<K; ++k) chan[k] = 0.0f;
+
+                        for (j=((NULL == txstart) ? 0 : txstart[g]); j<((NULL == txstart) ? Ntx : txstart[g+1]); ++j)
+                        {
+                            itx = (NULL == txorder) ? j : txorder[j];
+                            tau = (txtau[itx] + rxtau[irx] - tstart) * fs;
+                            i0 = (int) floorf(tau);
+                            frac = tau - (float) i0;
+                            i0 -= K/2;
+
+                            span = rfspan(rfoffset(data, fmt, itx*st + irx*sr), fmt, ss, Ns, i0, K+1, buf);
+                            for (k=0; k<K; ++k) chan[k] += (1.0f - frac) * span[k] + frac * span[k+1];
+                        }
+                    }
+
+                    chanstats(kern + lo*K, hi-lo, K, K, 1, avg, gain);
+                    *out += scale * kerncoherence(kern + lo*K, hi-lo, K, K, 1, lags, L, (APOD_RECT == apod) ? NULL : weights, avg, gain, 
+                                                  scale, NULL);
+                }
+            }
+        }
+
+        if (NULL == work) free(scratch);
+    }
+
+    if (getRhoStats()) rhostat(RHOSTAT_SWEEP, rhoclock() - t0, 1, (NULL == work) ? sizeof(float) * nwork * nthreads : 0, (long long) C*P);
+}
+
+/**
+ * kerniqcoherence: sum of the lag coherences of one point's complex IQ channel kernels
+ * 
+ * Parameters:
+ * point: pointer to the first sample of an M by K C-contiguous matrix of interleaved (real, imaginary) samples
+ * M: the number of channels
+ * K: the number of samples in the kernel
+ * lags: vector of L lag indices, lags of M or more have no pairs and are skipped, adding 0 to the sum. With a dynamic
+ *       aperture, points whose active aperture is narrower than a lag therefore sum fewer lags
+ * L: the number of lags
+ * apod: length M vector of channel weights, pairs are weighted by the product of their weights. NULL for uniform weights
+ * avg, gain: interleaved complex means and inverse root energies of each channel, from iqstats
+ * part: IQ_REAL or IQ_ABS, see iqpair
+*/
+static float kerniqcoherence(const float * point, int M, int K, const int * lags, int L, const float * apod, const float * avg, const float * gain, int part)
+{
+    float rho, weight, wsum, output;
+    int m, l;
+
+    output = 0.0f;
+    for (l=0; l<L; ++l)
+    {
+        if (lags[l] >= M) continue;
+
+        rho = 0.0f;
+        wsum = 0.0f;
+        for (m=0; m<(M-lags[l]); ++m)
+        {
+            weight = (NULL == apod) ? 1.0f : apod[m] * apod[m+lags[l]];
+            if (weight == 0.0f) continue;
+            rho += weight * iqpair(point + 2*m*K, point + 2*(m+lags[l])*K, K, 1, avg + 2*m, avg + 2*(m+lags[l]), gain[m], gain[m+lags[l]], part);
+            wsum += weight;
+        }
+        if (wsum > 0.0f) output += rho / wsum;
+    }
+
+    return output;
+}
+
+/**
+ * slscFusedIQ: delay, interpolate, and take the short-lag spatial coherence of complex baseband IQ in a single pass
+ * 
+ * The same pass as slscFused on IQ data, e.g. from demodIQ. Each delay is applied as a coarse shift of the
+ * baseband samples, linearly interpolated, plus a rotation by exp(j 2 pi fc tau) that restores the carrier phase,
+ * so the data only needs one or two samples per cycle. Transmits are summed coherently into one Nrx by K complex
+ * kernel per point, and every pair's normalized complex correlation is reduced to its real part or magnitude.
+ * 
+ * Parameters:
+ * data: pointer to the first sample of an Ntx by Nrx by Ns strided tensor of interleaved (real, imaginary) IQ samples
+ * Ntx, Nrx, Ns: the number of transmits, receive channels, and IQ samples
+ * st, sr, ss: the strides, in complex samples, between transmits, receive channels, and samples
+ * fs: the IQ sampling frequency [Hz]
+ * fc: the demodulation frequency [Hz]
+ * tstart: the time of the first sample [s]
+ * P, points, sp, sd, tx, rx, txorder, txstart, G, aplo, aphi, apod, K, lags, L: as in slscFused, with K counted in IQ samples
+ * part: IQ_REAL or IQ_ABS, see iqpair
+ * output: vector of length P to write the sum of the lag coherences of each point into
+ * work: scratch buffer of getRhoThreads() * fusedWork(Ntx, Nrx, K, 1) floats reused across calls. NULL to allocate 
+ *       the scratch of each thread per call
+ * order, tile: as in slscFused
+*/
+void slscFusedIQ(const float * data, int Ntx, int Nrx, int Ns, ptrdiff_t st, ptrdiff_t sr, ptrdiff_t ss, float fs, float fc, float tstart,
+                 int P, const float * points, ptrdiff_t sp, ptrdiff_t sd, const delaymodel * tx, const delaymodel * rx,
+                 const int * txorder, const int * txstart, int G,
+                 const int * aplo, const int * aphi, int apod, int K, const int * lags, int L, int part, float * output, float * work,
+                 const int * order, int tile)
+{
+    int nthreads = getRhoThreads();
+    int chunk = (tile > 0) ? tile : 64;
+    ptrdiff_t nwork = fusedWork(Ntx, Nrx, K, 1);
+    double t0 = getRhoStats() ? rhoclock() : 0.0;
+
+    #pragma omp parallel num_threads(nthreads)
+    {
+        const float * trace;
+        const float * point;
+        float * scratch = (NULL == work) ? (float *) malloc(sizeof(float) * nwork) : work + (ptrdiff_t) rhothreadnum() * nwork;
+        float * kern = scratch;
+        float * avg = kern + 2 * (ptrdiff_t) Nrx * K;
+        float * gain = avg + 2*Nrx;
+        float * txtau = gain + Nrx;
+        float * rxtau = txtau + Ntx;
+        float * weights = rxtau + Nrx;
+        float * chan;
+        float tau, frac, re, im, rotre, rotim;
+        float scale = 1.0f / (float) G;
+        double phase;
+        int ip, p, g, j, itx, irx, k, i0, idx, lo, hi;
+
+        #pragma omp for schedule(dynamic, chunk)
+        for (ip=0; ip<P; ++ip)
+        {
+            p = (NULL == order) ? ip : order[ip];
+            point = (NULL == points) ? NULL : points + p*sp;
+            delaysat(tx, P, p, point, sd, txtau);
+            delaysat(rx, P, p, point, sd, rxtau);
+
+            output[p] = 0.0f;
+            lo = (NULL == aplo) ? 0 : aplo[p];
+            hi = (NULL == aphi) ? Nrx : aphi[p];
+            if (hi - lo < 2) continue;
+            for (irx=lo; irx<hi; ++irx) weights[irx-lo] = apodwindow(apod, irx-lo, hi-lo);
+
+            for (g=0; g<G; ++g)
+            {
+                // the transmits of one group are compounded coherently, every group reuses the same kernel
+                for (irx=lo; irx<hi; ++irx)
+                {
+                    chan = kern + 2*(irx-lo)*K;
+                    for (k=0; k<2*K; ++k) chan[k] = 0.0f;
+
+                    for (j=((NULL == txstart) ? 0 : txstart[g]); j<((NULL == txstart) ? Ntx : txstart[g+1]); ++j)
+                    {
+                        itx = (NULL == txorder) ? j : txorder[j];
+
+                        // coarse shift to the sample before the kernel center, the carrier phase is restored by one rotation
+                        tau = txtau[itx] + rxtau[irx];
+                        phase = 2.0 * M_PI * (double) fc * (double) tau;
+                        rotre = (float) cos(phase);
+                        rotim = (float) sin(phase);
+                        tau = (tau - tstart) * fs;
+                        i0 = (int) floorf(tau);
+                        frac = tau - (float) i0;
+                        i0 -= K/2;
+
+                        trace = data + 2*(itx*st + irx*sr);
+                        for (k=0; k<K; ++k)
+                        {
+                            idx = i0 + k;
+                            if ((idx < -1) || (idx >= Ns)) continue;
+                            re = 0.0f;
+                            im = 0.0f;
+                            if (idx >= 0)
+                            {
+                                re += (1.0f - frac) * trace[2*idx*ss];
+                                im += (1.0f - frac) * trace[2*idx*ss+1];
+                            }
+                            if (idx+1 < Ns)
+                            {
+                                re += frac * trace[2*(idx+1)*ss];
+                                im += frac * trace[2*(idx+1)*ss+1];
+                            }
+                            chan[2*k] += re*rotre - im*rotim;
+                            chan[2*k+1] += re*rotim + im*rotre;
+                        }
+                    }
+                }
+
+                iqstats(kern, hi-lo, K, K, 1, avg, gain);
+                output[p] += scale * kerniqcoherence(kern, hi-lo, K, lags, L, (APOD_RECT == apod) ? NULL : weights, avg, gain, part);
+            }
+        }
+
+        if (NULL == work) free(scratch);
+    }
+
+    if (getRhoStats()) rhostat(RHOSTAT_FUSEDIQ, rhoclock() - t0, 1, (NULL == work) ? sizeof(float) * nwork * nthreads : 0, P);
+}
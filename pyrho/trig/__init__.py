@@ -1 +1 @@
-from pyrho.trig.pytrig import geteletaus, getpwtaus, c_pw_engine, c_norm_engine
\ No newline at end of file
+from pyrho.trig.pytrig import geteletaus, getpwtaus, getaperture, c_pw_engine, c_norm_engine, c_pw_batch, c_norm_batch, c_norm_grid
\ No newline at end of file
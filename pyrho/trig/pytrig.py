@@ -1,147 +1,359 @@
 """Python wrapper for c-type coherence functions"""
 import ctypes as ct
-import cinpy as cnp
 import numpy as np
-from glob import glob
-import platform as _pltfm
+from pyrho.cbuf import asfloat32, fptr, iptr, estrides, outbuf
+from pyrho.instrument import staged
+from pyrho.backend import SharedLibrary, kernel
 import os
 
 # determine installed path
 dirpath = os.path.dirname(__file__)
 
-# determine the OS and relative binary file
-if _pltfm.uname()[0] == "Windows":
-    res = glob(os.path.abspath(os.path.join(dirpath, "*.dll")))
-    name = res[0]
-elif _pltfm.uname()[0] == "Linux":
-    res = glob(os.path.abspath(os.path.join(dirpath, "*.so")))
-    name = res[0]
-else:
-    res = glob(os.path.abspath(os.path.join(dirpath, "*.dylib")))
-    name = res[0]
+def _declare(lib):
+    """declare the signatures of the functions of the freshly loaded library"""
+    lib.setTrigThreads.argtypes = ct.c_int,
+    lib.setTrigThreads.restype = None
 
-# load the c library
-__trig__ = ct.CDLL(name)
+    lib.getTrigThreads.argtypes = ()
+    lib.getTrigThreads.restype = ct.c_int
 
-__trig__.rxengine.argtypes = ct.c_int, ct.c_float, ct.POINTER(ct.POINTER(ct.c_float)), ct.POINTER(ct.POINTER(ct.POINTER(ct.c_float))),
-__trig__.rxengine.restype = ct.POINTER(ct.c_float)
+    lib.rxengine.argtypes = ct.c_int, ct.c_float, ct.POINTER(ct.c_float), ct.POINTER(ct.c_float), ct.c_ssize_t, ct.c_ssize_t, ct.POINTER(ct.c_float),
+    lib.rxengine.restype = None
 
-__trig__.pwtxengine.argtypes = ct.c_int, ct.c_float, ct.c_float, ct.POINTER(ct.POINTER(ct.c_float)), ct.POINTER(ct.POINTER(ct.c_float)), ct.POINTER(ct.POINTER(ct.POINTER(ct.c_float))),
-__trig__.pwtxengine.restype = ct.POINTER(ct.c_float)
+    lib.pwtxengine.argtypes = ct.c_int, ct.c_float, ct.c_float, ct.POINTER(ct.c_float), ct.POINTER(ct.c_float), ct.POINTER(ct.c_float), ct.c_ssize_t, ct.c_ssize_t, ct.POINTER(ct.c_float),
+    lib.pwtxengine.restype = None
 
-__trig__.genmask3D.argtypes = ct.c_int, ct.c_float, ct.POINTER(ct.POINTER(ct.c_float)), ct.POINTER(ct.POINTER(ct.c_float)), ct.POINTER(ct.POINTER(ct.c_float)), ct.POINTER(ct.POINTER(ct.POINTER(ct.c_float))),
-__trig__.genmask3D.restype = ct.POINTER(ct.c_int)
+    lib.genmask3D.argtypes = ct.c_int, ct.c_float, ct.c_int, ct.POINTER(ct.c_float), ct.POINTER(ct.c_float), ct.POINTER(ct.c_float), ct.POINTER(ct.c_float), ct.c_ssize_t, ct.c_ssize_t, ct.POINTER(ct.c_int),
+    lib.genmask3D.restype = None
 
-def geteletaus(eles, points, c:float=1540):
+    lib.genaperture.argtypes = ct.c_int, ct.POINTER(ct.c_float), ct.c_int, ct.POINTER(ct.c_float), ct.POINTER(ct.c_float), ct.c_int, ct.POINTER(ct.c_float), ct.c_int, ct.POINTER(ct.c_float), ct.c_ssize_t, ct.c_ssize_t, ct.POINTER(ct.c_int), ct.POINTER(ct.c_int),
+    lib.genaperture.restype = None
+
+    lib.rxbatch.argtypes = ct.c_int, ct.POINTER(ct.c_float), ct.c_int, ct.c_float, ct.POINTER(ct.c_float), ct.c_ssize_t, ct.c_ssize_t, ct.POINTER(ct.c_float),
+    lib.rxbatch.restype = None
+
+    lib.pwtxbatch.argtypes = ct.c_int, ct.POINTER(ct.c_float), ct.POINTER(ct.c_float), ct.POINTER(ct.c_float), ct.c_int, ct.c_float, ct.POINTER(ct.c_float), ct.c_ssize_t, ct.c_ssize_t, ct.POINTER(ct.c_float),
+    lib.pwtxbatch.restype = None
+
+# the c library, loaded on the first kernel call
+__trig__ = SharedLibrary(dirpath, _declare)
+
+def _pointview(points, name:str="points"):
+    """float32 view of a P by 3 matrix with its point and coordinate strides, copying only if it is not float32"""
+    if (np.ndim(points) != 2): raise ValueError(f"{name} must be 2D")
+    if (np.shape(points)[1] != 3): raise ValueError(f"{name} must be P by 3")
+    points = asfloat32(points)
+    sp, sd = estrides(points)
+    return points, points.shape[0], sp, sd
+
+def _vec3(vec, name:str="vector"):
+    """contiguous float32 copy of a length 3 vector"""
+    vec = np.ascontiguousarray(vec, dtype=np.float32).flatten()
+    if vec.size != 3: raise ValueError(f"{name} must have length 3")
+    return vec
+
+def _vecs3(vecs, name:str="vectors"):
+    """contiguous float32 copy of an E by 3 matrix of small vectors"""
+    if (np.ndim(vecs) != 2): raise ValueError(f"{name} must be 2D")
+    if (np.shape(vecs)[1] != 3): raise ValueError(f"{name} must be E by 3")
+    return np.ascontiguousarray(vecs, dtype=np.float32)
+
+def geteletaus(eles, points, c:float=1540, out=None):
     """Calculate the time from each point to each element
     
     Parameters:
     ----
     eles: E by 3 matrix where E is the number of elements
-    points: P by 3 matrix where P is the number of points
+    points: P by 3 matrix where P is the number of points, read in place if float32
     c: speed of sound, default is 1540 m/s
+    out: optional caller-owned C-contiguous float32 E by P matrix to write into
 
     Returns:
     ----
-    Taus: a list of pointers to E arrays, each holing the delay from the respective element to all the points
+    Taus: E by P float32 matrix, each row holding the delay from the respective element to all the points
     """
 
-    if (np.ndim(eles) != 2): raise ValueError("eles must be 2D")
-    if (eles.shape[1] != 3):raise ValueError("eles must be E by 3")
-    if (np.ndim(points) != 2): raise ValueError("points must be 2D")
-    if (points.shape[1] != 3):raise ValueError("points must be P by 3")
-
-    # extract constants
-    # convert eles and points to c arrays
-    Celes, Me, Ne = cnp.copy2c(eles)
-    Cpoints, Mp, Np = cnp.copy2c(points)
-
-    TauEs = []
-    for i in range(Me.value):
-        ptaue = __trig__.rxengine(Mp, ct.c_float(c), ct.byref(Celes[i]), ct.byref(Cpoints))
-        TauEs.append(ptaue)
+    return c_norm_batch(eles, points, c, out=out)
 
-    return TauEs
-
-def getpwtaus(eles, points, teles, thetas, c=1540):
+def getpwtaus(eles, points, teles, thetas, c=1540, out=None):
     """Calculate the delays for each element transition to each point - assuming plane wave tx
 
     Parameters:
     ----
     eles: location of each element, E by 3 matrix
-    points: each point being interrogated, P by 3 matrix
+    points: each point being interrogated, P by 3 matrix, read in place if float32
     teles: time delay of each element at transmission, length E vector
-    thetas: steering angle of each plane wave, length E vector
+    thetas: steering angle of each plane wave from the z (depth) axis towards x, length E vector
     c: assumed speed of sound
+    out: optional caller-owned C-contiguous float32 E by P matrix to write into
 
     Return:
     ----
-    TauTx: a list of times needed to reach a given point, length E list of length P vectors
+    TauTx: E by P float32 matrix of the times needed to reach each point
     """
 
-    # convert eles and points to c arrays
-    Celes, Me, Ne = cnp.copy2c(eles)
-    Cpoints, Mp, Np = cnp.copy2c(points)
-    Cteles, Mt = cnp.copy2c(teles.flatten())
-    Cc = ct.c_float(c)
+    eles = _vecs3(eles, "eles")
+    teles = np.asarray(teles).flatten()
+    thetas = np.asarray(thetas).flatten()
 
-    if (Me.value != Mt.value) or (Mt.value != thetas.size):
+    if (eles.shape[0] != teles.size) or (teles.size != thetas.size):
         raise ValueError("All variables correxponding to the elements must have the same number of units")
     
-    TauTx = []
-    for ie in range(Me.value):
-        pnorm = (ct.c_float * 3)(ct.c_float(np.sin(thetas[ie])), ct.c_float(np.cos(thetas[ie])), ct.c_float(0))
-        tau = __trig__.pwtxengine(Mp, Cc, teles[ie], ct.byref(Celes[ie]), ct.byref(pnorm), ct.byref(Cpoints))
-        TauTx.append(tau)
+    # waves travel along +z (depth), steered by theta in the x-z plane
+    norms = np.array([np.sin(thetas), np.zeros(thetas.size), np.cos(thetas)]).T
+    return c_pw_batch(eles, teles, norms, points, c, out=out)
+
+@staged('c_norm_batch')
+@kernel('c_norm_batch')
+def c_norm_batch(xrefs, points, c:float=1540, out=None):
+    """Calculate the time to travel from every point to every spatial reference in one kernel call
+
+    Parameters:
+    ----
+    xrefs: E by 3 matrix of spatial reference points
+    points: Np by 3 matrix representing points in the field, read in place if float32
+    c: speed of sound in m/s
+    out: optional caller-owned C-contiguous float32 E by Np matrix to write into
+
+    Return:
+    ----
+    TauRx: E by Np float32 matrix. aka the delaytabs to every point from each reference
+    """
+
+    xrefs = _vecs3(xrefs, "xrefs")
+    points, Np, sp, sd = _pointview(points)
+    E = xrefs.shape[0]
+    out = outbuf(out, (E, Np))
+
+    __trig__.rxbatch(ct.c_int(E), fptr(xrefs), ct.c_int(Np), ct.c_float(c), fptr(points), sp, sd, fptr(out))
+
+    return out
+
+@staged('c_pw_batch')
+@kernel('c_pw_batch')
+def c_pw_batch(xrefs, trefs, norms, points, c:float=1540, out=None):
+    """Calculate the plane wave arrival time of every transmission at every point in one kernel call
+
+    Parameters:
+    ----
+    xrefs: Ntx by 3 matrix of spatial reference points of each wave
+    trefs: length Ntx vector of temporal reference points of each wave
+    norms: Ntx by 3 matrix of normal vectors of wave propagation
+    points: Np by 3 matrix representing points in the field, read in place if float32
+    c: speed of sound in m/s
+    out: optional caller-owned C-contiguous float32 Ntx by Np matrix to write into
+
+    Return:
+    ----
+    TauTx: Ntx by Np float32 matrix. aka the delaytabs to every point for each acq
+    """
+
+    xrefs = _vecs3(xrefs, "xrefs")
+    norms = _vecs3(norms, "norms")
+    trefs = np.ascontiguousarray(trefs, dtype=np.float32).flatten()
+    E = xrefs.shape[0]
+    if (norms.shape[0] != E) or (trefs.size != E):
+        raise ValueError("xrefs, trefs, and norms must have the same number of transmissions")
+    points, Np, sp, sd = _pointview(points)
+    out = outbuf(out, (E, Np))
+
+    __trig__.pwtxbatch(ct.c_int(E), fptr(xrefs), fptr(norms), fptr(trefs), ct.c_int(Np), ct.c_float(c), fptr(points), sp, sd, fptr(out))
 
-    return TauTx
+    return out
 
-def c_pw_engine(xref, tref, norm, points, Np:int, c:float=1540, dtype=ct.c_float):
+@staged('c_pw_engine')
+@kernel('c_pw_engine')
+def c_pw_engine(xref, tref, norm, points, c:float=1540, out=None):
     """Calculate the time to travel to each point based on spatial reference, temporal reference, 
-    and normal vector for Ntx transmisions to Np points
+    and normal vector for one transmision to Np points
 
     Parameters:
     ----
-    xrefs: a list of POINTER(dtype) to vector of length 3, represents spatial reference point of wave
-    trefs: a list of 'dtype' elements, represents the temporal reference point of the wave
-    norms: a list of POINTER(dtype) to vector of length 3, represents the normal vector of wave propagation
-    points: a POINTER(POINTER(dtype)) to matrix with size cNp 3 representing point in the field
-    Np: number of points in field
+    xref: vector of length 3, represents spatial reference point of wave
+    tref: a float, represents the temporal reference point of the wave
+    norm: vector of length 3, represents the normal vector of wave propagation
+    points: Np by 3 matrix representing points in the field, read in place if float32
     c: speed of sound in m/s
-    dtype: ctype datatype - only currently supported option is ctype.c_float
+    out: optional caller-owned C-contiguous float32 vector of length Np to write into
 
     Return:
     ----
-    TauTx: length Ntx list of POINTER(ctype) to vector of length Np. aka List of delaytabs to every point for each acq
+    TauTx: float32 vector of length Np. aka the delaytab to every point for this acq
     """
 
-    cNp = ct.c_int(Np)
-    cc = ct.c_float(c)
+    xref = _vec3(xref, "xref")
+    norm = _vec3(norm, "norm")
+    points, Np, sp, sd = _pointview(points)
+    out = outbuf(out, Np)
 
-    ptaus = __trig__.pwtxengine(cNp, cc, tref, ct.byref(xref), ct.byref(norm), ct.byref(points))
+    __trig__.pwtxengine(ct.c_int(Np), ct.c_float(c), ct.c_float(tref), fptr(xref), fptr(norm), fptr(points), sp, sd, fptr(out))
 
-    return ptaus
+    return out
 
-def c_norm_engine(xref, points, Np:int, c:float=1540, dtype=ct.c_float):
+@staged('c_norm_engine')
+@kernel('c_norm_engine')
+def c_norm_engine(xref, points, c:float=1540, out=None):
     """Calculate the time to travel from each point to each spatial reference
 
     Parameters:
     ----
-    xref: a POINTER(dtype) to vector of length 3, represents spatial reference point of wave
-    points: a POINTER(POINTER(dtype)) to matrix with size cNp 3 representing point in the field
-    Np: number of points in field
+    xref: vector of length 3, represents spatial reference point of wave
+    points: Np by 3 matrix representing points in the field, read in place if float32
     c: speed of sound in m/s
-    dtype: ctype datatype - only currently supported option is ctype.c_float
+    out: optional caller-owned C-contiguous float32 vector of length Np to write into
 
     Return:
     ----
-    TauTx: a POINTER(ctype) to vector of length Np. aka delaytabs to every point for each acq
+    TauRx: float32 vector of length Np. aka the delaytab to every point from the reference
+    """
+
+    xref = _vec3(xref, "xref")
+    points, Np, sp, sd = _pointview(points)
+    out = outbuf(out, Np)
+
+    __trig__.rxengine(ct.c_int(Np), ct.c_float(c), fptr(xref), fptr(points), sp, sd, fptr(out))
+
+    return out
+
+@staged('c_norm_grid')
+def c_norm_grid(xrefs, points, c:float=1540, rtol:float=1E-4):
+    """Calculate receive delays on a rectilinear grid from a single base table, exploiting translation symmetry
+
+    When the references are evenly spaced along x with equal y and z, and the x coordinates of the points lie on 
+    a lattice whose spacing divides the reference pitch, the delay from reference e to a point equals the delay 
+    from reference 0 to the point shifted by -e*pitch. One (lateral offset by (y, z)) base table then holds every
+    delay, and delay e of point p is base[index[p] + e*step].
+
+    Parameters:
+    ----
+    xrefs: E by 3 matrix of spatial reference points, e.g. the element positions
+    points: Np by 3 matrix representing points in the field, in any order
+    c: speed of sound in m/s
+    rtol: tolerance relative to the reference pitch when testing the spacing of references and points
+
+    Return:
+    ----
+    None if the geometry has no such structure, else a tuple of
+    base: flattened float32 base table of delays in s
+    index: length Np int32 vector of the base entry of each point for reference 0
+    step: offset in base between the entries of consecutive references
+    """
+
+    xrefs = _vecs3(xrefs, "xrefs")
+    if (np.ndim(points) != 2) or (np.shape(points)[1] != 3): raise ValueError("points must be P by 3")
+    points = np.asarray(points)
+    E = xrefs.shape[0]
+    if E < 2: return None
+
+    # references must be evenly spaced along x, spacings are measured over the whole span so float32 rounding does not accumulate
+    pitch = (float(xrefs[-1,0]) - float(xrefs[0,0]))/(E-1)
+    if pitch == 0: return None
+    tol = rtol * abs(pitch)
+    expected = xrefs[0].astype(float) + np.outer(np.arange(E), [pitch, 0, 0])
+    if np.any(np.abs(xrefs - expected) > tol): return None
+
+    # x coordinates of the points must lie on a lattice that divides the pitch
+    xs = points[:,0].astype(float)
+    ux = np.unique(xs)
+    dx = abs(pitch) if ux.size == 1 else float(np.min(np.diff(ux)))
+    if ux.size > 1: dx = (ux[-1] - ux[0])/np.round((ux[-1] - ux[0])/dx)
+    ratio = pitch/dx
+    r = int(np.round(ratio))
+    if (r == 0) or (abs(ratio - r) * dx > tol): return None
+    ix = np.round((xs - ux[0])/dx).astype(np.int64)
+    if np.any(np.abs(ux[0] + ix*dx - xs) > tol): return None
+
+    # every distinct (y, z) pair is one column of the base table
+    yz, iyz = np.unique(points[:,1:].astype(float), axis=0, return_inverse=True)
+    iyz = iyz.reshape(-1)
+    Nyz = yz.shape[0]
+
+    # lateral offsets ix - e*r covered by every reference and point
+    jlo = ix.min() - max(0, (E-1)*r)
+    jhi = ix.max() - min(0, (E-1)*r)
+    Nj = int(jhi - jlo + 1)
+    if Nj*Nyz >= 2**31: return None
+
+    # the full tables would take E*Np floats
+    if (Nj*Nyz + points.shape[0]) >= E*points.shape[0]: return None
+
+    # delays from reference 0 to every (lateral offset, y, z) base point
+    jx = ux[0] + (jlo + np.arange(Nj))*dx
+    basepoints = np.empty((Nj, Nyz, 3))
+    basepoints[:,:,0] = jx[:,np.newaxis]
+    basepoints[:,:,1:] = yz[np.newaxis,:,:]
+    base = c_norm_batch(xrefs[:1], basepoints.reshape(-1, 3), c).reshape(-1)
+
+    index = ((ix - jlo)*Nyz + iyz).astype(np.int32)
+    step = -r*Nyz
+
+    return base, index, step
+
+def _lineeles(eles, rtol:float=1E-4):
+    """E by 3 float32 element positions, checked to lie in order along one line so any active set is a range of indices"""
+    eles = _vecs3(eles, "eles")
+    if eles.shape[0] < 3: return eles
+    span = eles[-1].astype(float) - eles[0].astype(float)
+    length = np.linalg.norm(span)
+    if length == 0: raise ValueError("eles must lie in order along one line")
+    diff = eles.astype(float) - eles[0]
+    along = diff @ (span/length)
+    off = np.linalg.norm(diff - along[:,np.newaxis]*(span/length), axis=1)
+    if np.any(off > rtol*length) or np.any(np.diff(along) <= 0):
+        raise ValueError("eles must lie in order along one line, the aperture of a 2D array is not a range of elements")
+    return eles
+
+def _apertureaxes(fnum, fnorm, dyn:bool, focus):
+    """float32 fnumbers, unit aperture axes, and focal point of getaperture"""
+    fnums = np.array(fnum, dtype=np.float32).flatten()
+    if np.any(fnums <= 0): raise ValueError("fnum must be positive")
+    if fnorm is None: fnorm = np.tile([1, 0, 0], (fnums.size, 1))
+    naps = np.array(fnorm, dtype=np.float32).reshape(-1, 3)
+    if naps.shape[0] != fnums.size: raise ValueError("There must be one aperture axis per fnumber")
+    naps = naps / np.linalg.norm(naps, axis=1, keepdims=True)
+    if dyn:
+        focus = np.zeros(3, dtype=np.float32)
+    else:
+        if focus is None: raise ValueError("focus is required when dyn is False")
+        focus = _vec3(focus, "focus")
+    return fnums, naps, focus
+
+@staged('getaperture')
+@kernel('getaperture')
+def getaperture(eles, points, fnum, fnorm=None, dyn:bool=True, focus=None, out=None):
+    """Calculate the active receive aperture of every point as a range of element indices
+
+    Element e is active for a point if 2*|dot(fnorm, point - ele)| <= depth/fnum along every aperture axis. 
+    Ranges take 8 bytes per point however many elements there are. The elements must lie in order along one line,
+    so that the active elements of every axis, and of several axes together, form one range. 2D arrays, whose 
+    apertures are not ranges, are rejected.
+
+    Parameters:
+    ----
+    eles: E by 3 matrix of element positions, in order along a line
+    points: P by 3 matrix of points, read in place if float32
+    fnum: fnumber, or a list of fnumbers with one per aperture axis
+    fnorm: aperture axis, or A by 3 matrix of axes with one per fnumber. Defaults to the x axis
+    dyn: if True (default) the aperture grows with the depth of each point, otherwise it is fixed by the focus
+    focus: vector of length 3, the focal point used when dyn is False
+    out: optional (lo, hi) pair of caller-owned int32 vectors of length P to write into
+
+    Returns:
+    ----
+    lo: length P int32 vector of the first active element of each point
+    hi: length P int32 vector of one past the last active element, equal to lo if no element is active
     """
 
-    cNp = ct.c_int(Np)
-    cc = ct.c_float(c)
+    eles = _lineeles(eles)
+    points, Np, sp, sd = _pointview(points)
+    fnums, naps, focus = _apertureaxes(fnum, fnorm, dyn, focus)
 
-    ptaus = __trig__.rxengine(cNp, cc, ct.byref(xref), ct.byref(points))
+    lo, hi = (None, None) if out is None else out
+    lo = outbuf(lo, Np, np.int32)
+    hi = outbuf(hi, Np, np.int32)
+    __trig__.genaperture(
+        ct.c_int(eles.shape[0]), fptr(eles), ct.c_int(fnums.size), fptr(fnums), fptr(naps), ct.c_int(int(dyn)), fptr(focus),
+        ct.c_int(Np), fptr(points), sp, sd, iptr(lo), iptr(hi)
+    )
 
-    return ptaus
- 
+    return lo, hi
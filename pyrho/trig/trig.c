@@ -1,25 +1,50 @@
 #include "trig.h"
 
+// number of threads requested for the kernels of this library, 0 defers to the OpenMP default (OMP_NUM_THREADS)
+static int trigthreads = 0;
+
+/**
+ * setTrigThreads: set the number of threads used by the delay kernels
+ * n: the number of threads, 0 or less to use the OpenMP default
+ */
+void setTrigThreads(int n) {
+    trigthreads = (n > 0) ? n : 0;
+}
+
+/**
+ * getTrigThreads: the number of threads the delay kernels will use
+ */
+int getTrigThreads(void) {
+#ifdef _OPENMP
+    return (trigthreads > 0) ? trigthreads : omp_get_max_threads();
+#else
+    return 1;
+#endif
+}
+
 /**
  * rxengine
  * Calculate the temporal distance from reference point to each point in the field
  * N: number of points in field
  * c: speed of sound [m/s]
  * ref: (x, y, z) coordinate of reference point [m] (3)
- * points: pointer to a matrix of points (N by 3)
+ * points: pointer to the first coordinate of a strided matrix of points (N by 3)
+ * sp, sd: the strides, in floats, between points and between coordinates
+ * tau: vector of length N to write the delays into
  */
-float * rxengine(int N, float c, float ** pref, float *** ppoints) {
+void rxengine(int N, float c, const float * ref, const float * points, ptrdiff_t sp, ptrdiff_t sd, float * tau) {
     // define the output array of tau
     float xdiff, ydiff, zdiff;
-    float * tau = (float *) malloc(sizeof(float) * N);
-    float * ref = *pref;
-    float ** points = *ppoints;
+    const float * point;
+    int nthreads = getTrigThreads();
 
     // iterate through each point
+    #pragma omp parallel for num_threads(nthreads) private(point, xdiff, ydiff, zdiff) schedule(static)
     for(int i = 0; i < N; ++i) {
-        xdiff = points[i][0] - ref[0];
-        ydiff = points[i][1] - ref[1];
-        zdiff = points[i][2] - ref[2];
+        point = points + i*sp;
+        xdiff = point[0] - ref[0];
+        ydiff = point[sd] - ref[1];
+        zdiff = point[2*sd] - ref[2];
 
         tau[i] = sqrtf(xdiff*xdiff + ydiff*ydiff + zdiff*zdiff)/c;
 
@@ -27,8 +52,6 @@ float * rxengine(int N, float c, float ** pref, float *** ppoints) {
             printf("%05d: norm(%0.03e, %0.03e, %0.03e)/c = %0.03e us\n", i, xdiff, ydiff, zdiff, 1e6f*tau[i]);
         }
     }
-
-    return tau;
 }
 
 /**
@@ -39,20 +62,22 @@ float * rxengine(int N, float c, float ** pref, float *** ppoints) {
  * tref: delay tab of reference element
  * ref: (x, y, z) coordinate of reference point [m]
  * norm: (x, y, z) normal vector
- * xfield, nx, yfield, ny, zfield, nz: pointers to length N arrays of (x, y, z) coordinates in field
+ * points: pointer to the first coordinate of a strided matrix of points (N by 3)
+ * sp, sd: the strides, in floats, between points and between coordinates
+ * tau: vector of length N to write the delays into
  */
-float * pwtxengine(int N, float c, float tref, float ** pref, float ** pnorm, float *** ppoints) {
+void pwtxengine(int N, float c, float tref, const float * ref, const float * norm, const float * points, ptrdiff_t sp, ptrdiff_t sd, float * tau) {
     // iterate through each point
     float xdiff, ydiff, zdiff;
-    float * tau = (float *) malloc(sizeof(float) * N);
-    float * ref = *pref;
-    float * norm = *pnorm;
-    float ** points = *ppoints;
+    const float * point;
+    int nthreads = getTrigThreads();
 
+    #pragma omp parallel for num_threads(nthreads) private(point, xdiff, ydiff, zdiff) schedule(static)
     for(int i = 0; i < N; ++i) {
-        xdiff = norm[0] * (points[i][0] - ref[0]);
-        ydiff = norm[1] * (points[i][1] - ref[1]);
-        zdiff = norm[2] * (points[i][2] - ref[2]);
+        point = points + i*sp;
+        xdiff = norm[0] * (point[0] - ref[0]);
+        ydiff = norm[1] * (point[sd] - ref[1]);
+        zdiff = norm[2] * (point[2*sd] - ref[2]);
 
         tau[i] = (xdiff + ydiff + zdiff)/c + tref;
 
@@ -60,8 +85,6 @@ float * pwtxengine(int N, float c, float tref, float ** pref, float ** pnorm, fl
             printf("%05d: dot(%0.03e, %0.03e, %0.03e)/c = %0.03e us\n", i, xdiff, ydiff, zdiff, 1e6f*tau[i]);
         }
     }
-
-    return tau;
 }
 
 /**
@@ -69,40 +92,162 @@ float * pwtxengine(int N, float c, float tref, float ** pref, float ** pnorm, fl
  * 
  * Parameters:
  * N: number of points
- * fnum: the fnumber along the aperture axis defined by the vector in pnap
+ * fnum: the fnumber along the aperture axis defined by the vector in nap
  * dyn: whether to use dynamic focussing along the aperture axis
- * pnap: pointer to vector representing the axis of the aperture defined by fnum and dyn
- * pfocus: pointer to vector of length 3 representing the focal point
- * pref: pointer to vector of length 3 representing the reference point
- * ppoints: pointer to N by 3 matrix storing all points
+ * nap: vector representing the axis of the aperture defined by fnum and dyn
+ * focus: vector of length 3 representing the focal point
+ * ref: vector of length 3 representing the reference point
+ * points: pointer to the first coordinate of a strided matrix of points (N by 3)
+ * sp, sd: the strides, in floats, between points and between coordinates
+ * mask: vector of length N to write the mask into
  */
-int * genmask3D(int N, float fnum, int dyn, float ** pnap, float ** pfocus, float ** pref, float *** ppoints) {
+void genmask3D(int N, float fnum, int dyn, const float * nap, const float * focus, const float * ref, const float * points, ptrdiff_t sp, ptrdiff_t sd, int * mask) {
     float r;
     int in;
+    const float * point;
+    int nthreads = getTrigThreads();
 
-    // dereference all vectors
-    float * focus = *pfocus;
-    float * ref = *pref;
-    float * nap = *pnap;
-    float ** points = *ppoints;
-
-    int * mask = (int *) malloc(sizeof(int) * N);
-
+    #pragma omp parallel for num_threads(nthreads) private(point, r, in) schedule(static)
     for (int i = 0; i < N; ++i) {
+        point = points + i*sp;
+
         // calculate radius from center line
-        r = nap[0] * (points[i][0] - ref[0]) + nap[1] * (points[i][1] - ref[1]) + nap[2] * (points[i][2] - ref[2]);
+        r = nap[0] * (point[0] - ref[0]) + nap[1] * (point[sd] - ref[1]) + nap[2] * (point[2*sd] - ref[2]);
         if (r < 0.0f) {r = -r;}
 
         // determine if within major axis
         in = 0;
         if(0 != dyn) {
-            if (2.0f*r <= (points[i][2] - ref[2])/fnum) {in=1;}
+            if (2.0f*r <= (point[2*sd] - ref[2])/fnum) {in=1;}
         } else {
             if (2.0f*r <= (focus[2] - ref[2])/fnum) {in=1;}
         }
 
         mask[i] = in;
     }
+}
 
-    return mask;
+/**
+ * rxbatch
+ * Calculate the temporal distance from each of E reference points to each point in the field in one call
+ * E: number of reference points
+ * refs: E by 3 C-contiguous matrix of (x, y, z) coordinates of the reference points [m]
+ * N: number of points in field
+ * c: speed of sound [m/s]
+ * points: pointer to the first coordinate of a strided matrix of points (N by 3)
+ * sp, sd: the strides, in floats, between points and between coordinates
+ * tau: E by N C-contiguous matrix to write the delays into
+ */
+void rxbatch(int E, const float * refs, int N, float c, const float * points, ptrdiff_t sp, ptrdiff_t sd, float * tau) {
+    float xdiff, ydiff, zdiff;
+    const float * point;
+    const float * ref;
+    int e, i;
+    int nthreads = getTrigThreads();
+
+    #pragma omp parallel for collapse(2) num_threads(nthreads) private(point, ref, xdiff, ydiff, zdiff) schedule(static)
+    for (e = 0; e < E; ++e) {
+        for (i = 0; i < N; ++i) {
+            ref = refs + 3*e;
+            point = points + i*sp;
+            xdiff = point[0] - ref[0];
+            ydiff = point[sd] - ref[1];
+            zdiff = point[2*sd] - ref[2];
+
+            tau[(ptrdiff_t) e*N + i] = sqrtf(xdiff*xdiff + ydiff*ydiff + zdiff*zdiff)/c;
+        }
+    }
+}
+
+/**
+ * pwtxbatch
+ * Calculate the plane wave arrival time of each of E transmissions at each point in the field in one call
+ * E: number of transmissions
+ * refs: E by 3 C-contiguous matrix of (x, y, z) coordinates of the reference points [m]
+ * norms: E by 3 C-contiguous matrix of (x, y, z) normal vectors
+ * trefs: length E vector of delay tabs of the reference points [s]
+ * N: number of points in field
+ * c: speed of sound [m/s]
+ * points: pointer to the first coordinate of a strided matrix of points (N by 3)
+ * sp, sd: the strides, in floats, between points and between coordinates
+ * tau: E by N C-contiguous matrix to write the delays into
+ */
+void pwtxbatch(int E, const float * refs, const float * norms, const float * trefs, int N, float c, const float * points, ptrdiff_t sp, ptrdiff_t sd, float * tau) {
+    float xdiff, ydiff, zdiff;
+    const float * point;
+    const float * ref;
+    const float * norm;
+    int e, i;
+    int nthreads = getTrigThreads();
+
+    #pragma omp parallel for collapse(2) num_threads(nthreads) private(point, ref, norm, xdiff, ydiff, zdiff) schedule(static)
+    for (e = 0; e < E; ++e) {
+        for (i = 0; i < N; ++i) {
+            ref = refs + 3*e;
+            norm = norms + 3*e;
+            point = points + i*sp;
+            xdiff = norm[0] * (point[0] - ref[0]);
+            ydiff = norm[1] * (point[sd] - ref[1]);
+            zdiff = norm[2] * (point[2*sd] - ref[2]);
+
+            tau[(ptrdiff_t) e*N + i] = (xdiff + ydiff + zdiff)/c + trefs[e];
+        }
+    }
+}
+
+/**
+ * genaperture: active receive aperture of each point as a compact range of element indices
+ * 
+ * Element e is active for a point if, along every aperture axis a, 2*|dot(nap_a, point - ref_e)| <= depth/fnum_a,
+ * where depth is the axial distance from the element to the point (dyn != 0) or to the focus (dyn == 0).
+ * The range spans the first through the last active element, which is exact for linear arrays.
+ * 
+ * Parameters:
+ * E: number of elements
+ * refs: E by 3 C-contiguous matrix of element positions [m]
+ * A: number of aperture axes
+ * fnums: length A vector of fnumbers
+ * naps: A by 3 C-contiguous matrix of aperture axes
+ * dyn: whether to use dynamic focussing along the aperture axes
+ * focus: vector of length 3 representing the focal point, only read if dyn == 0
+ * N: number of points
+ * points: pointer to the first coordinate of a strided matrix of points (N by 3)
+ * sp, sd: the strides, in floats, between points and between coordinates
+ * lo, hi: length N vectors to write the first and one past the last active element into, lo == hi if none are active
+ */
+void genaperture(int E, const float * refs, int A, const float * fnums, const float * naps, int dyn, const float * focus,
+                 int N, const float * points, ptrdiff_t sp, ptrdiff_t sd, int * lo, int * hi) {
+    const float * point;
+    const float * ref;
+    const float * nap;
+    float r, depth;
+    int e, a, in;
+    int nthreads = getTrigThreads();
+
+    #pragma omp parallel for num_threads(nthreads) private(point, ref, nap, r, depth, e, a, in) schedule(static)
+    for (int i = 0; i < N; ++i) {
+        point = points + i*sp;
+        lo[i] = E;
+        hi[i] = 0;
+
+        for (e = 0; e < E; ++e) {
+            ref = refs + 3*e;
+            depth = (0 != dyn) ? point[2*sd] - ref[2] : focus[2] - ref[2];
+
+            in = 1;
+            for (a = 0; (a < A) && in; ++a) {
+                nap = naps + 3*a;
+                r = nap[0] * (point[0] - ref[0]) + nap[1] * (point[sd] - ref[1]) + nap[2] * (point[2*sd] - ref[2]);
+                if (r < 0.0f) {r = -r;}
+                if (2.0f*r > depth/fnums[a]) {in = 0;}
+            }
+
+            if (in) {
+                if (e < lo[i]) {lo[i] = e;}
+                hi[i] = e + 1;
+            }
+        }
+
+        if (hi[i] == 0) {lo[i] = 0;}
+    }
 }
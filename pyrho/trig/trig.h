@@ -2,14 +2,25 @@
 #define ___pyusel_pyrho_trig___
 #include <stdlib.h>
 #include <stdio.h>
+#include <stddef.h>
 #include <math.h>
 
-extern float * rxengine(int N, float c, float ** pref, float *** ppoints);
-extern float * pwtxengine(int N, float c, float tref, float ** pref, float ** pnorm, float *** ppoints);
-extern int * genmask3D(int N, float fnum, int dyn, float ** pnap, float ** pfocus, float ** pref, float *** ppoints);
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+extern void setTrigThreads(int n);
+extern int getTrigThreads(void);
+extern void rxengine(int N, float c, const float * ref, const float * points, ptrdiff_t sp, ptrdiff_t sd, float * tau);
+extern void pwtxengine(int N, float c, float tref, const float * ref, const float * norm, const float * points, ptrdiff_t sp, ptrdiff_t sd, float * tau);
+extern void rxbatch(int E, const float * refs, int N, float c, const float * points, ptrdiff_t sp, ptrdiff_t sd, float * tau);
+extern void pwtxbatch(int E, const float * refs, const float * norms, const float * trefs, int N, float c, const float * points, ptrdiff_t sp, ptrdiff_t sd, float * tau);
+extern void genaperture(int E, const float * refs, int A, const float * fnums, const float * naps, int dyn, const float * focus,
+                        int N, const float * points, ptrdiff_t sp, ptrdiff_t sd, int * lo, int * hi);
+extern void genmask3D(int N, float fnum, int dyn, const float * nap, const float * focus, const float * ref, const float * points, ptrdiff_t sp, ptrdiff_t sd, int * mask);
 
 #endif
 
 #ifndef PYUSEL_TRIG_DEBUG
 #define PYUSEL_TRIG_DEBUG 0
-#endif
\ No newline at end of file
+#endif
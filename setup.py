@@ -1,11 +1,21 @@
 from setuptools import Extension, setup
+import platform
+
+# OpenMP flags for the kernels, Apple clang ships without OpenMP so the kernels build single-threaded there
+if platform.system() == "Windows":
+    openmp = dict(extra_compile_args=["/openmp"])
+elif platform.system() == "Darwin":
+    openmp = dict()
+else:
+    openmp = dict(extra_compile_args=["-fopenmp"], extra_link_args=["-fopenmp"])
 
 # Compile the C extension and put it in the "rho" folder
 rho = Extension(
     name="pyrho.rho.__rho__",
     include_dirs=["pyrho/rho"],
     depends=["pyrho/rho/rho.h"],
-    sources=["pyrho/rho/rho.c"]
+    sources=["pyrho/rho/rho.c", "pyrho/rho/slsc.c", "pyrho/rho/delays.c", "pyrho/rho/iq.c", "pyrho/rho/interp.c"],
+    **openmp
 )
 
 # Compile the C extension and put it in the "rho" folder
@@ -13,7 +23,8 @@ trig = Extension(
     name="pyrho.trig.__trig__",
     include_dirs=["pyrho/trig"],
     depends=["pyrho/trig/trig.h"],
-    sources=["pyrho/trig/trig.c"]
+    sources=["pyrho/trig/trig.c"],
+    **openmp
 )
 
 # run setup tools
@@ -39,8 +50,6 @@ setup(
     },
     install_requires = [
         "numpy",
-        "pyusel-cinpy @ https://github.com/wewightman/pyusel-cinpy/archive/main.tar.gz",
-        "pyusel-interp @ https://github.com/wewightman/pyusel-interp/archive/main.tar.gz",
     ],
     license="MIT",
     ext_modules=[rho, trig],
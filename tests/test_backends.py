@@ -0,0 +1,306 @@
+"""Parity of the C kernels and the NumPy backend, and of both against naive references"""
+import numpy as np
+import pytest
+
+import pyrho
+
+FS = 20E6
+
+BACKENDS = [pytest.param(name, marks=pytest.mark.skipif(name not in pyrho.available_backends(), reason=f"{name} backend unavailable"))
+            for name in ('c', 'numpy')]
+
+def both(fn, *args, **kwargs):
+    """the result of fn under the C and the NumPy backend"""
+    if 'c' not in pyrho.available_backends(): pytest.skip("c backend unavailable")
+    with pyrho.use_backend('c'): c = fn(*args, **kwargs)
+    with pyrho.use_backend('numpy'): n = fn(*args, **kwargs)
+    return c, n
+
+def channels(nele:int=16, nsamp:int=200, seed:int=0):
+    """nsamp by nele channels with some correlation between neighbours"""
+    rng = np.random.default_rng(seed)
+    x = rng.standard_normal((nsamp, nele+2))
+    return (x[:, :-2] + 0.8*x[:, 1:-1] + 0.5*x[:, 2:]).astype(np.float32)
+
+def pairrho(a, b):
+    """normalized correlation of two channels about their means"""
+    return np.corrcoef(a.astype(np.float64), b.astype(np.float64))[0, 1]
+
+def naiveRofM(x, lags):
+    """coherence of each lag of nsamp by nele channels averaged over every pair"""
+    M = x.shape[1]
+    return np.array([np.mean([pairrho(x[:,m], x[:,m+lag]) for m in range(M-lag)]) for lag in lags])
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_lagNRho_matches_pairs(backend):
+    x = channels()
+    with pyrho.use_backend(backend):
+        for lag in (0, 1, 5):
+            assert pyrho.lagNRho(x, lag) == pytest.approx(naiveRofM(x, [lag])[0], abs=1E-5)
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('method', ['fft', 'direct'])
+def test_RofM_matches_pairs(backend, method):
+    x = channels()
+    lags = np.arange(x.shape[1]-1)
+    with pyrho.use_backend(backend):
+        rhos = pyrho.RofM(x, lags=lags, method=method)
+    np.testing.assert_allclose(rhos, naiveRofM(x, lags), atol=1E-5)
+
+@pytest.mark.parametrize('method', ['fft', 'direct'])
+def test_RofM_backends_agree(method):
+    x = channels(nele=24)
+    c, n = both(pyrho.RofM, x, method=method)
+    np.testing.assert_allclose(c, n, atol=1E-5)
+    c, n = both(pyrho.lagNRho, x, 3, accumulators=True)
+    assert c[0] == pytest.approx(n[0], abs=1E-5)
+    for key in ('cross', 'self'): np.testing.assert_allclose(c[1][key], n[1][key], rtol=1E-4)
+
+def delayedcube(data, tx, rx, fs:float, tstart:float, nkernel:int):
+    """P by Nrx by nkernel cube of the transmits delayed, linearly interpolated, and summed onto each point"""
+    Ntx, Nrx, Ns = data.shape
+    P = tx.shape[1]
+    cube = np.zeros((P, Nrx, nkernel))
+    for p in range(P):
+        for t in range(Ntx):
+            for m in range(Nrx):
+                tau = (float(tx[t,p]) + float(rx[m,p]) - tstart) * fs
+                i0 = int(np.floor(tau))
+                for k in range(nkernel):
+                    i, frac = i0 - nkernel//2 + k, tau - i0
+                    lo = data[t,m,i] if 0 <= i < Ns else 0
+                    hi = data[t,m,i+1] if 0 <= i+1 < Ns else 0
+                    cube[p,m,k] += (1 - frac)*lo + frac*hi
+    return cube.astype(np.float32)
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_slscFused_matches_delayed_cube(backend):
+    rng = np.random.default_rng(1)
+    fs, tstart, nkernel, lags = 20E6, 1E-6, 5, 4
+    data = rng.standard_normal((2, 12, 300)).astype(np.float32)
+    tx = rng.uniform(2E-6, 5E-6, (2, 40)).astype(np.float32)
+    rx = rng.uniform(1E-6, 6E-6, (12, 40)).astype(np.float32)
+    # a few points whose kernels run off either end of the traces
+    tx[:, :2] = 0
+    rx[:, 0], rx[:, 1] = tstart, 1.49E-5
+    cube = delayedcube(data, tx, rx, fs, tstart, nkernel)
+    with pyrho.use_backend(backend):
+        fused = pyrho.slscFused(data, tx, rx, fs, tstart, nkernel, lags)
+        points = pyrho.slscPoints(cube, lags)
+    np.testing.assert_allclose(fused, points, atol=1E-4)
+
+def naivemetrics(chans, lags, m0:int):
+    """per-lag coherence, spatial spectrum of frequencies 0 through m0 with both signs counted, and energy of one 
+    point's M by K active channels"""
+    M = chans.shape[0]
+    rhos = [np.mean([pairrho(chans[m], chans[m+lag]) for m in range(M-lag)]) if lag < M else 0 for lag in lags]
+    power = np.sum(np.abs(np.fft.fft(chans.astype(np.float64), axis=0))**2, axis=1)
+    spectrum = [power[q] + (power[M-q] if 0 < q < M-q else 0) if 2*q <= M else 0 for q in range(m0+1)]
+    return np.array(rhos), np.array(spectrum), np.sum(chans.astype(np.float64)**2)
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_coherencemetrics_match_delayed_cube(backend):
+    rng = np.random.default_rng(9)
+    fs, tstart, nkernel, lags, m0 = 20E6, 1E-6, 5, [1, 2, 3], 2
+    data = rng.standard_normal((2, 12, 300)).astype(np.float32)
+    data[:, 4:9] += data[:, 6:7]
+    tx = rng.uniform(2E-6, 5E-6, (2, 30)).astype(np.float32)
+    rx = rng.uniform(1E-6, 6E-6, (12, 30)).astype(np.float32)
+    lo = rng.integers(0, 5, 30).astype(np.int32)
+    hi = np.minimum(lo + rng.integers(2, 10, 30), 12).astype(np.int32)
+    cube = delayedcube(data, tx, rx, fs, tstart, nkernel)
+    with pyrho.use_backend(backend):
+        sums = pyrho.slscSums(data, tx, rx, fs, tstart, nkernel, lags, aperture=(lo, hi), m0=m0)
+        weights = np.array([0.5, 1.0, 2.0])
+        images = pyrho.coherencemetrics(sums, m0=m0, weights=weights)
+        gcf1 = pyrho.coherencemetrics(sums, 'gcf', m0=1)['gcf']
+
+    naive = [naivemetrics(cube[p, lo[p]:hi[p]], lags, m0) for p in range(30)]
+    rhos = np.array([r for r, _, _ in naive])
+    spectrum = np.array([s for _, s, _ in naive])
+    total = (hi - lo) * np.array([e for _, _, e in naive])
+    np.testing.assert_array_equal(sums['nchan'], hi - lo)
+    np.testing.assert_allclose(sums['rhos'], rhos, atol=1E-4)
+    np.testing.assert_allclose(sums['spectrum'], spectrum, rtol=1E-4, atol=1E-3)
+    np.testing.assert_allclose(images['slsc'], np.sum(rhos, axis=1), atol=1E-4)
+    np.testing.assert_allclose(images['cf'], spectrum[:,0] / total, rtol=1E-4)
+    np.testing.assert_allclose(images['gcf'], np.sum(spectrum, axis=1) / total, rtol=1E-4)
+    np.testing.assert_allclose(gcf1, np.sum(spectrum[:,:2], axis=1) / total, rtol=1E-4)
+    np.testing.assert_allclose(images['lwslsc'], rhos @ weights, atol=1E-4)
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_images_slsc_matches_the_processor(backend):
+    from pyrho.processors import SLSCProc, PWTX, FullRX
+    data, _, _, eles, points = planewaves()
+    proc = SLSCProc(1540, points, PWTX(np.array([-0.1, 0.0, 0.1]), np.zeros((3, 3)), np.zeros(3)), FullRX(eles, grid=False),
+                    lags=3, fnum=1.0, apod='hann', compound='after')
+    with pyrho.use_backend(backend):
+        images = proc.images(data, FS, metrics=('slsc', 'cf', 'gcf', 'lwslsc'), m0=1)
+        slsc = proc(data, FS)
+    np.testing.assert_allclose(images['slsc'], slsc, atol=1E-6)
+    assert np.all((images['cf'] >= 0) & (images['cf'] <= images['gcf'] + 1E-6)) and np.all(images['gcf'] <= 1 + 1E-6)
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('method', ['fft', 'direct'])
+def test_RofM2D_matches_pairs(backend, method):
+    Mx, My = 4, 5
+    x = channels(nele=Mx*My, seed=2)
+    with pyrho.use_backend(backend):
+        rmap = pyrho.RofM2D(x, (Mx, My), method=method)
+    for dx in range(-(Mx-1), Mx):
+        for dy in range(-(My-1), My):
+            pairs = [pairrho(x[:, ix*My + iy], x[:, (ix+dx)*My + iy+dy])
+                     for ix in range(Mx) for iy in range(My) if (0 <= ix+dx < Mx) and (0 <= iy+dy < My)]
+            assert rmap[dx+Mx-1, dy+My-1] == pytest.approx(np.mean(pairs), abs=1E-5)
+
+def test_RofM2D_backends_agree():
+    x = channels(nele=6*6, seed=3)
+    for method in ('fft', 'direct'):
+        c, n = both(pyrho.RofM2D, x, (6, 6), radial=True, method=method)
+        np.testing.assert_allclose(c, n, atol=1E-5)
+
+def test_demodIQ_backends_agree():
+    rng = np.random.default_rng(4)
+    fs, fc = 20E6, 5E6
+    rf = rng.standard_normal((3, 8, 400)).astype(np.float32)
+    for decim in (1, 2, 4):
+        c, n = both(pyrho.demodIQ, rf, fs, fc, decim, 1E-6)
+        assert c.shape == n.shape == (3, 8, -(-400 // decim))
+        np.testing.assert_allclose(c, n, atol=1E-4)
+
+def planewaves(nele:int=16, npts:int=300, seed:int=5):
+    """RF of a linear array, 3 plane wave delay models, spherical receive delays, and random points in an x-z plane"""
+    rng = np.random.default_rng(seed)
+    eles = np.zeros((nele, 3))
+    eles[:,0] = 3E-4*(np.arange(nele) - (nele-1)/2)
+    points = np.zeros((npts, 3))
+    points[:,0] = rng.uniform(-2E-3, 2E-3, npts)
+    points[:,2] = rng.uniform(5E-3, 12E-3, npts)
+    norms = [[np.sin(a), 0, np.cos(a)] for a in (-0.1, 0.0, 0.1)]
+    tx = pyrho.planedelays(np.zeros((3, 3)), norms, np.zeros(3))
+    rx = pyrho.sphericaldelays(eles)
+    data = rng.standard_normal((3, nele, 400)).astype(np.float32)
+    return data, tx, rx, eles, points.astype(np.float32)
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('tiling', ['morton', 'depth'])
+def test_point_order_leaves_results_unchanged(backend, tiling):
+    from pyrho.processors import tileorder
+    data, tx, rx, eles, points = planewaves()
+    aperture = pyrho.getaperture(eles, points, 1.0)
+    order = tileorder(points, tiling, 16)
+    with pyrho.use_backend(backend):
+        plain = pyrho.slscFused(data, tx, rx, 20E6, 0, 5, 3, points, aperture)
+        tiled = pyrho.slscFused(data, tx, rx, 20E6, 0, 5, 3, points, aperture, order=order, tile=16)
+        sums = pyrho.slscSums(data, tx, rx, 20E6, 0, 5, 3, points, aperture, m0=2)
+        tsums = pyrho.slscSums(data, tx, rx, 20E6, 0, 5, 3, points, aperture, m0=2, order=order, tile=16)
+    np.testing.assert_array_equal(plain, tiled)
+    for key in ('slsc', 'rhos', 'spectrum', 'energy', 'nchan'): np.testing.assert_array_equal(sums[key], tsums[key])
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_point_order_must_be_a_permutation(backend):
+    data, tx, rx, eles, points = planewaves(npts=3)
+    with pyrho.use_backend(backend):
+        with pytest.raises(ValueError, match="permutation"):
+            pyrho.slscFused(data, tx, rx, 20E6, 0, 5, 3, points, order=[0, 0, 0])
+        with pytest.raises(ValueError, match="permutation"):
+            pyrho.slscSums(data, tx, rx, 20E6, 0, 5, 3, points, order=[2, 1, 1])
+
+KINDS = ['nearest', 'linear', 'cubic', 'sinc']
+
+def sampledelays(taus, fs:float):
+    """1 by 1 by P transmit and receive delay tables whose sum falls on the fractional samples taus"""
+    taus = np.asarray(taus, dtype=np.float64)
+    return (taus/fs/2).astype(np.float32)[np.newaxis, :], (taus/fs/2).astype(np.float32)[np.newaxis, :]
+
+def padded(trace, i):
+    """samples i of a trace, 0 outside of it"""
+    i = np.asarray(i)
+    return np.where((i >= 0) & (i < trace.size), trace[np.clip(i, 0, trace.size-1)], 0)
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_interpgather_matches_naive_nearest_and_linear(backend):
+    rng = np.random.default_rng(6)
+    Ns = 64
+    trace = rng.standard_normal(Ns).astype(np.float32)
+    taus = np.concatenate([rng.uniform(0, Ns-1, 200), [-30.0, -0.75, -0.25, Ns-1.25, Ns-0.5, Ns+30.0]])
+    tx, rx = sampledelays(taus, FS)
+    tau = (tx[0].astype(np.float32) + rx[0]) * np.float32(FS)
+    with pyrho.use_backend(backend):
+        near = pyrho.interpgather(trace[np.newaxis, np.newaxis], pyrho.interptable(tx, rx, Ns, FS, kind='nearest'))[0, 0]
+        lin = pyrho.interpgather(trace[np.newaxis, np.newaxis], pyrho.interptable(tx, rx, Ns, FS, kind='linear'))[0, 0]
+    inside = (tau >= 0) & (tau <= Ns-1)
+    np.testing.assert_allclose(lin[inside], np.interp(tau[inside], np.arange(Ns), trace), atol=1E-5)
+    i0 = np.floor(tau).astype(int)
+    frac = tau - i0
+    np.testing.assert_allclose(lin, (1 - frac)*padded(trace, i0) + frac*padded(trace, i0+1), atol=1E-5)
+    np.testing.assert_allclose(near, padded(trace, np.floor(tau + 0.5).astype(int)), atol=0)
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('kind', KINDS)
+def test_interptable_weights_sum_to_one_inside_and_vanish_outside(backend, kind):
+    Ns, W = 64, pyrho.interpwidth(kind)
+    inner = np.linspace(W, Ns-1-W, 101)
+    tx, rx = sampledelays(np.concatenate([inner, [-40.0, Ns+40.0]]), FS)
+    with pyrho.use_backend(backend):
+        table = pyrho.interptable(tx, rx, Ns, FS, kind=kind)
+    assert table.weights.shape == (1, 1, inner.size+2, W)
+    np.testing.assert_allclose(np.sum(table.weights[0, 0, :-2], axis=-1), 1, atol=1E-5)
+    # kernels that miss the trace entirely are clamped onto its ends with every weight zero
+    assert list(table.index[0, 0, -2:]) == [0, Ns-W]
+    np.testing.assert_array_equal(table.weights[0, 0, -2:], 0)
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_interptable_clamps_partial_kernels_with_zero_weights(backend):
+    Ns = 64
+    # cubic kernels at these delays reach 1 sample before the start and 1 past the end of the trace
+    tx, rx = sampledelays([0.5, Ns-1.5], FS)
+    with pyrho.use_backend(backend):
+        table = pyrho.interptable(tx, rx, Ns, FS, kind='cubic')
+        full = pyrho.interptable(*sampledelays([10.5, 10.5], FS), Ns, FS, kind='cubic')
+    np.testing.assert_array_equal(table.index[0, 0], [0, Ns-4])
+    kern = full.weights[0, 0, 0]
+    np.testing.assert_allclose(table.weights[0, 0, 0], [kern[1], kern[2], kern[3], 0], atol=1E-6)
+    np.testing.assert_allclose(table.weights[0, 0, 1], [0, kern[0], kern[1], kern[2]], atol=1E-6)
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('kind', KINDS)
+def test_interptable_half_weights_round_the_float32_table(backend, kind):
+    rng = np.random.default_rng(7)
+    tx = rng.uniform(0, 4E-6, (2, 300)).astype(np.float32)
+    rx = rng.uniform(0, 4E-6, (5, 300)).astype(np.float32)
+    with pyrho.use_backend(backend):
+        full = pyrho.interptable(tx, rx, 200, FS, kind=kind)
+        half = pyrho.interptable(tx, rx, 200, FS, kind=kind, dtype=np.float16)
+    assert half.weights.dtype == np.float16
+    np.testing.assert_array_equal(half.index, full.index)
+    np.testing.assert_array_equal(half.weights.view(np.uint16), full.weights.astype(np.float16).view(np.uint16))
+
+@pytest.mark.parametrize('kind', KINDS)
+def test_interptable_backends_agree(kind):
+    rng = np.random.default_rng(8)
+    tx = rng.uniform(0, 4E-6, (2, 300)).astype(np.float32)
+    rx = rng.uniform(0, 4E-6, (5, 300)).astype(np.float32)
+    data = rng.standard_normal((2, 5, 200)).astype(np.float32)
+    c, n = both(pyrho.interptable, tx, rx, 200, FS, 1E-7, kind=kind)
+    np.testing.assert_array_equal(c.index, n.index)
+    np.testing.assert_allclose(c.weights, n.weights, atol=1E-6)
+    for compound in (False, True):
+        gc, gn = both(pyrho.interpgather, data, c, compound)
+        np.testing.assert_allclose(gc, gn, atol=1E-5)
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('nkernel', [1, 6, 9])
+def test_slscSliding_matches_clipped_windows(backend, nkernel):
+    lines = np.stack([channels(nele=10, nsamp=120, seed=seed).T for seed in range(2)])
+    lags = [1, 2, 4]
+    with pyrho.use_backend(backend):
+        image = pyrho.slscSliding(lines, nkernel, lags)
+        single = pyrho.slscSliding(lines[1], nkernel, lags)
+        N = lines.shape[2]
+        ref = np.zeros((2, N), dtype=np.float32)
+        for n in range(N):
+            lo, hi = max(n - nkernel//2, 0), min(n - nkernel//2 + nkernel, N)
+            ref[:, n] = pyrho.slscPoints(np.ascontiguousarray(lines[:, :, lo:hi]), lags)
+    np.testing.assert_allclose(image, ref, atol=2E-4)
+    np.testing.assert_array_equal(single, image[1])
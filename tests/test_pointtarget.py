@@ -0,0 +1,49 @@
+"""Point target check of the plane wave transmit and full receive delays of SLSCProc"""
+import numpy as np
+import pytest
+
+from pyrho.trig import getpwtaus
+from pyrho.processors import SLSCProc, PWTX, FullRX
+
+C = 1540
+FC = 5E6
+FS = 8*FC
+LAGS = 5
+
+def pointtarget(target, alphas, eles, nsamp:int, noise:float=1E-3, seed:int=0):
+    """Ntx by Nrx by Nsamp RF of a single scatterer insonified by plane waves through the first or last element"""
+    xrefs = np.array([eles[0] if alpha >= 0 else eles[-1] for alpha in alphas])
+    norms = np.array([np.sin(alphas), np.zeros(alphas.size), np.cos(alphas)]).T
+    t = np.arange(nsamp)/FS
+    ttx = np.sum(norms * (target - xrefs), axis=1)/C
+    trx = np.linalg.norm(target - eles, axis=1)/C
+    delay = ttx[:, np.newaxis, np.newaxis] + trx[np.newaxis, :, np.newaxis]
+    pulse = np.cos(2*np.pi*FC*(t - delay)) * np.exp(-0.5*((t - delay)*FC/0.6)**2)
+    rng = np.random.default_rng(seed)
+    return (pulse + noise*rng.standard_normal(pulse.shape)).astype(np.float32), xrefs
+
+@pytest.mark.parametrize('tabmode', ['table', 'otf'])
+def test_slsc_peaks_at_the_target_depth(tabmode):
+    eles = np.zeros((32, 3))
+    eles[:,0] = 3E-4*(np.arange(32) - 15.5)
+    alphas = np.deg2rad(np.array([-5.0, 0.0, 5.0]))
+    target = np.array([0.0, 0.0, 15E-3])
+    data, xrefs = pointtarget(target, alphas, eles, int(2*30E-3/C*FS))
+
+    depths = np.arange(8E-3, 25E-3, C/FS/2)
+    points = np.zeros((depths.size, 3))
+    points[:,2] = depths
+    proc = SLSCProc(C, points, PWTX(alphas, xrefs, np.zeros(alphas.size), c=C), FullRX(eles, c=C), lags=LAGS, 
+                    nkernel=int(FS/FC), tabmode=tabmode)
+    slsc = proc(data, FS)
+
+    # every lag is fully coherent at the scatterer, and only noise is paired away from it
+    at = np.argmin(np.abs(depths - target[2]))
+    assert slsc[at] > 0.9*LAGS
+    assert abs(depths[np.argmax(slsc)] - target[2]) < C/FC/2
+    assert np.all(slsc[np.abs(depths - target[2]) > 2E-3] < 0.3*LAGS)
+
+def test_plane_wave_delays_grow_with_depth():
+    points = np.array([[0, 0, 10E-3], [0, 0, 10.3E-3]])
+    taus = getpwtaus(np.zeros((1, 3)), points, np.zeros(1), np.zeros(1), C)
+    assert taus[0,1] - taus[0,0] == pytest.approx(0.3E-3/C, rel=1E-3)
@@ -0,0 +1,181 @@
+"""Checks of the processors against their building blocks: sweeps, pools, ensembles, datasets, and grid tables"""
+import numpy as np
+import pytest
+
+import pyrho
+from pyrho.processors import SLSCProc, PWTX, FullRX
+
+BACKENDS = [pytest.param(name, marks=pytest.mark.skipif(name not in pyrho.available_backends(), reason=f"{name} backend unavailable"))
+            for name in ('c', 'numpy')]
+
+FS = 20E6
+PITCH = 3E-4
+
+def lineararray(nele:int=16):
+    """Nele by 3 element positions of a linear array along x"""
+    eles = np.zeros((nele, 3))
+    eles[:,0] = PITCH*(np.arange(nele) - (nele-1)/2)
+    return eles
+
+def gridpoints(nx:int=9, nz:int=12, step:float=PITCH/2, z0:float=5E-3):
+    """points of a rectilinear x-z grid centered under the array"""
+    X, Z = np.meshgrid(step*(np.arange(nx) - (nx-1)/2), z0 + step*np.arange(nz), indexing='ij')
+    return np.stack([X.ravel(), np.zeros(X.size), Z.ravel()], axis=1)
+
+def planewaves(c:float=1540):
+    """PWTX of 3 angles with distinct reference delays"""
+    return PWTX(np.array([-0.1, 0.0, 0.1]), np.zeros((3, 3)), np.array([0.0, 2E-7, 4E-7]), c=c)
+
+def rfdata(nele:int=16, nsamp:int=500, seed:int=0):
+    return np.random.default_rng(seed).standard_normal((3, nele, nsamp)).astype(np.float32)
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('tabmode, grid', [('table', False), ('table', True), ('otf', False)])
+def test_sweep_matches_processors_rebuilt_per_speed(backend, tabmode, grid):
+    eles, points, data = lineararray(), gridpoints(), rfdata()
+    speeds = np.array([1450.0, 1540.0, 1620.0])
+    kwargs = dict(lags=3, fnum=1.0, tabmode=tabmode, compound=[[0, 1], [2]])
+    proc = SLSCProc(1540, points, planewaves(), FullRX(eles, grid=grid), **kwargs)
+    with pyrho.use_backend(backend):
+        stack = proc.sweep(data, FS, speeds, 1E-6)
+        for i, c in enumerate(speeds):
+            ref = SLSCProc(c, points, planewaves(c), FullRX(eles, c=c, grid=grid), **kwargs)(data, FS, 1E-6)
+            np.testing.assert_allclose(stack[i], ref, atol=5E-4)
+
+def test_sweep_reuses_its_work_buffer():
+    if 'c' not in pyrho.available_backends(): pytest.skip("c backend unavailable")
+    proc = SLSCProc(1540, gridpoints(), planewaves(), FullRX(lineararray(), grid=False), lags=1)
+    data, speeds = rfdata(), np.linspace(1450, 1620, 4)
+    with pyrho.use_backend('c'):
+        proc.sweep(data, FS, speeds)
+        with pyrho.profile() as stats:
+            proc.sweep(data, FS, speeds)
+    assert stats['kernel.slscSweep']['allocated'] == 0
+
+def shmblocks():
+    """names of the shared memory blocks currently in /dev/shm, leaving out the semaphores of multiprocessing"""
+    import os
+    if not os.path.isdir('/dev/shm'): return set()
+    return {name for name in os.listdir('/dev/shm') if not name.startswith('sem.')}
+
+def rfdataset(path, nrot:int=3, nele:int=16, nsamp:int=300, order=('rot', 'steer', 't', 'ele'), seed:int=1):
+    """InterRFDataSet of 3 steering angles over int16 samples written to path in the given storage order, and the
+    (rot, steer, ele, t) samples it holds"""
+    from pyrho.processors import InterRFDataSet
+    rng = np.random.default_rng(seed)
+    samples = rng.integers(-2000, 2000, (nrot, 3, nele, nsamp)).astype(np.int16)
+    labels = ('rot', 'steer', 'ele', 't')
+    samples.transpose(tuple(labels.index(label) for label in order)).tofile(path)
+    return InterRFDataSet(nrot, 3, nele, nsamp, 1.0, 0.1, 1/FS, 0.0, path=str(path), order=order), samples
+
+@pytest.mark.parametrize('context', [c for c in ('fork', 'spawn') if c in __import__('multiprocessing').get_all_start_methods()])
+def test_pool_matches_the_processor(tmp_path, context):
+    from pyrho.processors import SLSCPool
+    proc = SLSCProc(1540, gridpoints(), planewaves(), FullRX(lineararray(), grid=False), lags=3, fnum=1.0)
+    frames = np.stack([rfdata(seed=seed) for seed in range(4)])
+    dataset, _ = rfdataset(tmp_path / 'scan.bin', nsamp=500)
+    before = shmblocks()
+
+    pool = SLSCPool(proc, nworkers=2, context=context)
+    try:
+        images = pool.map(frames, FS)
+        scans = pool.map(dataset)
+    finally:
+        pool.close()
+
+    np.testing.assert_array_equal(images, np.stack([proc(frame, FS) for frame in frames]))
+    np.testing.assert_array_equal(scans, np.stack([slsc.copy() for _, slsc in proc.stream(dataset)]))
+    assert shmblocks() <= before
+
+def pooledrho(cross, energy, lags):
+    """coherence of each lag from summed cross and self sums, the mean over pairs of cross / sqrt(energy*energy)"""
+    M = energy.shape[-1]
+    rhos, start = [], 0
+    for lag in lags:
+        norm = np.sqrt(energy[..., :M-lag] * energy[..., lag:])
+        rhos.append(np.mean(cross[..., start:start+M-lag] / norm, axis=-1))
+        start += M - lag
+    return np.stack(rhos, axis=-1)
+
+def ensembleframes(nframes:int, shape, seed:int=2):
+    """frames whose coherence drifts from frame to frame, so the pooled frames matter"""
+    rng = np.random.default_rng(seed)
+    frames = rng.standard_normal((nframes,) + shape)
+    mix = np.linspace(0, 0.9, nframes).reshape((-1,) + (1,)*len(shape))
+    return (frames + mix*np.roll(frames, 1, axis=-2 if len(shape) == 3 else 1)).astype(np.float32)
+
+@pytest.mark.parametrize('shape', [(100, 12), (20, 12, 7)])
+def test_ensemble_window_pools_the_last_frames(shape):
+    from pyrho.processors import RhoEnsemble
+    frames = ensembleframes(8, shape)
+    sliding = RhoEnsemble(lags=3, window=3)
+    for frame in frames: sliding.push(frame)
+    fresh = RhoEnsemble(lags=3)
+    for frame in frames[-3:]: fresh.push(frame)
+    assert sliding.nframes == 8
+    np.testing.assert_allclose(sliding.rho(), fresh.rho(), atol=1E-6)
+    np.testing.assert_allclose(sliding.slsc(), fresh.slsc(), atol=1E-5)
+
+@pytest.mark.parametrize('shape', [(100, 12), (20, 12, 7)])
+def test_ensemble_forget_weights_older_frames(shape):
+    from pyrho.processors import RhoEnsemble
+    frames, forget, lags = ensembleframes(6, shape), 0.7, [1, 2, 4]
+    ensemble = RhoEnsemble(lags=lags, forget=forget)
+    for frame in frames: ensemble.push(frame)
+    sums = [pyrho.lagSums(frame, lags) for frame in frames]
+    weights = forget ** np.arange(len(frames)-1, -1, -1)
+    cross = sum(w*c for w, (c, _) in zip(weights, sums))
+    energy = sum(w*e for w, (_, e) in zip(weights, sums))
+    np.testing.assert_allclose(ensemble.rho(), pooledrho(cross, energy, lags), atol=1E-6)
+
+@pytest.mark.parametrize('order', [('rot', 'steer', 't', 'ele'), ('rot', 'steer', 'ele', 't'), ('ele', 't', 'rot', 'steer')])
+def test_dataset_maps_file_order_to_rot_steer_ele_t(tmp_path, order):
+    dataset, samples = rfdataset(tmp_path / 'scan.bin', nrot=4, nele=5, nsamp=7, order=order)
+    raw = dataset.__data__
+    assert isinstance(raw, np.memmap)
+
+    view = dataset.data()
+    assert view.shape == (4, 3, 5, 7)
+    np.testing.assert_array_equal(view, samples)
+    assert np.shares_memory(view, raw)
+    np.testing.assert_array_equal(dataset[2, 1], samples[2, 1])
+    assert np.shares_memory(dataset[2, 1], raw)
+
+    chunks = list(dataset.chunks(3))
+    assert [irot for irot, _ in chunks] == [0, 3]
+    np.testing.assert_array_equal(np.concatenate([chunk for _, chunk in chunks]), samples)
+    assert all(np.shares_memory(chunk, raw) for _, chunk in chunks)
+
+    # the raw file holds the samples in storage order, so a single sample lands at its strided offset
+    flat = np.fromfile(tmp_path / 'scan.bin', dtype=np.int16)
+    labels = ('rot', 'steer', 'ele', 't')
+    stored = samples.transpose(tuple(labels.index(label) for label in order))
+    np.testing.assert_array_equal(dataset.transform(flat), samples)
+    assert flat[np.ravel_multi_index((1, 2, 1, 2), stored.shape)] == stored[1, 2, 1, 2]
+
+@pytest.mark.parametrize('step', [PITCH/2, PITCH, PITCH/3])
+@pytest.mark.parametrize('reverse', [False, True])
+def test_grid_tables_expand_to_the_full_tables(step, reverse):
+    from pyrho.trig import c_norm_batch
+    eles = lineararray()[::-1] if reverse else lineararray()
+    points = gridpoints(nx=11, nz=8, step=step)[np.random.default_rng(3).permutation(88)]
+    rx = FullRX(eles, c=1500)
+    rx.gentabs(points)
+    assert rx.GRIDtabs is not None and rx.RXtabs is None
+    np.testing.assert_allclose(rx.fulltabs(), c_norm_batch(eles, points, 1500), rtol=1E-6)
+    assert rx.tabbytes(points) < 4 * eles.shape[0] * points.shape[0]
+
+def test_grids_off_the_element_pitch_fall_back_to_full_tables():
+    from pyrho.trig import c_norm_batch
+    eles = lineararray()
+    points = gridpoints(nx=11, nz=8, step=0.4*PITCH)
+    rx = FullRX(eles)
+    rx.gentabs(points)
+    assert rx.GRIDtabs is None
+    np.testing.assert_array_equal(rx.fulltabs(), c_norm_batch(eles, points, 1540))
+    with pytest.raises(ValueError, match="evenly spaced"):
+        FullRX(eles, grid=True).gentabs(points)
+    uneven = eles.copy()
+    uneven[3, 0] += 0.1*PITCH
+    with pytest.raises(ValueError, match="evenly spaced"):
+        FullRX(uneven, grid=True).gentabs(gridpoints())